@@ -9,19 +9,66 @@ import os
 import time
 import subprocess
 import binascii
+import codecs
 import select
 import struct
 import signal
 import math
 import sys
-from collections import namedtuple
+import argparse
+import sqlite3
+from collections import namedtuple, deque
 from struct import *
+from orientamento import FiltroComplementare, FiltroKalman
+from sensor_fusion import EspansioneSensorFusion
+from decimazione import crea_decimatore
+from salvataggio import SinkTesto, RegistroGrezzo
+from salvataggio_mat import SinkMat
+from buffer_condiviso import BufferCircolareScrittura
+from pipeline import PipelineNotifiche
+from profili import carica_profilo, percorso_predefinito
+from negoziazione import imposta_intervallo_connessione, negozia_connessione
+from statistiche import Statistiche
+from metriche import RegistroMetriche, ServerMetriche
+import profilazione
+import caratteristiche_bluest
+from archivio_memoria import crea_archivio, SUDDIVISIONI_TEMPO
+from catalogo_sessioni import Catalogo, NOME_CATALOGO
+from contenitore import Contenitore, DIMENSIONE_MASSIMA
+from audio_adpcm import DecodificatoreADPCM, ScrittoreWAV, ScrittorePCM
+from inventario_gatt import carica_inventario
 
 def preexec_function():
 	# Ignore the SIGINT signal by setting the handler to the standard
 	# signal handler SIG_IGN.
 	signal.signal(signal.SIGINT, signal.SIG_IGN)
 
+# Number of SIGCHLD signals received so far. BluepyHelper checks whether its
+# helper is still running only when this changes, instead of calling
+# waitpid() for every line read.
+_sigchldCount = 0
+_sigchldPrevious = None
+_sigchldInstalled = False
+
+def _sigchldHandler(signum, frame):
+	global _sigchldCount
+	_sigchldCount += 1
+	if callable(_sigchldPrevious):
+		_sigchldPrevious(signum, frame)
+
+def _installSigchldHandler():
+	# Signal handlers can only be installed from the main thread; elsewhere
+	# (e.g. a receive loop in a worker thread) helper exit is still detected
+	# by EOF/POLLHUP on its stdout
+	global _sigchldPrevious, _sigchldInstalled
+	if _sigchldInstalled:
+		return
+	try:
+		_sigchldPrevious = signal.signal(signal.SIGCHLD, _sigchldHandler)
+		_sigchldInstalled = True
+	except ValueError:
+		pass
+
 Debugging = False
 script_path = os.path.join(os.path.abspath(os.path.dirname(__file__)))
 helperExe = os.path.join(script_path, "bluepy-helper")
@@ -260,6 +307,173 @@ class Descriptor:
 	def write(self, val, withResponse=False):
 		self.peripheral.writeCharacteristic(self.handle, val, withResponse)
 
+#sink di ciascun flusso e decimatori per flusso (impostati ad ogni connessione)
+sink_flussi = {}
+decimatori = {}
+#sessione della connessione nel catalogo delle sessioni (None se il catalogo è disabilitato)
+sessione_catalogo = None
+#sink del registro grezzo: file "Notifiche grezze" (RegistroGrezzo) o flusso del contenitore giornaliero,
+#None se il registro è disabilitato
+sink_grezzo = None
+#pipeline con i thread di decodifica e salvataggio (None se la notifica è elaborata nel thread di ricezione)
+pipeline_notifiche = None
+#statistiche della connessione (sostituite da quelle della Peripheral ad ogni connessione) e tempo passato
+#nei sink durante la decodifica, da non contare nella decodifica quando la pipeline non è usata
+statistiche = Statistiche()
+tempo_sink_annidato = 0.0
+
+#archivi in memoria dei flussi (vedi archivio_memoria.py), creati alla prima connessione e conservati tra le
+#riconnessioni per analizzare i dati durante la ricezione
+archivi_flussi = {}
+
+#se True i flussi ricevuti dal dispositivo sono salvati con i valori interi del pacchetto così come sono, e la
+#scala di ogni colonna (caratteristiche_bluest.scale_flusso) è scritta nell'intestazione dei file; i valori
+#convertiti servono solo per la stampa e per i flussi calcolati sull'host
+valori_grezzi = False
+
+#se False le notifiche decodificate non sono stampate a console (processi di raccolta silenziosi): con i valori
+#grezzi i pacchetti sono allora salvati senza convertirli in unità fisiche
+stampa_notifiche = True
+
+#se True pitch e roll sono stimati anche sull'host (filtro complementare e di Kalman, vedi orientamento.py) ad ogni
+#pacchetto di accelerometro e giroscopio e salvati nel flusso pitch_roll_host; disabilitato perchè aggiunge
+#due filtri per pacchetto nel thread di decodifica, i dati salvati si possono rielaborare con elabora()
+stima_host = False
+
+#nomi delle colonne salvate per ciascun flusso
+colonne_flussi = {
+	"temperatura_pressione": ["timestamp", "time", "pressione", "temperatura"],
+	"accelerometro": ["timestamp", "time", "X", "Y", "Z"],
+	"giroscopio": ["timestamp", "time", "X", "Y", "Z"],
+	"magnetometro": ["timestamp", "time", "X", "Y", "Z"],
+	"sensor_fusion": ["timestamp", "time", "qi1", "qj1", "qk1", "qi2", "qj2", "qk2", "qi3", "qj3", "qk3"],
+	"quaternioni": ["timestamp", "time", "qs", "qi", "qj", "qk", "roll", "pitch", "yaw"],
+	"pitch_roll": ["timestamp", "time", "pitch", "roll"],
+	"pitch_roll_host": ["timestamp", "time", "pitch_complementare", "roll_complementare", "pitch_kalman", "roll_kalman"],
+}
+
+#parte iniziale del nome dei file di ciascun flusso
+etichette_flussi = {
+	"temperatura_pressione": "Temperatura e pressione",
+	"accelerometro": "Accelerometro",
+	"giroscopio": "Giroscopio",
+	"magnetometro": "Magnetometro",
+	"sensor_fusion": "Sensor Fusion",
+	"quaternioni": "Sensor Fusion quaternioni",
+	"pitch_roll": "Pitch e roll",
+	"pitch_roll_host": "Pitch e roll host",
+}
+
+def registra_flussi_bluest(scelte):
+	#le caratteristiche BlueST abilitate senza decodifica dedicata hanno un flusso con il loro nome,
+	#con colonne ed etichetta presi dalla tabella delle feature
+	for caratteristica in caratteristiche_bluest.AGGIUNTIVE:
+		if scelte.get(caratteristica.nome) == "s":
+			colonne_flussi.setdefault(caratteristica.nome, caratteristica.colonne)
+			etichette_flussi.setdefault(caratteristica.nome, caratteristica.etichetta)
+
+def salva_righe(nome_flusso, righe):
+	#le righe decodificate passano dall'eventuale decimatore del flusso prima di essere scritte sul file
+	decimatore = decimatori.get(nome_flusso)
+	if decimatore is not None:
+		righe = [uscita for riga in righe for uscita in decimatore.aggiungi(riga)]
+	if not righe:
+		return
+	if pipeline_notifiche is not None:
+		pipeline_notifiche.accoda_righe(nome_flusso, righe)
+	else:
+		global tempo_sink_annidato
+		span = profilazione.inizio()
+		inizio = time.perf_counter()
+		scrivi_sink(nome_flusso, righe)
+		durata = time.perf_counter() - inizio
+		if span is not None:
+			profilazione.fine("sink", span)
+		statistiche.stadio("sink", durata)
+		tempo_sink_annidato += durata
+
+def scrivi_sink(nome_flusso, righe):
+	for sink in sink_flussi.get(nome_flusso, ()):
+		sink.scrivi(righe)
+
+def salva_riga(nome_flusso, riga):
+	salva_righe(nome_flusso, [riga])
+
+def salva_grezzo(cHandle, data, time_formato_matlab):
+	#scrittura del pacchetto ricevuto così com'è (handle e byte in esadecimale)
+	if sink_grezzo is not None:
+		sink_grezzo.scrivi([(cHandle, time_formato_matlab, str(binascii.hexlify(data), 'ascii').upper())])
+
+def chiudi_flussi():
+	#scrittura delle righe rimaste nei decimatori (es. blocchi incompleti alla disconnessione) e chiusura dei sink
+	#le notifiche ancora in coda nella pipeline vengono elaborate prima della chiusura
+	global pipeline_notifiche, sessione_catalogo, sink_grezzo
+	scartati = degradati = 0
+	if pipeline_notifiche is not None:
+		pipeline_notifiche.ferma()
+		#resoconto delle notifiche e delle righe perse per sovraccarico
+		for coda, contatori in pipeline_notifiche.contatori().items():
+			for chiave, valori in contatori.items():
+				if valori["scartati"] or valori["degradati"]:
+					print("Coda di {} ({}): {} scartati, {} salvati solo nel registro grezzo".format(coda, chiave, valori["scartati"], valori["degradati"]))
+				if coda == "ricezione":
+					scartati += valori["scartati"]
+					degradati += valori["degradati"]
+				elif sessione_catalogo is not None:
+					sessione_catalogo.perdite(chiave, valori["scartati"])
+		pipeline_notifiche = None
+	chiudi_flusso_audio()
+	stampa_statistiche()
+	for nome_flusso, decimatore in list(decimatori.items()):
+		righe = decimatore.svuota()
+		decimatori.pop(nome_flusso)
+		salva_righe(nome_flusso, righe)
+	for sink in [sink for sinks in sink_flussi.values() for sink in sinks]:
+		sink.chiudi()
+	sink_flussi.clear()
+	if sink_grezzo is not None:
+		sink_grezzo.chiudi()
+		sink_grezzo = None
+	#fine della sessione nel catalogo, con i contatori finali dei flussi
+	if sessione_catalogo is not None:
+		sessione_catalogo.chiudi(scartati, degradati)
+		sessione_catalogo = None
+
+def crea_flusso_audio(nome_file, formato="wav"):
+	#decodificatore dell'audio ADPCM della connessione (nome_file senza estensione), creato da abilita_notifiche
+	#quando le caratteristiche dell'audio sono state trovate e prima di abilitarne le notifiche, così nessun
+	#pacchetto va perso e non viene creato un file vuoto se il firmware non ha l'audio
+	global flusso_audio
+	scrittore = ScrittoreWAV(nome_file + ".wav") if formato == "wav" else ScrittorePCM(nome_file + ".pcm")
+	flusso_audio = DecodificatoreADPCM([scrittore])
+	return flusso_audio
+
+def chiudi_flusso_audio():
+	#decodifica dei pacchetti audio rimasti, chiusura del file e resoconto delle perdite
+	global flusso_audio
+	if flusso_audio is None:
+		return
+	resoconto = flusso_audio.chiudi()
+	print("Audio: {durata:.1f} s, {pacchetti} pacchetti, {persi} persi in {buchi} buchi, {sincronizzazioni} sincronizzazioni, {scartati} scartati".format(**resoconto))
+	flusso_audio = None
+
+def stampa(*args, **kwargs):
+	#print() delle notifiche decodificate: con la profilazione attiva il tempo speso a stampare compare come
+	#stadio separato, altrimenti costa solo la chiamata a profilazione.inizio()
+	span = profilazione.inizio()
+	print(*args, **kwargs)
+	if span is not None:
+		profilazione.fine("stampa", span)
+
+def stampa_statistiche():
+	#resoconto della connessione: notifiche per handle e tempo medio degli stadi
+	riepilogo = statistiche.riepilogo()
+	for handle, valori in sorted(riepilogo["handle"].items()):
+		print("Handle {}: {} notifiche in {} lotti (al massimo {}), {} byte, frequenza di picco {:.1f} Hz, {} persi in {} buchi".format(handle,
+			valori["conteggio"], valori["lotti"], valori["massimo_lotto"], valori["byte"], valori["picco"], valori["persi"], valori["buchi"]))
+	for nome, valori in sorted(riepilogo["stadi"].items()):
+		print("Stadio {}: {:.1f} us in media, {:.1f} us al massimo".format(nome, valori["medio"] * 1e6, valori["massimo"] * 1e6))
+
 class DefaultDelegate:
 	def __init__(self):
 		pass
@@ -267,10 +481,36 @@ class DefaultDelegate:
 	def handleNotification(self, cHandle, data):
 		DBG("Notification:", cHandle, "sent data", binascii.b2a_hex(data))
 		
+		#senza pipeline la notifica è decodificata subito: il timestamp del dispositivo è registrato qui, come fa
+		#PipelineNotifiche prima di accodarla, per contare i pacchetti persi via radio
+		if cHandle in handle_timestamp and len(data) >= 2:
+			statistiche.timestamp(cHandle, unpack_from('<H', data)[0])
+		span = profilazione.inizio()
+		inizio = time.perf_counter()
+		sink_prima = tempo_sink_annidato
 		#ottenimento ora corrente
-		time = datetime.datetime.now()			
-		print("\t\tora:",time)
+		self.elabora_notifica(cHandle, data, datetime.datetime.now())
+		statistiche.stadio("decodifica", time.perf_counter() - inizio - (tempo_sink_annidato - sink_prima))
+		if span is not None:
+			profilazione.fine("decodifica", span)
+
+	def elabora_notifica(self, cHandle, data, time):
+		#decodifica della notifica ricevuta all'ora "time" e salvataggio dei dati
+		#l'audio ADPCM (200 pacchetti al secondo) non passa dalla stampa nè dal registro grezzo:
+		#i pacchetti sono accumulati e decodificati a blocchi
+		if cHandle == handle_audio:
+			if flusso_audio is not None:
+				flusso_audio.audio(data, time.timestamp())
+			return
+		if cHandle == handle_sincronizzazione_audio:
+			if flusso_audio is not None:
+				flusso_audio.sincronizza(data)
+			return
+		if stampa_notifiche:
+			stampa("\t\tora:",time)
 		time_formato_matlab = time.strftime ("%H%M%S.%f")
+		#registro grezzo di tutte le notifiche a frequenza piena, indipendente dalla decimazione
+		salva_grezzo(cHandle, data, time_formato_matlab)
 						
 		#occorre capire quale caratteristica è relativa alla notifica ricevuta 
 		
@@ -278,106 +518,135 @@ class DefaultDelegate:
 		if (cHandle == handle_temp_press):							
 			#salvataggio del pacchetto ricevuto in una variabile ausiliaria
 			temp_press_value = data
-			print("\t\tValore ricevuto temperatura e pressione: ",str(binascii.hexlify(temp_press_value), 'ascii').upper())
 			#scomposizione del pacchetto ricevuto in timestamp (2 byte), pressione (4 byte) e temperatura (2 byte)
 			timestamp1, pressione, temperatura = unpack('<Hlh', temp_press_value)
-			print ("\t\tTimestamp: {}\n\t\tPressione: {} mbar\n\t\tTemperatura: {} °C".format(timestamp1, pressione/100, temperatura/10))
-			try:
-				file_temp_press_matlab =  open(nome_file_temp_press_matlab, 'a+')
-				file_temp_press_matlab.write("{}\t{}\t{}\t{}\n".format(timestamp1, time_formato_matlab, pressione/100, temperatura/10))
-				file_temp_press_matlab.close()
-			except IOError:
-				print ("Errore di I/O sul file.")
+			if stampa_notifiche:
+				stampa("\t\tValore ricevuto temperatura e pressione: ",str(binascii.hexlify(temp_press_value), 'ascii').upper())
+				stampa("\t\tTimestamp: {}\n\t\tPressione: {} mbar\n\t\tTemperatura: {} °C".format(timestamp1, pressione/100, temperatura/10))
+			if valori_grezzi:
+				salva_riga("temperatura_pressione", (timestamp1, time_formato_matlab, pressione, temperatura))
+			else:
+				salva_riga("temperatura_pressione", (timestamp1, time_formato_matlab, pressione/100, temperatura/10))
 
 		#se l'handle "cHandle" passato a handleNotification è quello corrispondente a accelerometro, giroscopio e magnetometro
 		if (cHandle == handle_acc_gyr_magn):
 			#salvataggio del pacchetto ricevuto in una variabile ausiliaria
 			acc_gyr_magn_value = data
-			print("\t\tValore ricevuto accelerometro, giroscopio e magnetometro: ",str(binascii.hexlify(acc_gyr_magn_value), 'ascii').upper())
 			#scomposizione del pacchetto ricevuto in timestamp (2 byte), accelerometro, giroscopio e magnetometro 
 			#sui tre assi (2 byte con segno per ogni asse)
 			timestamp2, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, magn_x, magn_y, magn_z = unpack('<Hhhhhhhhhh', acc_gyr_magn_value)
-			#decodifica dei dati
-			#accelerometro (unità di misura: g) con fondo scala +/- 2 g e poichè ricevuti dal bluetooth in mg divido per 1000 per trovare g
-			acc_x = acc_x / 1000
-			acc_y = acc_y 	/ 1000
-			acc_z = acc_z / 1000
-			#dati del giroscopio (unità di misura: dps) da dividere per 10 secondo il file "Getting started with the BlueST protocol and SDK.pdf"
-			#perchè sono ricevuti in decimi di grado divido per 10 per trovare i gradi
-			#fondo scala +/- 2000 dps
-			gyr_x = gyr_x / 10
-			gyr_y = gyr_y / 10
-			gyr_z = gyr_z / 10
-			#magnetometro (unità di misura: μT) con range +/- 50 Gauss e fondo scala pari a  ??????,
-			#i dati ricevuti sono espressi in milligauss, poichè 1 G = 100 μT, i valori sono infine moltiplicati per 100 ed espressi in μT
-			#fondo scala +/- 50 gauss
-			magn_x = magn_x / 1000 * 100
-			magn_y = magn_y / 1000 * 100
-			magn_z = magn_z / 1000 * 100
-			print("\t\tTimestamp: {}\n\t\tAccx: {} g\n\t\tAccy: {} g\n\t\tAccz: {} g\n\t\tGyrx: {} dps\n\t\tGyry: {} dps\n\t\tGyrz: {} dps\n\t\tMagnx: {} μT\n\t\tMagny: {} μT\n\t\tMagnz: {} μT\n"
-			.format(timestamp2, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, magn_x, magn_y, magn_z)) 
-			#apertura dei file necessari a MATLAB
-			try:
-				file_accelerometro_matlab = open (nome_file_accelerometro_matlab, 'a+')
-				file_giroscopio_matlab = open (nome_file_giroscopio_matlab, 'a+')
-				file_magnetometro_matlab = open (nome_file_magnetometro_matlab, 'a+')
-				#scrittura dei file necessari a MATLAB
-				file_accelerometro_matlab.write ("{}\t{}\t{}\t{}\t{}\n".format(timestamp2, time_formato_matlab, acc_x, acc_y, acc_z))
-				file_giroscopio_matlab.write ("{}\t{}\t{}\t{}\t{}\n".format(timestamp2, time_formato_matlab, gyr_x, gyr_y, gyr_z))
-				file_magnetometro_matlab.write ("{}\t{}\t{}\t{}\t{}\n".format(timestamp2, time_formato_matlab, magn_x, magn_y, magn_z))
-				#chiusura dei file necessari a MATLAB
-				file_accelerometro_matlab.close()
-				file_giroscopio_matlab.close()
-				file_magnetometro_matlab.close()
-			except IOError:
-				print ("Errore di I/O sul file.")
+			grezzi = (acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, magn_x, magn_y, magn_z)
+			#con i valori grezzi la conversione serve solo per la stampa e per la stima sull'host
+			if stampa_notifiche or stima_host or not valori_grezzi:
+				#decodifica dei dati
+				#accelerometro (unità di misura: g) con fondo scala +/- 2 g e poichè ricevuti dal bluetooth in mg divido per 1000 per trovare g
+				acc_x = acc_x / 1000
+				acc_y = acc_y 	/ 1000
+				acc_z = acc_z / 1000
+				#dati del giroscopio (unità di misura: dps) da dividere per 10 secondo il file "Getting started with the BlueST protocol and SDK.pdf"
+				#perchè sono ricevuti in decimi di grado divido per 10 per trovare i gradi
+				#fondo scala +/- 2000 dps
+				gyr_x = gyr_x / 10
+				gyr_y = gyr_y / 10
+				gyr_z = gyr_z / 10
+				#magnetometro (unità di misura: μT) con fondo scala +/- 50 gauss: i dati ricevuti sono espressi in milligauss
+				#e poichè 1 G = 100 μT, cioè 1 mG = 0.1 μT, i valori sono divisi per 1000 e moltiplicati per 100
+				#(scala 0.1 nell'intestazione dei file con i valori grezzi)
+				magn_x = magn_x / 1000 * 100
+				magn_y = magn_y / 1000 * 100
+				magn_z = magn_z / 1000 * 100
+			if stampa_notifiche:
+				stampa("\t\tValore ricevuto accelerometro, giroscopio e magnetometro: ",str(binascii.hexlify(acc_gyr_magn_value), 'ascii').upper())
+				stampa("\t\tTimestamp: {}\n\t\tAccx: {} g\n\t\tAccy: {} g\n\t\tAccz: {} g\n\t\tGyrx: {} dps\n\t\tGyry: {} dps\n\t\tGyrz: {} dps\n\t\tMagnx: {} μT\n\t\tMagny: {} μT\n\t\tMagnz: {} μT\n"
+				.format(timestamp2, acc_x, acc_y, acc_z, gyr_x, gyr_y, gyr_z, magn_x, magn_y, magn_z)) 
+			#scrittura dei file necessari a MATLAB
+			if valori_grezzi:
+				salva_riga("accelerometro", (timestamp2, time_formato_matlab) + grezzi[0:3])
+				salva_riga("giroscopio", (timestamp2, time_formato_matlab) + grezzi[3:6])
+				salva_riga("magnetometro", (timestamp2, time_formato_matlab) + grezzi[6:9])
+			else:
+				salva_riga("accelerometro", (timestamp2, time_formato_matlab, acc_x, acc_y, acc_z))
+				salva_riga("giroscopio", (timestamp2, time_formato_matlab, gyr_x, gyr_y, gyr_z))
+				salva_riga("magnetometro", (timestamp2, time_formato_matlab, magn_x, magn_y, magn_z))
+			#stima di pitch e roll sull'host a partire da accelerometro e giroscopio
+			if stima_host:
+				pitch_c, roll_c = filtro_complementare.aggiorna((acc_x, acc_y, acc_z), (gyr_x, gyr_y, gyr_z), time.timestamp())
+				pitch_k, roll_k = filtro_kalman.aggiorna((acc_x, acc_y, acc_z), (gyr_x, gyr_y, gyr_z), time.timestamp())
+				if stampa_notifiche:
+					stampa("\t\tPitch (complementare): {} °\n\t\tRoll (complementare): {} °\n\t\tPitch (Kalman): {} °\n\t\tRoll (Kalman): {} °\n"
+					.format(pitch_c, roll_c, pitch_k, roll_k))
+				salva_riga("pitch_roll_host", (timestamp2, time_formato_matlab, pitch_c, roll_c, pitch_k, roll_k))
 
 		#se l'handle "cHandle" passato a handleNotification è quello corrispondente al sensor fusion compact
 		if (cHandle == handle_sensor_fusion_compact):
 			#salvataggio del pacchetto ricevuto in una variabile ausiliaria
 			sensor_fusion_compact = data
-			print("\t\tValore ricevuto sensor fusion compact: ",str(binascii.hexlify(sensor_fusion_compact), 'ascii').upper())
 			#scomposizione del pacchetto ricevuto in timestamp (2 byte) e altri 9 dati da 2 byte ciascuno secondo il file "Getting started with the BlueST protocol and SDK.pdf"
 			timestamp3, qi1, qj1, qk1, qi2, qj2, qk2, qi3, qj3, qk3 = unpack('<Hhhhhhhhhh', sensor_fusion_compact)
-			#decodifica dei dati secondo il file "Getting started with the BlueST protocol and SDK.pdf"
-			qi1 = qi1 / 10000
-			qj1 = qj1 / 10000
-			qk1 = qk1 / 10000
-			qi2 = qi2 / 10000
-			qj2 = qj2 / 10000
-			qk2 = qk2 / 10000
-			qi3 = qi3 / 10000
-			qj3 = qj3 / 10000
-			qk3 = qk3 / 10000			
-			print("\t\tTimestamp: {}\n\t\tQi1: {} \n\t\tQj1: {} \n\t\tQk1: {} \n\t\tQi2: {} \n\t\tQj2: {} \n\t\tQk2: {} \n\t\tQi3: {} \n\t\tQj3: {}  \n\t\tQk3: {} \n\t\t"
-			.format(timestamp3, qi1,qj1,qk1, qi2, qj2, qk2, qi3, qj3, qk3))
+			grezzi = (qi1, qj1, qk1, qi2, qj2, qk2, qi3, qj3, qk3)
+			#con i valori grezzi la conversione serve solo per la stampa
+			convertiti = stampa_notifiche or not valori_grezzi
+			if convertiti:
+				#decodifica dei dati secondo il file "Getting started with the BlueST protocol and SDK.pdf"
+				qi1 = qi1 / 10000
+				qj1 = qj1 / 10000
+				qk1 = qk1 / 10000
+				qi2 = qi2 / 10000
+				qj2 = qj2 / 10000
+				qk2 = qk2 / 10000
+				qi3 = qi3 / 10000
+				qj3 = qj3 / 10000
+				qk3 = qk3 / 10000			
+			if stampa_notifiche:
+				stampa("\t\tValore ricevuto sensor fusion compact: ",str(binascii.hexlify(sensor_fusion_compact), 'ascii').upper())
+				stampa("\t\tTimestamp: {}\n\t\tQi1: {} \n\t\tQj1: {} \n\t\tQk1: {} \n\t\tQi2: {} \n\t\tQj2: {} \n\t\tQk2: {} \n\t\tQi3: {} \n\t\tQj3: {}  \n\t\tQk3: {} \n\t\t"
+				.format(timestamp3, qi1,qj1,qk1, qi2, qj2, qk2, qi3, qj3, qk3))
 			#scrittura sul file che registra i dati del sensor fusion necessari a MATLAB
-			try:
-				file_sensor_fusion =  open(nome_file_sensor_fusion_matlab, 'a+')
-				file_sensor_fusion.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(timestamp3, time_formato_matlab, qi1,qj1,qk1, qi2, qj2, qk2, qi3, qj3, qk3))
-				file_sensor_fusion.close()
-			except IOError:
-				print ("Errore di I/O sul file.")
+			if valori_grezzi:
+				salva_riga("sensor_fusion", (timestamp3, time_formato_matlab) + grezzi)
+			else:
+				salva_riga("sensor_fusion", (timestamp3, time_formato_matlab, qi1,qj1,qk1, qi2, qj2, qk2, qi3, qj3, qk3))
+			#espansione in tre quaternioni completi (parte scalare ricavata dalla normalizzazione) con angoli di Eulero
+			if convertiti:
+				quaternioni = espansione_sensor_fusion.aggiorna(timestamp3, (qi1, qj1, qk1, qi2, qj2, qk2, qi3, qj3, qk3))
+			else:
+				quaternioni = espansione_sensor_fusion.aggiorna(timestamp3, grezzi, grezzi=True)
+			salva_righe("quaternioni", [(q[0], time_formato_matlab) + q[1:] for q in quaternioni])
 			
 		#se l'handle "cHandle" passato a handleNotification è quello corrispondente al sensor fusion compact
 		if (cHandle == handle_pitch_roll):
 			#salvataggio del pacchetto ricevuto in una variabile ausiliaria
 			newvalue = data
-			print("\t\tValore ricevuto caratteristica pitch e roll: ",str(binascii.hexlify(newvalue), 'ascii').upper())
 			#scomposizione del pacchetto ricevuto in timestamp (2 byte) e altri 2 dati da 2 byte ciascuno secondo il file "Getting started with the BlueST protocol and SDK.pdf"
 			timestamp4, pitch, roll = unpack('<Hhh', newvalue)
-			#conversione da radianti a gradi
-			pitch = pitch / 8192 * 180 / math.pi
-			roll = roll / 8192 * 180 / math.pi
-			print("\t\tTimestamp: {}\n\t\tPitch: {} °\n\t\tRoll: {} °\n\t\t".format(timestamp4, pitch, roll))
+			grezzi = (pitch, roll)
+			#con i valori grezzi la conversione serve solo per la stampa
+			if stampa_notifiche or not valori_grezzi:
+				#conversione da radianti a gradi
+				pitch = pitch / 8192 * 180 / math.pi
+				roll = roll / 8192 * 180 / math.pi
+			if stampa_notifiche:
+				stampa("\t\tValore ricevuto caratteristica pitch e roll: ",str(binascii.hexlify(newvalue), 'ascii').upper())
+				stampa("\t\tTimestamp: {}\n\t\tPitch: {} °\n\t\tRoll: {} °\n\t\t".format(timestamp4, pitch, roll))
 			#scrittura sul file che registra i dati del pitch e roll necessari a MATLAB
-			try:
-				file_pitch_roll =  open(nome_file_pitch_roll_matlab, 'a+')
-				file_pitch_roll.write("{}\t{}\t{}\t{}\n".format(timestamp4, time_formato_matlab, pitch, roll))
-				file_pitch_roll.close()
-			except IOError:
-				print ("Errore di I/O sul file.")		
-			
+			if valori_grezzi:
+				salva_riga("pitch_roll", (timestamp4, time_formato_matlab) + grezzi)
+			else:
+				salva_riga("pitch_roll", (timestamp4, time_formato_matlab, pitch, roll))
+
+		#altre caratteristiche BlueST: formato, scala e colonne sono presi dalla tabella delle feature
+		caratteristica = caratteristiche_handle.get(cHandle)
+		if caratteristica is not None:
+			#con i valori grezzi il pacchetto è convertito solo per la stampa
+			riga = caratteristica.decodifica_grezza(data) if valori_grezzi else caratteristica.decodifica(data)
+			if riga is None:
+				if stampa_notifiche:
+					stampa("\t\tLunghezza non prevista per {}: {} byte".format(caratteristica.feature, len(data)))
+			else:
+				if stampa_notifiche:
+					stampa("\t\tValore ricevuto {}: ".format(caratteristica.feature), str(binascii.hexlify(data), 'ascii').upper())
+					stampa(caratteristica.formatta(caratteristica.decodifica(data) if valori_grezzi else riga))
+				salva_riga(caratteristica.nome, (riga[0], time_formato_matlab) + riga[1:])
 			
 	def handleDiscovery(self, scanEntry, isNewDev, isNewData):
 		DBG("Discovered device", scanEntry.addr)
@@ -407,6 +676,14 @@ class BluepyHelper:
 		self._helper = None
 		self._poller = None
 		self._stderr = None
+		# Complete lines already read from the helper but not yet handled,
+		# and the incomplete last line; the incremental decoder keeps the
+		# bytes of a UTF-8 character split between two reads
+		self._lines = deque()
+		self._partial = ""
+		self._decoder = codecs.getincrementaldecoder('utf-8')('replace')
+		# Value of _sigchldCount when the helper was last known to be running
+		self._sigchldSeen = 0
 		self.delegate = DefaultDelegate()
 
 	def withDelegate(self, delegate_):
@@ -427,6 +704,11 @@ class BluepyHelper:
 											preexec_fn = preexec_function)
 			self._poller = select.poll()
 			self._poller.register(self._helper.stdout, select.POLLIN)
+			self._lines.clear()
+			self._partial = ""
+			self._decoder.reset()
+			_installSigchldHandler()
+			self._sigchldSeen = _sigchldCount
 
 	def _stopHelper(self):
 		if self._helper is not None:
@@ -467,7 +749,10 @@ class BluepyHelper:
 			elif tval[0]=="h":
 				val = int(tval[1:], 16)
 			elif tval[0]=='b':
+				span = profilazione.inizio()
 				val = binascii.a2b_hex(tval[1:].encode('utf-8'))
+				if span is not None:
+					profilazione.fine("hex", span)
 			else:
 				raise BTLEInternalError("Cannot understand response value %s" % repr(tval))
 			if tag not in resp:
@@ -476,46 +761,101 @@ class BluepyHelper:
 				resp[tag].append(val)
 		return resp
 
+	def _readAvailable(self):
+		# Reads whatever the helper has written so far (blocking only if
+		# nothing is available) and splits it into lines. The helper output
+		# is read from the file descriptor rather than with readline(), so
+		# that poll() and the lines buffered here never disagree.
+		span = profilazione.inizio()
+		data = os.read(self._helper.stdout.fileno(), 65536)
+		if span is not None:
+			profilazione.fine("lettura", span)
+		if not data:
+			# EOF (poll() reports POLLHUP): the helper has closed its stdout
+			self._helperExited()
+		lines = (self._partial + self._decoder.decode(data, final=not data)).split('\n')
+		self._partial = lines.pop()
+		self._lines.extend(line + '\n' for line in lines)
+		return True
+
+	def _checkHelper(self):
+		# waitpid() only after a SIGCHLD, which may come from any child process
+		if _sigchldCount != self._sigchldSeen:
+			self._sigchldSeen = _sigchldCount
+			if self._helper.poll() is not None:
+				self._helperExited()
+
+	def _helperExited(self):
+		# The helper is gone: release it, so that a later disconnect() does
+		# not try to write to its stdin, and report the error
+		DBG("Helper exited")
+		self._poller.unregister(self._helper.stdout)
+		self._helper.kill()
+		self._helper.wait()
+		self._helper = None
+		if self._stderr is not None:
+			self._stderr.close()
+			self._stderr = None
+		raise BTLEInternalError("Helper exited")
+
+	def _readLine(self):
+		# Next line from the helper, '' if no complete line could be read
+		if not self._lines:
+			self._readAvailable()
+			if not self._lines:
+				return ''
+		return self._lines.popleft()
+
 	def _waitResp(self, wantType, timeout=None):
 		while True:
-			if self._helper.poll() is not None:
-				raise BTLEInternalError("Helper exited")
+			self._checkHelper()
 
-			if timeout:
+			if timeout and not self._lines:
 				fds = self._poller.poll(timeout*1000)
 				if len(fds) == 0:
 					DBG("Select timeout")
 					return None
 
-			rv = self._helper.stdout.readline()
-			DBG("Got:", repr(rv))
-			if rv.startswith('#') or rv == '\n' or len(rv)==0:
-				continue
+			rv = self._readLine()
+			resp = self._checkResp(rv, wantType)
+			if resp is not None:
+				return resp
 
-			resp = BluepyHelper.parseResp(rv)
-			if 'rsp' not in resp:
-				raise BTLEInternalError("No response type indicator", resp)
+	def _checkResp(self, rv, wantType):
+		# Returns the parsed response if it is one of wantType, None if the
+		# line is to be ignored; errors and disconnection raise an exception
+		DBG("Got:", repr(rv))
+		if rv.startswith('#') or rv == '\n' or len(rv)==0:
+			return None
 
-			respType = resp['rsp'][0]
-			if respType in wantType:
-				return resp
-			elif respType == 'stat':
-				if 'state' in resp and len(resp['state']) > 0 and resp['state'][0] == 'disc':
-					self._stopHelper()
-					raise BTLEDisconnectError("Device disconnected", resp)
-			elif respType == 'err':
-				errcode=resp['code'][0]
-				if errcode=='nomgmt':
-					raise BTLEManagementError("Management not available (permissions problem?)", resp)
-				elif errcode=='atterr':
-					raise BTLEGattError("Bluetooth command failed", resp)
-				else:
-					raise BTLEException("Error from bluepy-helper (%s)" % errcode, resp)
-			elif respType == 'scan':
-				# Scan response when we weren't interested. Ignore it
-				continue
+		span = profilazione.inizio()
+		resp = BluepyHelper.parseResp(rv)
+		if span is not None:
+			profilazione.fine("parseResp", span)
+		if 'rsp' not in resp:
+			raise BTLEInternalError("No response type indicator", resp)
+
+		respType = resp['rsp'][0]
+		if respType in wantType:
+			return resp
+		elif respType == 'stat':
+			if 'state' in resp and len(resp['state']) > 0 and resp['state'][0] == 'disc':
+				self._stopHelper()
+				raise BTLEDisconnectError("Device disconnected", resp)
+		elif respType == 'err':
+			errcode=resp['code'][0]
+			if errcode=='nomgmt':
+				raise BTLEManagementError("Management not available (permissions problem?)", resp)
+			elif errcode=='atterr':
+				raise BTLEGattError("Bluetooth command failed", resp)
 			else:
-				raise BTLEInternalError("Unexpected response (%s)" % respType, resp)
+				raise BTLEException("Error from bluepy-helper (%s)" % errcode, resp)
+		elif respType == 'scan':
+			# Scan response when we weren't interested. Ignore it
+			return None
+		else:
+			raise BTLEInternalError("Unexpected response (%s)" % respType, resp)
+		return None
 
 	def status(self):
 		self._writeCmd("stat\n")
@@ -526,6 +866,8 @@ class Peripheral(BluepyHelper):
 	def __init__(self, deviceAddr=None, addrType=ADDR_TYPE_PUBLIC, iface=None):
 		BluepyHelper.__init__(self)
 		self._serviceMap = None # Indexed by UUID
+		# Per-handle notification statistics, see stats()
+		self.statistics = Statistiche()
 		(self.deviceAddr, self.addrType, self.iface) = (None, None, None)
 
 		if isinstance(deviceAddr, ScanEntry):
@@ -555,6 +897,7 @@ class Peripheral(BluepyHelper):
 			if respType == 'ntfy' or respType == 'ind':
 				hnd = resp['hnd'][0]
 				data = resp['d'][0]
+				self.statistics.notifica(hnd, len(data))
 				if self.delegate is not None:
 					self.delegate.handleNotification(hnd, data)
 				if respType not in wantType:
@@ -685,6 +1028,53 @@ class Peripheral(BluepyHelper):
 		self._writeCmd("%s %X %s\n" % (cmd, handle, binascii.b2a_hex(val).decode('utf-8')))
 		return self._getResp('wr')
 
+	def writeCharacteristics(self, writes, withResponse=False):
+		# Pipelined version of writeCharacteristic: all the (handle, value) writes
+		# are sent to the helper back to back and the responses are collected
+		# afterwards, in the same order. If some of the writes fail, the other
+		# responses are still consumed and the first error is raised.
+		cmd = "wrr" if withResponse else "wr"
+		self._writeCmd("".join("%s %X %s\n" % (cmd, handle, binascii.b2a_hex(val).decode('utf-8'))
+							   for (handle, val) in writes))
+		resps = []
+		error = None
+		for _ in writes:
+			try:
+				resps.append(self._getResp('wr'))
+			except BTLEGattError as e:
+				resps.append(None)
+				if error is None:
+					error = e
+		if error is not None:
+			raise error
+		return resps
+
+	def enableNotifications(self, targets, enable=True, withResponse=False):
+		# Writes the CCCD of every target (Characteristic, Descriptor or CCCD
+		# handle) with writeCharacteristics. enable may be True (notifications),
+		# False (notifications and indications off) or the raw CCCD value.
+		# Write-without-response is used by default, as for Descriptor.write:
+		# the helper acknowledges it locally, so no ATT round trip is needed.
+		if enable is True:
+			val = b"\x01\x00"
+		elif enable is False:
+			val = b"\x00\x00"
+		else:
+			val = enable
+		writes = []
+		for target in targets:
+			if isinstance(target, Characteristic):
+				cccds = target.getDescriptors(forUUID=0x2902)
+				if not cccds:
+					raise BTLEGattError("No CCCD for %s" % target)
+				handle = cccds[0].handle
+			elif isinstance(target, Descriptor):
+				handle = target.handle
+			else:
+				handle = target
+			writes.append((handle, val))
+		return self.writeCharacteristics(writes, withResponse)
+
 	def setSecurityLevel(self, level):
 		self._writeCmd("secu %s\n" % level)
 		return self._getResp('stat')
@@ -702,6 +1092,64 @@ class Peripheral(BluepyHelper):
 	def waitForNotifications(self, timeout):
 		 resp = self._getResp(['ntfy','ind'], timeout)
 		 return (resp != None)
+
+	def stats(self):
+		# Summary of the notifications received on this connection: per value
+		# handle count, bytes, current and peak rate (Hz), the histogram of
+		# the inter-arrival times of the batches (see statistiche.limiti_istogramma())
+		# and the number and largest size of the batches, plus the time spent in
+		# the parse, decodifica and sink stages
+		return self.statistics.riepilogo()
+
+	def drainNotifications(self, timeout):
+		# Batched version of waitForNotifications: waits up to timeout for the
+		# helper, then handles every complete line already read and passes all
+		# the notifications to the delegate at once (handleNotifications(batch)
+		# with a list of (handle, data), if the delegate has it). Returns the
+		# number of notifications received, 0 on timeout.
+		read = not self._lines
+		if read:
+			self._checkHelper()
+			if len(self._poller.poll(timeout*1000)) == 0:
+				return 0
+		# the profiling span starts after the wake-up, so it does not include the idle wait;
+		# the read is inside the try, so the root span is closed even if the helper has exited
+		root = profilazione.inizio(radice=True)
+		batch = []
+		try:
+			if read:
+				self._readAvailable()
+			start = time.perf_counter()
+			while self._lines:
+				resp = self._checkResp(self._lines.popleft(), ['ntfy', 'ind'])
+				if resp is not None:
+					batch.append((resp['hnd'][0], resp['d'][0]))
+		finally:
+			# all the notifications of the batch arrived with the same wake-up:
+			# one arrival per handle, so the histogram only has the intervals between batches
+			if batch:
+				self.statistics.stadio("parse", time.perf_counter() - start)
+				perHandle = {}
+				for (hnd, data) in batch:
+					count = perHandle.setdefault(hnd, [0, 0])
+					count[0] += 1
+					count[1] += len(data)
+				for hnd, (n, nBytes) in perHandle.items():
+					self.statistics.notifica(hnd, nBytes, start, n)
+			# notifications received before an error or a disconnection are still delivered
+			if batch and self.delegate is not None:
+				span = profilazione.inizio()
+				if hasattr(self.delegate, 'handleNotifications'):
+					self.delegate.handleNotifications(batch)
+				else:
+					for (hnd, data) in batch:
+						self.delegate.handleNotification(hnd, data)
+				if span is not None:
+					profilazione.fine("handleNotification", span)
+			if root is not None:
+				profilazione.fine("ricezione", root, radice=True)
+		return len(batch)
+
 	def _setRemoteOOB(self, address, address_type, oob_data, iface=None):
 		if self._helper is None:
 			self._startHelper(iface)
@@ -772,6 +1220,30 @@ class Peripheral(BluepyHelper):
 	def __del__(self):
 		self.disconnect()
 
+class BlueSTAdvertisement(namedtuple("BlueSTAdvertisement", ["protocolVersion", "deviceId", "featureMask", "mac"])):
+	# Manufacturer specific data advertised by BlueST devices: protocol
+	# version, device id, 32-bit feature mask (big-endian, bit i set when
+	# the feature characteristic with UUID (1 << i)-0001-11e1-ac36-0002a5d5c51b
+	# is exported) and, optionally, the device MAC address.
+	PROTOCOL_VERSION = 0x01
+	_format = struct.Struct('>BBI')
+
+	@classmethod
+	def parse(cls, data):
+		# Returns None if data is not a BlueST manufacturer block
+		if data is None or len(data) not in (6, 12):
+			return None
+		(version, deviceId, featureMask) = cls._format.unpack_from(data)
+		if version != cls.PROTOCOL_VERSION:
+			return None
+		mac = None
+		if len(data) == 12:
+			mac = ':'.join('%02x' % b for b in bytearray(data[6:12]))
+		return cls(version, deviceId, featureMask, mac)
+
+	def hasFeatures(self, mask):
+		return (self.featureMask & mask) == mask
+
 class ScanEntry:
 	addrTypes = { 1 : ADDR_TYPE_PUBLIC,
 				  2 : ADDR_TYPE_RANDOM
@@ -915,6 +1387,11 @@ class ScanEntry:
 		'''Returns list of tuples [(tag, description, value)]'''
 		return [ (sdid, self.getDescription(sdid), self.getValueText(sdid))
 					for sdid in self.scanData.keys() ]
+
+	def getBlueST(self):
+		'''Returns the decoded BlueSTAdvertisement, or None if the device
+		does not advertise a BlueST manufacturer block'''
+		return BlueSTAdvertisement.parse(self.scanData.get(ScanEntry.MANUFACTURER))
 		 
  
 class Scanner(BluepyHelper):
@@ -1031,10 +1508,267 @@ def get_json_uuid():
 
 AssignedNumbers = _UUIDNameMap( get_json_uuid() )
 
+#definizione dei byte da scrivere nel campo value del CCCD (in formato little-endian)
+notify_enable = bytes.fromhex('0100')
+indication_enable = bytes.fromhex('0200')
+notify_and_indication_enable = bytes.fromhex('0300')
+disable_notify_and_indication = bytes.fromhex('0000')
+
+#handle delle caratteristiche le cui notifiche sono decodificate in elabora_notifica (impostati ad ogni connessione)
+handle_temp_press = None
+handle_acc_gyr_magn = None
+handle_sensor_fusion_compact = None
+handle_pitch_roll = None
+#handle -> voce della tabella delle feature per le caratteristiche decodificate tramite la tabella
+caratteristiche_handle = {}
+#handle dell'audio ADPCM e dei relativi pacchetti di sincronizzazione, decodificatore dell'audio della connessione
+handle_audio = None
+handle_sincronizzazione_audio = None
+flusso_audio = None
+#handle le cui notifiche iniziano con il timestamp del dispositivo (tutte tranne l'audio), vedi handle_con_timestamp()
+handle_timestamp = frozenset()
+
+def cerca_dispositivo(indirizzo, tipo_indirizzo, timeout=10.0):
+	#finchè il sensor tile è spento faccio una ricerca del dispositivo
+	while True:
+		print("Sto cercando: {},  indirizzo: {}".format(indirizzo, tipo_indirizzo))
+		#wthDelegate(delegate) è un metodo che immagazzina un oggetto "delegate"
+		scanner = Scanner().withDelegate(ScanDelegate())
+		#scansiona i dispositivi per "timeout" secondi
+		devices = scanner.scan(timeout)
+		for dev in devices:
+			#cerco il dispositivo con il mac-address indicato
+			if (dev.addr == indirizzo):
+				return dev
+
+def inizializza_stati():
+	#filtri per la stima di pitch e roll sull'host e espansione dei pacchetti del sensor fusion compact
+	#(uno stato nuovo ad ogni connessione)
+	global filtro_complementare, filtro_kalman, espansione_sensor_fusion
+	filtro_complementare = FiltroComplementare()
+	filtro_kalman = FiltroKalman()
+	espansione_sensor_fusion = EspansioneSensorFusion()
+
+def crea_decimatori(configurazione_decimazione):
+	#decimatori dei flussi (uno stato nuovo ad ogni connessione)
+	global decimatori
+	decimatori = {}
+	for nome_flusso, (modo, fattore) in configurazione_decimazione.items():
+		decimatore = crea_decimatore(modo, fattore)
+		if decimatore is not None:
+			decimatori[nome_flusso] = decimatore
+
+def risolvi_caratteristica(conn, uuid):
+	#caratteristica con l'uuid indicato e il suo CCCD, (None, None) se la caratteristica non è presente;
+	#nel firmware BlueST il CCCD segue subito il valore, quindi il descrittore è cercato prima solo in quell'handle
+	#e soltanto se lì non c'è si scorrono i descrittori fino alla caratteristica successiva
+	try:
+		trovate = conn.getCharacteristics(0X0001, 0XFFFF, uuid)
+	except BTLEGattError:
+		trovate = []
+	if not trovate:
+		return None, None
+	ch = trovate[0]
+	cccd = ch.getDescriptors(forUUID=0x2902, hndEnd=ch.valHandle + 1)
+	if not cccd:
+		ch.descs = None
+		cccd = ch.getDescriptors(forUUID=0x2902)
+	return ch, (cccd[0] if cccd else None)
+
+def risolvi_da_inventario(conn, inventario, nome):
+	#come risolvi_caratteristica, ma con gli handle dell'inventario GATT salvato (vedi inventario_gatt.py), senza
+	#richieste al bluepy-helper; (None, None) se la caratteristica non è nell'inventario
+	voce = inventario["handle"].get(nome)
+	if voce is None:
+		return None, None
+	ch = Characteristic(conn, voce["uuid"], voce["handle"], voce["proprieta"], voce["handle_valore"])
+	return ch, (Descriptor(conn, 0x2902, voce["cccd"]) if voce["cccd"] is not None else None)
+
+def abilita_notifiche(conn, scelte, nome_file_temp_press_matlab=None, annuncio=None, inventario=None, nome_file_audio=None,
+	formato_audio="wav"):
+	#scelte contiene "s" o "n" per le chiavi "temperatura_pressione", "acc_giro_magn", "sensor_fusion_compact" e "pitch_roll"
+	#ed eventualmente "s" per i nomi delle altre feature della tabella di caratteristiche_bluest (es. "batteria")
+	#annuncio è il BlueSTAdvertisement ricevuto nella scansione: se c'è, sono cercate solo le caratteristiche scelte
+	#e presenti nella maschera delle feature (più temperatura e pressione, che viene comunque letta) e le altre non
+	#vengono disabilitate (senza bonding i CCCD ripartono disabilitati ad ogni connessione); senza annuncio sono
+	#cercate tutte e quattro le caratteristiche. Con l'inventario GATT del dispositivo gli handle sono presi
+	#dall'inventario invece di essere cercati sulla connessione. Con nome_file_audio (senza estensione) l'audio
+	#ADPCM, se scelto e presente nel firmware, è salvato in quel file nel formato_audio ("wav" o "pcm")
+	#restituisce True se è stata abilitata almeno una notifica
+	global handle_temp_press, handle_acc_gyr_magn, handle_sensor_fusion_compact, handle_pitch_roll
+	global handle_audio, handle_sincronizzazione_audio, handle_timestamp
+	scelta_temperatura_pressione = scelte.get("temperatura_pressione")
+	scelta_acc_giro_magn = scelte.get("acc_giro_magn")
+	scelta_sensor_fusion_compact = scelte.get("sensor_fusion_compact")
+	scelta_pitch_roll = scelte.get("pitch_roll")
+
+	def cerca(nome, necessaria):
+		#caratteristica e CCCD della voce "nome" della tabella delle feature, se va cercata
+		caratteristica = caratteristiche_bluest.PER_NOME[nome]
+		if annuncio is not None:
+			if not necessaria:
+				return None, None
+			if not caratteristica.annunciata(annuncio.featureMask):
+				print("Caratteristica {} non annunciata dal SensorTile".format(caratteristica.feature))
+				return None, None
+		if inventario is not None:
+			ch, cccd = risolvi_da_inventario(conn, inventario, nome)
+		else:
+			ch, cccd = risolvi_caratteristica(conn, caratteristica.uuid)
+		if ch is None:
+			print("Caratteristica {} non presente nel SensorTile".format(caratteristica.feature))
+		return ch, cccd
+
+	#ottengo gli oggetti "Characteristic" cercando tra le caratteristiche con handle compreso tra 0x00001 e 0xFFFF
+	#quella con l'UUID della feature, insieme al descrittore relativo al CCCD (0x2902);
+	#la temperatura e la pressione sono lette anche quando le notifiche non sono abilitate
+	ch_temp_press, cccd_temp_press = cerca("temperatura_pressione", scelta_temperatura_pressione in ("s", "n"))			#caratteristica temperatura e pressione
+	ch_acc_gyr_magn, cccd_acc_gyr_magn = cerca("acc_giro_magn", scelta_acc_giro_magn == "s")												#caratteristica accelerometro,giroscopio e magnetometro
+	ch_sensor_fusion_compact, cccd_sensor_fusion_compact = cerca("sensor_fusion_compact", scelta_sensor_fusion_compact == "s")	#caratteristica sensor fusion compact
+	ch_pitch_roll, cccd_pitch_roll = cerca("pitch_roll", scelta_pitch_roll == "s")																#caratteristica pitch e roll
+	#ottengo l'handle della caratteristica usata per identificare la relativa caratteristica
+	#serve per capire quale caratteristica è relativa alla notifica ricevuta 
+	handle_temp_press = ch_temp_press.getHandle() if ch_temp_press is not None else None
+	handle_acc_gyr_magn = ch_acc_gyr_magn.getHandle() if ch_acc_gyr_magn is not None else None
+	handle_sensor_fusion_compact = ch_sensor_fusion_compact.getHandle() if ch_sensor_fusion_compact is not None else None
+	handle_pitch_roll = ch_pitch_roll.getHandle() if ch_pitch_roll is not None else None
+
+	#controllo le scelte: i CCCD da abilitare e da disabilitare vengono scritti insieme alla fine,
+	#con scritture consecutive senza attendere la risposta di ciascuna
+	abilitare = []
+	disabilitare = []
+	if (scelta_temperatura_pressione  == "s"):																						
+		#abilitazione notifiche temperatura e pressione
+		abilitare.append(cccd_temp_press)
+	elif (scelta_temperatura_pressione  == "n"):
+		#disabilitazione notifiche temperatura e pressione
+		disabilitare.append(cccd_temp_press)
+	else:
+		print ("Scelta non corretta")
+
+	if (scelta_acc_giro_magn == "s"):		
+		#abilitazione notifiche accelerometro, giroscopio e magnetometro
+		abilitare.append(cccd_acc_gyr_magn)
+	elif (scelta_acc_giro_magn == "n"):		
+		#disabilitazione notifiche accelerometro, giroscopio e magnetometro
+		disabilitare.append(cccd_acc_gyr_magn)
+		print("Dati da accelerometro, giroscopio e magnetometro non disponibili perchè le notifiche sono disattivate")
+	else:
+		print ("Scelta non corretta")
+		
+	if (scelta_sensor_fusion_compact == "s"):
+		#abilitazione notifiche sensor fusion compact
+		abilitare.append(cccd_sensor_fusion_compact)
+	elif (scelta_sensor_fusion_compact == "n"):
+		#disabilitazione notifiche sensor fusion compact
+		disabilitare.append(cccd_sensor_fusion_compact)
+		print("Dati dal sensor fusion non disponibili perchè le notifiche sono disattivate")				
+	else:
+		print ("Scelta non corretta")				
+	
+	if (scelta_pitch_roll == "s"):		
+		#abilitazione notifiche pitch e roll
+		abilitare.append(cccd_pitch_roll)
+	elif (scelta_pitch_roll == "n"):		
+		#disabilitazione notifiche pitch e roll
+		disabilitare.append(cccd_pitch_roll)
+		print("Dati del pitch e roll non disponibili perchè le notifiche sono disattivate")
+	else:
+		print ("Scelta non corretta")
+
+	#caratteristiche decodificate tramite la tabella delle feature, se presenti nel firmware
+	caratteristiche_handle.clear()
+	for caratteristica in caratteristiche_bluest.AGGIUNTIVE:
+		if scelte.get(caratteristica.nome) != "s":
+			continue
+		ch, cccd = cerca(caratteristica.nome, True)
+		if ch is None:
+			continue
+		caratteristiche_handle[ch.getHandle()] = caratteristica
+		abilitare.append(cccd)
+
+	#audio ADPCM: servono sia i pacchetti audio sia quelli di sincronizzazione
+	handle_audio = handle_sincronizzazione_audio = None
+	if scelte.get("audio_adpcm") == "s":
+		ch_audio, cccd_audio = cerca("audio_adpcm", True)
+		ch_sincronizzazione, cccd_sincronizzazione = cerca("sincronizzazione_adpcm", True)
+		if ch_audio is not None and ch_sincronizzazione is not None:
+			handle_audio = ch_audio.getHandle()
+			handle_sincronizzazione_audio = ch_sincronizzazione.getHandle()
+			abilitare += [cccd_sincronizzazione, cccd_audio]
+			if nome_file_audio is not None:
+				crea_flusso_audio(nome_file_audio, formato_audio)
+
+	handle_timestamp = handle_con_timestamp()
+
+	#le caratteristiche non cercate o senza CCCD sono tralasciate
+	abilitare = [cccd for cccd in abilitare if cccd is not None]
+	disabilitare = [cccd for cccd in disabilitare if cccd is not None]
+	if disabilitare:
+		conn.enableNotifications(disabilitare, enable=False)
+	if abilitare:
+		conn.enableNotifications(abilitare)
+
+	if (scelta_temperatura_pressione  == "n" and ch_temp_press is not None):
+		#lettura pacchetto temperatura e pressione
+		temp_press_value = ch_temp_press.read()
+		print("\t\tValore ricevuto temperatura e pressione: ",str(binascii.hexlify(temp_press_value), 'ascii').upper())
+		#scomposizione del pacchetto ricevuto in timestamp (2 byte), pressione (4 byte) e temperatura (2 byte)
+		timestamp1, pressione, temperatura = unpack('<Hlh', temp_press_value)
+		print ("\t\tTimestamp: {}\n\t\tPressione: {} mbar\n\t\tTemperatura: {} °C".format(timestamp1, pressione/100, temperatura/10))
+		#scrittura sul file che registra tutti i dati 		
+		if nome_file_temp_press_matlab is not None:
+			try:
+				file_temp_press_matlab = open (nome_file_temp_press_matlab)
+				file_temp_press_matlab.write("Data: {}\nValore temperatura e pressione: {}\n\t\tTimestamp: {}\n\t\tPressione: {} mbar\n\t\tTemperatura: {} °C\n".format(datetime.datetime.now(),str(binascii.hexlify(temp_press_value), 'ascii').upper(), timestamp1, pressione/100, temperatura/10))
+				file_temp_press_matlab.close()
+			except IOError:
+				print ("Errore di I/O sul file.")
+
+	#se è stata abilitata almeno una notifica
+	return len(abilitare) > 0
+
+def nomi_handle():
+	#nome della caratteristica associata a ciascun handle (le stesse chiavi delle scelte di abilita_notifiche)
+	nomi = {handle_temp_press: "temperatura_pressione", handle_acc_gyr_magn: "acc_giro_magn",
+		handle_sensor_fusion_compact: "sensor_fusion_compact", handle_pitch_roll: "pitch_roll"}
+	nomi.update((handle, caratteristica.nome) for handle, caratteristica in caratteristiche_handle.items())
+	nomi.update({handle_audio: "audio_adpcm", handle_sincronizzazione_audio: "sincronizzazione_adpcm"})
+	#le caratteristiche non cercate non hanno handle
+	nomi.pop(None, None)
+	return nomi
+
+def handle_con_timestamp():
+	#handle delle caratteristiche abilitate i cui pacchetti iniziano con il timestamp del dispositivo: i pacchetti
+	#audio non lo hanno
+	return frozenset(handle for handle in nomi_handle() if handle not in (handle_audio, handle_sincronizzazione_audio))
+
+def ricevi_notifiche(conn, timeout_notification=1.0):
+	#ciclo per la gestione delle notifiche, termina solo con un'eccezione (es. disconnessione);
+	#ad ogni risveglio vengono gestite tutte le notifiche già arrivate dal bluepy-helper
+	while True:
+		if conn.drainNotifications(timeout_notification):
+			#chiamata della funzione handleNotification() per ciascuna notifica del lotto
+			continue
+
 if __name__ == '__main__':
 	#if len(sys.argv) < 2:
 	 #   sys.exit("Usage:\n  %s <mac-address> [random]" % sys.argv[0])
 
+	parser = argparse.ArgumentParser(description="Ricezione delle notifiche dal SensorTile")
+	parser.add_argument("--profilo", help="profilo di sottoscrizione applicato automaticamente ad ogni connessione "
+		"(senza profilo le scelte vengono chieste all'utente alla prima connessione)")
+	parser.add_argument("--configurazione", default=percorso_predefinito(), help="file JSON con i profili di sottoscrizione")
+	parser.add_argument("--indirizzo", help="mac-address del SensorTile (sostituisce quello del profilo)")
+	parser.add_argument("--porta-metriche", type=int, help="porta su cui esporre le metriche in formato Prometheus "
+		"(http://127.0.0.1:<porta>/metrics)")
+	parser.add_argument("--traccia", help="file JSON in cui salvare la traccia della profilazione (formato Chrome), "
+		"scritto all'uscita insieme ai percentili dei tempi di ciascuno stadio")
+	parser.add_argument("--campionamento", type=int, default=10, help="con --traccia, profila una lettura dal "
+		"bluepy-helper (e una decodifica o scrittura nei thread della pipeline) ogni N")
+	args = parser.parse_args()
+	traccia = profilazione.attiva(args.campionamento) if args.traccia is not None else None
+
 	if not os.path.isfile(helperExe):
 		raise ImportError("Cannot find required executable '%s'" % helperExe)
 
@@ -1045,11 +1779,6 @@ if __name__ == '__main__':
 	devAddr = "c0:86:1d:31:45:48"
 	addrType = "random"
 	
-	#definizione dei byte da scrivere nel campo value del CCCD (in formato little-endian)
-	notify_enable = bytes.fromhex('0100')
-	indication_enable = bytes.fromhex('0200')
-	notify_and_indication_enable = bytes.fromhex('0300')
-	disable_notify_and_indication = bytes.fromhex('0000')
 	#definizione degli uuid dei servizi e delle caratteristiche (presi dal file "Getting started with the BlueST protocol and SDK.pdf")
 	uuid_services = ["00001801-0000-1000-8000-00805f9b34fb", "00001800-0000-1000-8000-00805f9b34fb", "00000000-0001-11e1-9ab4-0002a5d5c51b", 
 	"00000000-000e-11e1-9ab4-0002a5d5c51b", "00000000-000f-11e1-9ab4-0002a5d5c51b", "00000000-0002-11e1-9ab4-0002a5d5c51b"]					
@@ -1066,121 +1795,227 @@ if __name__ == '__main__':
 	"00002a01-0000-1000-8000-00805f9b34fb", "00002a04-0000-1000-8000-00805f9b34fb", "00000001-000e-11e1-ac36-0002a5d5c51b", "00000002-000e-11e1-ac36-0002a5d5c51b",
 	"00000002-000f-11e1-ac36-0002a5d5c51b", "00ee0000-0001-11e1-ac36-0002a5d5c51b"]
 	
+	#decimazione opzionale di ciascun flusso prima del salvataggio: nome del flusso -> (modo, fattore)
+	#modi disponibili: "anti_aliasing", "media", "minimo", "massimo", "ogni_n"
+	#es. {"accelerometro": ("anti_aliasing", 5)} porta l'accelerometro da 50 Hz a 10 Hz
+	configurazione_decimazione = {}
+	#se True tutte le notifiche sono registrate anche a frequenza piena nel file del registro grezzo
+	#(una scrittura in più per ogni gruppo di notifiche, quindi disabilitato se non serve)
+	salva_registro_grezzo = False
+	#se True ogni flusso è salvato anche in un file .mat (versione 5) caricabile direttamente con load()
+	#(una seconda scrittura per ogni blocco di campioni, quindi disabilitato se non serve: "mat" nei sink del profilo)
+	salva_file_mat = False
+	#se True i campioni decodificati sono pubblicati anche in buffer circolari in memoria condivisa
+	#(uno per flusso, nome "<mac-address senza :>_<flusso>") per i processi che li leggono in tempo reale
+	pubblica_buffer_condiviso = False
+	capacita_buffer_condiviso = 65536
+	#se True le notifiche sono decodificate e salvate da thread separati: il ciclo di ricezione si limita
+	#ad accodarle, così le scritture su disco non ritardano la lettura dal bluepy-helper
+	usa_pipeline = True
+	#capacità delle code della pipeline (per flusso) e politica applicata quando una coda è piena:
+	#"blocca", "scarta_vecchi", "scarta_nuovi" oppure "solo_grezzo" (la notifica è salvata solo nel registro grezzo)
+	#in politiche_code la politica può essere indicata per caratteristica (coda di ricezione, es. "acc_giro_magn")
+	#o per flusso (coda di salvataggio, es. "accelerometro")
+	capacita_code = 1024
+	politica_code = "blocca"
+	politiche_code = {}
+	#cartella in cui sono salvati i file
+	cartella_dati = "/home/matteo/Scrivania/MATLAB/Pitch e Roll/"
+	#formato del file dell'audio ADPCM decodificato: "wav" oppure "pcm" (campioni a 16 bit senza intestazione)
+	formato_audio = "wav"
+	#se True i campioni decodificati sono accodati anche in un archivio in memoria per flusso (valori interi
+	#ricevuti e timestamp srotolati); i blocchi più vecchi sono scaricati in cartella_archivio (None = cartella temporanea)
+	archivio_in_memoria = False
+	cartella_archivio = None
+	#se True ogni connessione è registrata nel catalogo SQLite delle sessioni (catalogo.sqlite nella cartella dei dati)
+	#con i punti di controllo dei file di testo, per ritrovare i dati di un dispositivo in un intervallo di tempo
+	usa_catalogo = True
+	#se True tutti i flussi (e il registro grezzo) di tutte le connessioni sono accodati in un contenitore per giorno
+	#("<mac-address senza :> <giorno>.stc", vedi contenitore.py) con un segmento per connessione, invece di creare
+	#una nuova serie di file di testo e .mat ad ogni riconnessione; oltre dimensione_contenitore byte si passa a un nuovo file
+	usa_contenitore = False
+	dimensione_contenitore = DIMENSIONE_MASSIMA
+	#compressione dei flussi nel contenitore (vedi compressione.py): None = righe di testo, "delta" = differenze tra
+	#righe consecutive in varint, "zlib" o "zstd" = differenze e compressore generico (zstd richiede il pacchetto zstandard)
+	compressione_contenitore = None
+	#scelte delle notifiche da abilitare (chieste all'utente alla prima connessione se non c'è un profilo)
+	scelte = None
+	#MTU e intervallo di connessione (minimo, massimo in ms) richiesti ad ogni connessione (None = valori predefiniti);
+	#l'intervallo si imposta tramite debugfs del kernel e richiede i permessi di root
+	mtu_richiesto = 247
+	intervallo_richiesto = (7.5, 15.0)
+	#inventario GATT del dispositivo salvato con inventario_gatt.py (None = caratteristiche cercate ad ogni connessione);
+	#va rigenerato se cambia il firmware del SensorTile
+	percorso_inventario = None
+	#porta dell'endpoint HTTP con le metriche della ricezione (solo su localhost, None = disabilitato)
+	porta_metriche = None
+	#dati BlueST dell'advertising (versione, id del dispositivo, maschera delle feature), aggiornati ad ogni scansione:
+	#alla connessione sono cercate solo le caratteristiche scelte e annunciate nella maschera
+	annuncio_bluest = None
+
+	#il profilo di sottoscrizione sostituisce le impostazioni precedenti
+	if args.profilo is not None:
+		profilo = carica_profilo(args.configurazione, args.profilo)
+		if profilo.indirizzo is not None:
+			devAddr = profilo.indirizzo
+			addrType = profilo.tipo_indirizzo
+		scelte = profilo.scelte()
+		configurazione_decimazione = profilo.decimazione
+		cartella_dati = profilo.sink["cartella"]
+		salva_registro_grezzo = profilo.sink["registro_grezzo"]
+		salva_file_mat = profilo.sink["mat"]
+		pubblica_buffer_condiviso = profilo.sink["buffer_condiviso"]
+		capacita_buffer_condiviso = profilo.sink["capacita_buffer_condiviso"]
+		formato_audio = profilo.sink["audio"]
+		archivio_in_memoria = profilo.sink["archivio_memoria"]
+		cartella_archivio = profilo.sink["cartella_archivio"]
+		usa_catalogo = profilo.sink["catalogo"]
+		usa_contenitore = profilo.sink["contenitore"]
+		dimensione_contenitore = profilo.sink["dimensione_contenitore"]
+		compressione_contenitore = profilo.sink["compressione_contenitore"]
+		valori_grezzi = profilo.sink["valori_grezzi"]
+		stima_host = profilo.sink["pitch_roll_host"]
+		stampa_notifiche = profilo.sink["stampa"]
+		usa_pipeline = profilo.code["pipeline"]
+		capacita_code = profilo.code["capacita"]
+		politica_code = profilo.code["politica"]
+		politiche_code = profilo.code["politiche"]
+		mtu_richiesto = profilo.connessione["mtu"]
+		intervallo_richiesto = profilo.connessione["intervallo"]
+		percorso_inventario = profilo.connessione["inventario"]
+		#flussi delle altre feature BlueST indicate nel profilo
+		registra_flussi_bluest(scelte)
+	if args.indirizzo is not None:
+		devAddr = args.indirizzo
+	if args.porta_metriche is not None:
+		porta_metriche = args.porta_metriche
+	
 	###############	   fine dichiarazione variabili 	#########################		
+	inventario = None
+	if percorso_inventario is not None:
+		inventario = carica_inventario(percorso_inventario, devAddr)
+		if inventario is None:
+			print("L'inventario {} non è del dispositivo {}, le caratteristiche sono cercate sulla connessione".format(percorso_inventario, devAddr))
+	#l'intervallo di connessione viene proposto dal kernel alla periferica quando si crea la connessione
+	intervallo_precedente = None
+	if intervallo_richiesto is not None:
+		intervallo_precedente = imposta_intervallo_connessione(*intervallo_richiesto)
+		if intervallo_precedente is None:
+			print("Impossibile impostare l'intervallo di connessione, si usano i valori predefiniti")
+	#stato della connessione, statistiche e code sono letti dal thread del server solo quando arriva una richiesta
+	registro_metriche = RegistroMetriche()
+	stato_dispositivo = registro_metriche.dispositivo(devAddr)
+	if porta_metriche is not None:
+		ServerMetriche(registro_metriche, porta_metriche).avvia()
+	catalogo = None
+	if usa_catalogo:
+		try:
+			catalogo = Catalogo(os.path.join(cartella_dati, NOME_CATALOGO))
+		except sqlite3.Error as e:
+			print("Catalogo delle sessioni non disponibile: ", e)
+	contenitore = Contenitore(cartella_dati, devAddr, dimensione_contenitore, compressione_contenitore) if usa_contenitore else None
 	try:
 		while True:
 			try:
-				#finchè il sensor tile è spento faccio una ricerca del dispositivo
-				while (SensorTile_state == 0):
-					print("Sto cercando: {},  indirizzo: {}".format(devAddr, addrType))
-					#wthDelegate(delegate) è un metodo che immagazzina un oggetto "delegate"
-					scanner = Scanner().withDelegate(ScanDelegate())	  				   
-					#timeout per la scansione = 10 secondi
-					timeout=10.0																				
-					#scansiona i dispositivi per 10 secondi
-					devices = scanner.scan(timeout)				    			
-					for dev in devices:
-						#cerco il dispositivo con mac-address uguale a c0:86:1d:31:45:48
-						if (dev.addr == devAddr):									
-							#SensorTile è acceso
-							SensorTile_state = 1															
+				#finchè il sensor tile è spento faccio una ricerca del dispositivo (timeout per la scansione = 10 secondi)
+				if (SensorTile_state == 0):
+					annuncio_bluest = cerca_dispositivo(devAddr, addrType, 10.0).getBlueST()
+					if annuncio_bluest is not None:
+						print("BlueST versione {}, id dispositivo 0x{:02x}, feature 0x{:08x}".format(annuncio_bluest.protocolVersion,
+						annuncio_bluest.deviceId, annuncio_bluest.featureMask))
+					#SensorTile è acceso
+					SensorTile_state = 1
 				#creo un oggetto "Peripheral" ed effettuo una connessione al dispositivo indicato in devAdd (c0:86:1d:31:45:48)
 				conn = Peripheral(devAddr, addrType)
+				statistiche = conn.statistics
+				if usa_pipeline:
+					pipeline_notifiche = PipelineNotifiche(DefaultDelegate(), scrivi_sink, salva_grezzo if salva_registro_grezzo else None,
+					capacita=capacita_code, politica=politica_code, politiche=politiche_code, statistiche=statistiche).avvia()
+					conn.withDelegate(pipeline_notifiche)
 				print("Connesso a: {}".format(devAddr))
 
 				#ottengo l'ora attuale
 				tempo = str(datetime.datetime.now())
+				#negoziazione dell'MTU: i valori richiesti e quelli ottenuti sono salvati nei metadati della sessione
+				try:
+					metadati_sessione = negozia_connessione(conn, mtu_richiesto, intervallo_richiesto)
+				except BTLEDisconnectError:
+					raise
+				except BTLEException as e:
+					print("Negoziazione dell'MTU non riuscita: ", e)
+					metadati_sessione = negozia_connessione(conn, None, intervallo_richiesto)
+				metadati_sessione.update({"indirizzo": devAddr, "inizio": tempo})
+				print("MTU: {}, intervallo di connessione proposto: {} ms".format(metadati_sessione["mtu"], metadati_sessione["intervallo_proposto"]))
+				if catalogo is not None:
+					sessione_catalogo = catalogo.apri_sessione(devAddr, cartella_dati, metadati_sessione)
+				#i metadati della sessione sono nel catalogo e, con il contenitore, anche nel marcatore del segmento;
+				#senza nessuno dei due sono solo stampati, così una riconnessione non crea un altro file
+				if contenitore is not None:
+					contenitore.segmento(metadati_sessione, sessione_catalogo)
+				elif catalogo is None:
+					print("Metadati della sessione: ", metadati_sessione)
 				#definizione dei nomi dei file in cui sono salvati i dati ricevuti dal bluetooth
-				nome_file_temp_press_matlab = "/home/matteo/Scrivania/MATLAB/Pitch e Roll/Temperatura e pressione " + tempo + ".txt"
-				nome_file_sensor_fusion_matlab = "/home/matteo/Scrivania/MATLAB/Pitch e Roll/Sensor Fusion " + tempo + ".txt"
-				nome_file_accelerometro_matlab = "/home/matteo/Scrivania/MATLAB/Pitch e Roll/Accelerometro " + tempo + ".txt"
-				nome_file_giroscopio_matlab = "/home/matteo/Scrivania/MATLAB/Pitch e Roll/Giroscopio " + tempo + ".txt"
-				nome_file_magnetometro_matlab = "/home/matteo/Scrivania/MATLAB/Pitch e Roll/Magnetometro " + tempo + ".txt"
-				nome_file_pitch_roll_matlab = "/home/matteo/Scrivania/MATLAB/Pitch e Roll/Pitch e roll " + tempo + ".txt"
-
-				#ottengo una lista di oggetti "Characteristic" cercando tra le caratteristiche con handle compreso tra 0x00001 e 0xFFFF dalla periferica e con l'UUID specificato 
-				ch_temp_press = conn.getCharacteristics (0X0001, 0XFFFF, "00140000-0001-11e1-ac36-0002a5d5c51b")[0]									#caratteristica temperatura e pressione
-				ch_acc_gyr_magn = conn.getCharacteristics (0X0001, 0XFFFF, "00e00000-0001-11e1-ac36-0002a5d5c51b")[0]							#caratteristica accelerometro,giroscopio e magnetometro									
-				ch_sensor_fusion_compact = conn.getCharacteristics (0X0001, 0XFFFF, "00000100-0001-11e1-ac36-0002a5d5c51b")[0]			#caratteristica sensor fusion compact
-				ch_pitch_roll = conn.getCharacteristics (0X0001, 0XFFFF, "00ee0000-0001-11e1-ac36-0002a5d5c51b")[0]											#caratteristica pitch e roll
-				#ottengo l'handle della caratteristica usata per identificare la relativa caratteristica
-				#serve per capire quale caratteristica è relativa alla notifica ricevuta 
-				handle_temp_press = ch_temp_press.getHandle()																						#handle caratteristica temperatura e pressione
-				handle_acc_gyr_magn = ch_acc_gyr_magn.getHandle()																			#handle caratteristica accelerometro, giroscopio e magnetometro			
-				handle_sensor_fusion_compact = ch_sensor_fusion_compact.getHandle()											#handle caratteristica sensor fusion compact	
-				handle_pitch_roll = ch_pitch_roll.getHandle()																										#handle caratteristica pitch e roll
-				#ottengo una lista di oggetti "Descriptor" con UUID relativo al CCCD (0x2902).
-				cccd_temp_press = ch_temp_press.getDescriptors(forUUID=0x2902)[0]													#descrittore della caratteristica temperatura e pressione
-				cccd_acc_gyr_magn = ch_acc_gyr_magn.getDescriptors(forUUID=0x2902)[0]										#descrittore della caratteristica accelerometro, giroscopio e magnetometro
-				cccd_sensor_fusion_compact = ch_sensor_fusion_compact.getDescriptors(forUUID=0x2902)[0]		#descrittore della caratteristica sensor fusion compact
-				cccd_pitch_roll = ch_pitch_roll.getDescriptors(forUUID=0x2902)[0]																	#descrittore della caratteristica pitch e roll
-
-				scelta_temperatura_pressione = input ("Abilitare le notifiche di temperatura e pressione? (s/n) ")
-				scelta_acc_giro_magn = input ("Abilitare le notifiche di accelerometro, giroscopio e magnetometro? (s/n) ")
-				scelta_sensor_fusion_compact = input ("Abilitare le notifiche del sensor fusion compact? (s/n) ")
-				scelta_pitch_roll = input ("Abilitare le notifiche della caratteristica del pitch e roll? (s/n) ")
-				#controllo le scelte
-				if (scelta_temperatura_pressione  == "s"):																						
-					#abilitazione notifiche temperatura e pressione
-					cccd_temp_press.write(notify_enable)
-				elif (scelta_temperatura_pressione  == "n"):
-					#disabilitazione notifiche temperatura e pressione
-					cccd_temp_press.write(disable_notify_and_indication)
-					#lettura pacchetto temperatura e pressione
-					temp_press_value = ch_temp_press.read()
-					print("\t\tValore ricevuto temperatura e pressione: ",str(binascii.hexlify(temp_press_value), 'ascii').upper())
-					#scomposizione del pacchetto ricevuto in timestamp (2 byte), pressione (4 byte) e temperatura (2 byte)
-					timestamp1, pressione, temperatura = unpack('<Hlh', temp_press_value)
-					print ("\t\tTimestamp: {}\n\t\tPressione: {} mbar\n\t\tTemperatura: {} °C".format(timestamp1, pressione/100, temperatura/10))
-					#scrittura sul file che registra tutti i dati 		
-					try:
-						file_temp_press_matlab = open (nome_file_temp_press_matlab)
-						file_temp_press_matlab.write("Data: {}\nValore temperatura e pressione: {}\n\t\tTimestamp: {}\n\t\tPressione: {} mbar\n\t\tTemperatura: {} °C\n".format(datetime.datetime.now(),str(binascii.hexlify(temp_press_value), 'ascii').upper(), timestamp1, pressione/100, temperatura/10))
-						file_temp_press_matlab.close()
-					except IOError:
-						print ("Errore di I/O sul file.")
-				else:
-					print ("Scelta non corretta")
-
-				if (scelta_acc_giro_magn == "s"):		
-					#abilitazione notifiche accelerometro, giroscopio e magnetometro
-					cccd_acc_gyr_magn.write(notify_enable)	
-				elif (scelta_acc_giro_magn == "n"):		
-					#disabilitazione notifiche accelerometro, giroscopio e magnetometro
-					cccd_acc_gyr_magn.write(disable_notify_and_indication)				
-					print("Dati da accelerometro, giroscopio e magnetometro non disponibili perchè le notifiche sono disattivate")
-				else:
-					print ("Scelta non corretta")
-					
-				if (scelta_sensor_fusion_compact == "s"):
-					#abilitazione notifiche sensor fusion compact
-					cccd_sensor_fusion_compact.write(notify_enable)						
-				elif (scelta_sensor_fusion_compact == "n"):
-					#disabilitazione notifiche sensor fusion compact
-					cccd_sensor_fusion_compact.write(disable_notify_and_indication)		
-					print("Dati dal sensor fusion non disponibili perchè le notifiche sono disattivate")				
-				else:
-					print ("Scelta non corretta")				
-				
-				if (scelta_pitch_roll == "s"):		
-					#abilitazione notifiche pitch e roll
-					cccd_pitch_roll.write(notify_enable)	
-				elif (scelta_pitch_roll == "n"):		
-					#disabilitazione notifiche pitch e roll
-					cccd_pitch_roll.write(disable_notify_and_indication)				
-					print("Dati del pitch e roll non disponibili perchè le notifiche sono disattivate")
-				else:
-					print ("Scelta non corretta")
-					
+				nome_file_temp_press_matlab = os.path.join(cartella_dati, "Temperatura e pressione " + tempo + ".txt")
+				nome_file_sensor_fusion_matlab = os.path.join(cartella_dati, "Sensor Fusion " + tempo + ".txt")
+				nome_file_accelerometro_matlab = os.path.join(cartella_dati, "Accelerometro " + tempo + ".txt")
+				nome_file_giroscopio_matlab = os.path.join(cartella_dati, "Giroscopio " + tempo + ".txt")
+				nome_file_magnetometro_matlab = os.path.join(cartella_dati, "Magnetometro " + tempo + ".txt")
+				nome_file_pitch_roll_matlab = os.path.join(cartella_dati, "Pitch e roll " + tempo + ".txt")
+				nome_file_pitch_roll_host_matlab = os.path.join(cartella_dati, "Pitch e roll host " + tempo + ".txt")
+				nome_file_quaternioni_matlab = os.path.join(cartella_dati, "Sensor Fusion quaternioni " + tempo + ".txt")
+				nomi_file_flussi = {"temperatura_pressione": nome_file_temp_press_matlab, "accelerometro": nome_file_accelerometro_matlab,
+				"giroscopio": nome_file_giroscopio_matlab, "magnetometro": nome_file_magnetometro_matlab, "sensor_fusion": nome_file_sensor_fusion_matlab,
+				"quaternioni": nome_file_quaternioni_matlab, "pitch_roll": nome_file_pitch_roll_matlab, "pitch_roll_host": nome_file_pitch_roll_host_matlab}
+				for nome_flusso in colonne_flussi:
+					if nome_flusso not in nomi_file_flussi:
+						nomi_file_flussi[nome_flusso] = os.path.join(cartella_dati, etichette_flussi[nome_flusso] + " " + tempo + ".txt")
+				#senza la stima sull'host il flusso pitch_roll_host non ha file
+				if not stima_host:
+					del nomi_file_flussi["pitch_roll_host"]
+				#sink di ciascun flusso: file di testo ed eventualmente file .mat con lo stesso nome, oppure il contenitore giornaliero
+				sink_flussi = {}
+				for nome_flusso, nome_file in nomi_file_flussi.items():
+					#scala di ogni colonna dei valori interi ricevuti, scritta nell'intestazione dei file
+					scale = caratteristiche_bluest.scale_flusso(nome_flusso) if valori_grezzi else None
+					if contenitore is not None:
+						sink_flussi[nome_flusso] = [contenitore.flusso(nome_flusso, colonne_flussi[nome_flusso],
+						caratteristiche_bluest.campi_flusso(nome_flusso), SUDDIVISIONI_TEMPO.get(nome_flusso, 1), scale)]
+					else:
+						sink_flussi[nome_flusso] = [SinkTesto(nome_file, sessione_catalogo.flusso(nome_flusso, nome_file) if sessione_catalogo is not None else None,
+						scale)]
+					if salva_file_mat and contenitore is None:
+						sink_flussi[nome_flusso].append(SinkMat(nome_file[:-len(".txt")] + ".mat", colonne_flussi[nome_flusso], nome_flusso, scale=scale))
+					if pubblica_buffer_condiviso:
+						sink_flussi[nome_flusso].append(BufferCircolareScrittura(devAddr.replace(":", "") + "_" + nome_flusso,
+						colonne_flussi[nome_flusso], capacita_buffer_condiviso, scale))
+					if archivio_in_memoria:
+						if nome_flusso not in archivi_flussi:
+							archivi_flussi[nome_flusso] = crea_archivio(nome_flusso, cartella=cartella_archivio, grezzi=valori_grezzi)
+						sink_flussi[nome_flusso].append(archivi_flussi[nome_flusso])
+				if salva_registro_grezzo and contenitore is not None:
+					sink_grezzo = contenitore.flusso("notifiche_grezze", ["handle", "time", "dati"])
+				elif salva_registro_grezzo:
+					sink_grezzo = RegistroGrezzo(os.path.join(cartella_dati, "Notifiche grezze " + tempo + ".txt"))
+				#decimatori, filtri per la stima di pitch e roll ed espansione del sensor fusion (uno stato nuovo ad ogni connessione)
+				crea_decimatori(configurazione_decimazione)
+				inizializza_stati()
+
+				#le scelte fatte alla prima connessione sono riapplicate ad ogni riconnessione
+				if scelte is None:
+					scelte = {}
+					scelte["temperatura_pressione"] = input ("Abilitare le notifiche di temperatura e pressione? (s/n) ")
+					scelte["acc_giro_magn"] = input ("Abilitare le notifiche di accelerometro, giroscopio e magnetometro? (s/n) ")
+					scelte["sensor_fusion_compact"] = input ("Abilitare le notifiche del sensor fusion compact? (s/n) ")
+					scelte["pitch_roll"] = input ("Abilitare le notifiche della caratteristica del pitch e roll? (s/n) ")
 				#se è stata abilitata almeno una notifica
-				if (scelta_temperatura_pressione  == "s" or scelta_acc_giro_magn == "s" or scelta_sensor_fusion_compact == "s" or scelta_pitch_roll == "s"):						
+				if abilita_notifiche(conn, scelte, nome_file_temp_press_matlab, annuncio_bluest, inventario,
+				os.path.join(cartella_dati, "Audio " + tempo), formato_audio):
+					if pipeline_notifiche is not None:
+						pipeline_notifiche.imposta_nomi_handle(nomi_handle(), handle_timestamp)
+					stato_dispositivo.connessione(statistiche, pipeline_notifiche, nomi_handle())
 					#ciclo per la gestione delle notifiche
 					try:
-						while True:
-							timeout_notification = 1.0	
-							if conn.waitForNotifications(timeout_notification):
-								#chiamata della funzione handleNotification()				
-								continue
+						ricevi_notifiche(conn)
 					except BTLEException as e:	
 						#azzero la variabile SensorTile_state perchè il Sensor Tile è disconesso
 						SensorTile_state = 0	
@@ -1191,9 +2026,28 @@ if __name__ == '__main__':
 				SensorTile_state = 0	
 				print("Errore: ", e)	
 			finally:
+				stato_dispositivo.disconnessione()
+				#scrittura dei blocchi ancora aperti nei decimatori e chiusura dei file
+				chiudi_flussi()
 			#disconnessione dal SensorTile
 				conn.disconnect()					
 
 	#premere CTRL + C per uscire dal ciclo while True in cui si ricevono le notifiche 		
 	except KeyboardInterrupt:												
-		print("Interruzione da tastiera")
\ No newline at end of file
+		print("Interruzione da tastiera")
+	finally:
+		#l'intervallo impostato in debugfs vale per tutte le connessioni LE dell'host: si ripristina quello precedente
+		if intervallo_precedente is not None:
+			imposta_intervallo_connessione(*intervallo_precedente)
+
+	for nome_flusso, archivio in archivi_flussi.items():
+		occupazione = archivio.occupazione()
+		print("Archivio {}: {righe} righe, {byte_memoria} byte in memoria, {byte_disco} byte su disco".format(nome_flusso, **occupazione))
+		archivio.elimina()
+	if contenitore is not None:
+		contenitore.chiudi()
+	if catalogo is not None:
+		catalogo.chiudi()
+	if traccia is not None:
+		traccia.esporta_chrome(args.traccia)
+		profilazione.stampa_percentili(traccia.percentili())
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+
+"""Archivio in memoria delle serie temporali di ciascun flusso per l'analisi durante la ricezione: valori interi
+così come ricevuti in blocchi di array tipizzati, timestamp del dispositivo srotolati, selezione di un intervallo
+di tempo senza copie e scarico su disco dei blocchi più vecchi"""
+import os
+import math
+import bisect
+import shutil
+import tempfile
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from sensor_fusion import srotola_timestamp, MODULO_TIMESTAMP, QUATERNIONI_PER_PACCHETTO
+from caratteristiche_bluest import campi_flusso, valore_mancante
+
+#righe di ogni blocco: un blocco pieno non viene più modificato e può essere scaricato su disco
+RIGHE_PER_BLOCCO = 4096
+#blocchi pieni tenuti in memoria per flusso (None = nessuno scarico), i più vecchi sono salvati in file .npy
+#e rimappati in sola lettura
+BLOCCHI_IN_MEMORIA = 64
+#il tempo di ogni riga è salvato come scostamento senza segno a 32 bit dal tempo iniziale del blocco
+LIMITE_SCOSTAMENTO = 1 << 32
+#suddivisioni del tick per i flussi con tempi frazionari: i quaternioni espansi dal sensor fusion compact
+#sono distribuiti a terzi dell'intervallo tra un pacchetto e il successivo
+SUDDIVISIONI_TEMPO = {"quaternioni": QUATERNIONI_PER_PACCHETTO}
+
+def _richiedi_numpy():
+	if np is None:
+		raise ImportError("Per l'archivio in memoria è necessario il pacchetto numpy")
+
+class ArchivioFlusso:
+	#i campi sono quelli della tabella delle caratteristiche (colonna, formato struct, divisore, unità): ogni colonna
+	#è salvata nel tipo del pacchetto (2 byte per asse di accelerometro, giroscopio e magnetometro) moltiplicando il
+	#valore scalato per il divisore, più 4 byte di tempo per riga. I blocchi sono preallocati, quindi accodare una
+	#riga costa O(1) ammortizzato. Un solo thread scrive (il ciclo di ricezione o il thread dei sink della
+	#pipeline); una riga è visibile ai lettori solo dopo essere stata scritta nel blocco.
+	#Si usa come un sink dei flussi e resta disponibile dopo chiudi(), così lo stesso archivio continua tra una
+	#connessione e la successiva (i timestamp restano monotoni anche se il dispositivo riparte da 0).
+	#Con grezzi=True le righe scritte contengono già i valori interi ricevuti, salvati senza conversione
+	def __init__(self, nome, campi, suddivisioni=1, righe_per_blocco=RIGHE_PER_BLOCCO, blocchi_in_memoria=BLOCCHI_IN_MEMORIA, cartella=None,
+		grezzi=False):
+		_richiedi_numpy()
+		self.nome = nome
+		self.campi = list(campi)
+		self.colonne = [c[0] for c in self.campi]
+		self.divisori = [c[2] for c in self.campi]
+		#fattori applicati alle righe scritte
+		self.moltiplicatori = [1] * len(self.campi) if grezzi else self.divisori
+		self.unita = [c[3] for c in self.campi]
+		self.suddivisioni = suddivisioni
+		self.righe_per_blocco = righe_per_blocco
+		self.blocchi_in_memoria = blocchi_in_memoria
+		#cartella dei blocchi scaricati su disco (None = cartella temporanea creata al primo scarico)
+		self.cartella = cartella
+		self.cartella_temporanea = None
+		self.dtype = np.dtype([("t", "<u4")] + [(c[0], "<" + c[1]) for c in self.campi])
+		self.mancanti = [valore_mancante(c[1]) for c in self.campi]
+		#per ogni colonna intera (fattore della riga scritta, minimo, massimo, valore mancante), None per le colonne float
+		self.conversioni = [(None,) * 4 if self.dtype[colonna].kind == "f" else (d, int(np.iinfo(self.dtype[colonna]).min),
+			int(np.iinfo(self.dtype[colonna]).max), m) for colonna, d, m in zip(self.colonne, self.moltiplicatori, self.mancanti)]
+		#blocchi (array strutturati in memoria o mappati dal file), tempo assoluto in suddivisioni di tick a cui
+		#si riferisce la colonna "t" e righe occupate di ciascun blocco
+		self.blocchi = []
+		self.basi = []
+		self.lunghezze = []
+		self.primo_in_memoria = 0
+		self.righe = 0
+		#ultimo timestamp srotolato (in tick)
+		self.precedente = None
+
+	def scrivi(self, righe):
+		#righe dei flussi: (timestamp, time, valori...); di solito una per notifica, quindi la conversione è fatta
+		#riga per riga senza creare array temporanei
+		conversioni = self.conversioni
+		for riga in righe:
+			tempo = srotola_timestamp(riga[0], self.precedente)
+			self.precedente = tempo
+			assoluto = int(round(tempo * self.suddivisioni))
+			if (not self.lunghezze or self.lunghezze[-1] == self.righe_per_blocco
+				or assoluto - self.basi[-1] >= LIMITE_SCOSTAMENTO):
+				self._nuovo_blocco(assoluto)
+			occupate = self.lunghezze[-1]
+			valori = [v if d is None else (m if v != v else min(max(int(round(v * d)), minimo), massimo))
+				for v, (d, minimo, massimo, m) in zip(riga[2:], conversioni)]
+			self.blocchi[-1][occupate] = (assoluto - self.basi[-1],) + tuple(valori)
+			self.lunghezze[-1] = occupate + 1
+			self.righe += 1
+
+	def scrivi_blocco(self, dati):
+		#accoda un array numpy (N, colonne) con timestamp e time nelle prime due colonne, come le righe
+		if len(dati) == 0:
+			return
+		dati = np.asarray(dati, dtype=float)
+		self._accoda(self._srotola(dati[:, 0]), dati[:, 2:])
+
+	def chiudi(self):
+		#i dati restano consultabili: lo spazio su disco si libera con elimina()
+		pass
+
+	def _srotola(self, tempi):
+		#come srotola_timestamp_array, ma anche per i tempi frazionari dei flussi espansi
+		delta = np.empty(len(tempi))
+		delta[1:] = np.diff(tempi) % MODULO_TIMESTAMP
+		delta[0] = srotola_timestamp(tempi[0], self.precedente)
+		tempi = np.cumsum(delta)
+		self.precedente = float(tempi[-1])
+		return tempi
+
+	def _accoda(self, tempi, valori):
+		nuovi = np.empty(len(tempi), dtype=self.dtype)
+		for i, colonna in enumerate(self.colonne):
+			valori_colonna = valori[:, i] * self.moltiplicatori[i] if self.moltiplicatori[i] != 1 else valori[:, i]
+			tipo = self.dtype[colonna]
+			if tipo.kind != "f":
+				limiti = np.iinfo(tipo)
+				valori_colonna = np.clip(np.rint(valori_colonna), limiti.min, limiti.max)
+				valori_colonna[np.isnan(valori_colonna)] = self.mancanti[i]
+			nuovi[colonna] = valori_colonna
+		assoluti = np.rint(tempi * self.suddivisioni).astype(np.int64)
+		inizio = 0
+		while inizio < len(nuovi):
+			if (not self.lunghezze or self.lunghezze[-1] == self.righe_per_blocco
+				or assoluti[inizio] - self.basi[-1] >= LIMITE_SCOSTAMENTO):
+				self._nuovo_blocco(int(assoluti[inizio]))
+			base, occupate = self.basi[-1], self.lunghezze[-1]
+			fine = min(len(nuovi), inizio + self.righe_per_blocco - occupate)
+			#le righe troppo lontane dal tempo iniziale del blocco vanno nel blocco successivo
+			fine = inizio + int(np.searchsorted(assoluti[inizio:fine], base + LIMITE_SCOSTAMENTO))
+			nuovi["t"][inizio:fine] = assoluti[inizio:fine] - base
+			self.blocchi[-1][occupate:occupate + fine - inizio] = nuovi[inizio:fine]
+			self.lunghezze[-1] = occupate + fine - inizio
+			self.righe += fine - inizio
+			inizio = fine
+
+	def _nuovo_blocco(self, base):
+		#le liste sono allungate in quest'ordine perchè i lettori scorrono i blocchi fino a len(self.lunghezze)
+		self.blocchi.append(np.empty(self.righe_per_blocco, dtype=self.dtype))
+		self.basi.append(base)
+		self.lunghezze.append(0)
+		if self.blocchi_in_memoria is None:
+			return
+		while len(self.blocchi) - 1 - self.primo_in_memoria > self.blocchi_in_memoria:
+			self._scarica(self.primo_in_memoria)
+			self.primo_in_memoria += 1
+
+	def _scarica(self, indice):
+		#il blocco pieno è salvato in un file .npy e sostituito dalla sua mappatura in sola lettura: le pagine
+		#restano nella cache del sistema operativo, che le può liberare quando serve memoria
+		if self.cartella is None:
+			if self.cartella_temporanea is None:
+				self.cartella_temporanea = tempfile.mkdtemp(prefix="archivio_" + self.nome + "_")
+			cartella = self.cartella_temporanea
+		else:
+			cartella = self.cartella
+			os.makedirs(cartella, exist_ok=True)
+		percorso = os.path.join(cartella, "{}_{:06d}.npy".format(self.nome, indice))
+		np.save(percorso, self.blocchi[indice][:self.lunghezze[indice]])
+		self.blocchi[indice] = np.load(percorso, mmap_mode="r")
+
+	def fette(self, inizio=None, fine=None):
+		#parti dei blocchi con le righe nell'intervallo [inizio, fine) di timestamp srotolati (in tick, None = senza
+		#limite): lista di (base, record) in cui record è una vista senza copie di un blocco e base il tempo,
+		#in suddivisioni di tick, a cui si riferisce la sua colonna "t"
+		blocchi = len(self.lunghezze)
+		da = None if inizio is None else int(math.ceil(inizio * self.suddivisioni))
+		a = None if fine is None else int(math.ceil(fine * self.suddivisioni))
+		primo = 0 if da is None else max(0, bisect.bisect_right(self.basi, da, 0, blocchi) - 1)
+		risultato = []
+		for indice in range(primo, blocchi):
+			base = self.basi[indice]
+			if a is not None and base >= a:
+				break
+			record = self.blocchi[indice][:self.lunghezze[indice]]
+			s = 0 if da is None or da <= base else self._cerca(record, da - base)
+			e = len(record) if a is None else self._cerca(record, a - base)
+			if e > s:
+				risultato.append((base, record[s:e]))
+		return risultato
+
+	def _cerca(self, record, scostamento):
+		if scostamento >= LIMITE_SCOSTAMENTO:
+			return len(record)
+		return int(np.searchsorted(record["t"], scostamento))
+
+	def tempi(self, base, record):
+		#timestamp srotolati (in tick) delle righe di una fetta
+		return (base + record["t"].astype(np.int64)) / float(self.suddivisioni)
+
+	def valori(self, record):
+		#valori scalati (N, colonne) delle righe di una fetta, con nan al posto dei campi mancanti
+		risultato = np.empty((len(record), len(self.colonne)))
+		for i, colonna in enumerate(self.colonne):
+			risultato[:, i] = record[colonna]
+			if self.dtype[colonna].kind != "f":
+				risultato[record[colonna] == self.mancanti[i], i] = np.nan
+			if self.divisori[i] != 1:
+				risultato[:, i] /= self.divisori[i]
+		return risultato
+
+	def seleziona(self, inizio=None, fine=None):
+		#copia delle righe nell'intervallo come (tempi (N,), valori scalati (N, colonne))
+		fette = self.fette(inizio, fine)
+		if not fette:
+			return np.empty(0), np.empty((0, len(self.colonne)))
+		return (np.concatenate([self.tempi(base, record) for base, record in fette]),
+			np.concatenate([self.valori(record) for _, record in fette]))
+
+	def __len__(self):
+		return self.righe
+
+	def occupazione(self):
+		#righe archiviate e byte occupati in memoria (blocchi preallocati) e su disco
+		su_disco = sum(self.lunghezze[:self.primo_in_memoria])
+		return {"righe": self.righe, "byte_per_riga": self.dtype.itemsize,
+			"byte_memoria": (len(self.blocchi) - self.primo_in_memoria) * self.righe_per_blocco * self.dtype.itemsize,
+			"byte_disco": su_disco * self.dtype.itemsize, "blocchi_su_disco": self.primo_in_memoria}
+
+	def elimina(self):
+		#svuota l'archivio e cancella i blocchi scaricati nella cartella temporanea
+		self.blocchi, self.basi, self.lunghezze = [], [], []
+		self.primo_in_memoria = 0
+		self.righe = 0
+		self.precedente = None
+		if self.cartella_temporanea is not None:
+			shutil.rmtree(self.cartella_temporanea, ignore_errors=True)
+			self.cartella_temporanea = None
+
+def crea_archivio(nome_flusso, **opzioni):
+	#archivio di un flusso di Ricezione_notifiche, con i campi presi dalla tabella delle caratteristiche
+	return ArchivioFlusso(nome_flusso, campi_flusso(nome_flusso), SUDDIVISIONI_TEMPO.get(nome_flusso, 1), **opzioni)
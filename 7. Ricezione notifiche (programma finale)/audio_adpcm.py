@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""Decodifica in streaming dell'audio ADPCM del SensorTile (feature "ADPCM Audio" e "ADPCM Sync") con salvataggio
+a blocchi in file WAV o PCM grezzo e resoconto dei pacchetti persi"""
+import wave
+import struct
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+#audio mono a 8 kHz: ogni pacchetto contiene 20 byte, cioè 40 codici IMA ADPCM da 4 bit (prima il nibble basso),
+#e diventa 40 campioni PCM a 16 bit; i pacchetti audio non hanno timestamp
+FREQUENZA = 8000
+BYTE_PER_PACCHETTO = 20
+CAMPIONI_PER_PACCHETTO = 2 * BYTE_PER_PACCHETTO
+#il pacchetto di sincronizzazione contiene indice del passo (2 byte) e campione predetto (4 byte) con cui
+#riprendere la decodifica dal pacchetto audio successivo
+FORMATO_SINCRONIZZAZIONE = struct.Struct("<hi")
+#pacchetti decodificati insieme (0.25 s di audio)
+PACCHETTI_PER_BLOCCO = 50
+#ritardo dell'audio ricevuto rispetto all'orologio dell'host oltre il quale si considera un buco nel flusso (s)
+SOGLIA_BUCO = 0.1
+
+#tabelle dell'algoritmo IMA ADPCM
+VARIAZIONI_INDICE = [-1, -1, -1, -1, 2, 4, 6, 8] * 2
+PASSI = [7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45, 50, 55, 60, 66, 73, 80, 88, 97,
+	107, 118, 130, 143, 157, 173, 190, 209, 230, 253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876,
+	963, 1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327, 3660, 4026, 4428, 4871, 5358,
+	5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086,
+	29794, 32767]
+#indice del passo successivo per ogni (indice, codice): prossimo[indice * 16 + codice]
+_PROSSIMO_INDICE = [min(len(PASSI) - 1, max(0, i + VARIAZIONI_INDICE[c])) for i in range(len(PASSI)) for c in range(16)]
+
+def _richiedi_numpy():
+	if np is None:
+		raise ImportError("Per la decodifica dell'audio è necessario il pacchetto numpy")
+
+def _limita(valore):
+	return -32768 if valore < -32768 else (32767 if valore > 32767 else valore)
+
+def decodifica_adpcm(dati, indice=0, predetto=0):
+	#decodifica di un blocco di pacchetti audio concatenati a partire dallo stato (indice, predetto):
+	#restituisce (campioni int16, indice, predetto) con lo stato per il blocco successivo.
+	#Solo l'indice del passo richiede un ciclo (è una ricorsione su 89 stati, fatta con una tabella);
+	#differenze e campioni sono calcolati in modo vettoriale, il campione predetto come somma cumulativa
+	#che va ricalcolata in sequenza solo dal primo campione che esce dai 16 bit
+	_richiedi_numpy()
+	byte = np.frombuffer(dati, dtype=np.uint8)
+	codici = np.empty(2 * len(byte), dtype=np.int32)
+	codici[0::2] = byte & 0x0F
+	codici[1::2] = byte >> 4
+	indici = [0] * len(codici)
+	prossimo = _PROSSIMO_INDICE
+	for n, codice in enumerate(codici.tolist()):
+		indici[n] = indice
+		indice = prossimo[indice * 16 + codice]
+	passi = np.asarray(PASSI, dtype=np.int64)[indici]
+	differenze = passi >> 3
+	differenze += np.where(codici & 4, passi, 0)
+	differenze += np.where(codici & 2, passi >> 1, 0)
+	differenze += np.where(codici & 1, passi >> 2, 0)
+	differenze = np.where(codici & 8, -differenze, differenze)
+	campioni = predetto + np.cumsum(differenze)
+	fuori = np.flatnonzero((campioni < -32768) | (campioni > 32767))
+	if len(fuori):
+		primo = int(fuori[0])
+		valore = int(campioni[primo - 1]) if primo else predetto
+		coda = []
+		for differenza in differenze[primo:].tolist():
+			valore = _limita(valore + differenza)
+			coda.append(valore)
+		campioni[primo:] = coda
+	if len(campioni):
+		predetto = int(campioni[-1])
+	return campioni.astype(np.int16), indice, predetto
+
+def codifica_adpcm(campioni, indice=0, predetto=0):
+	#codifica IMA ADPCM di una sequenza di campioni a 16 bit (usata dal bluepy-helper simulato):
+	#restituisce (byte, indice, predetto); i campioni devono essere in numero pari
+	codici = []
+	for campione in campioni:
+		passo = PASSI[indice]
+		differenza = campione - predetto
+		codice = 0
+		if differenza < 0:
+			codice = 8
+			differenza = -differenza
+		quantizzata = passo >> 3
+		if differenza >= passo:
+			codice |= 4
+			differenza -= passo
+			quantizzata += passo
+		if differenza >= passo >> 1:
+			codice |= 2
+			differenza -= passo >> 1
+			quantizzata += passo >> 1
+		if differenza >= passo >> 2:
+			codice |= 1
+			quantizzata += passo >> 2
+		predetto = _limita(predetto - quantizzata if codice & 8 else predetto + quantizzata)
+		indice = _PROSSIMO_INDICE[indice * 16 + codice]
+		codici.append(codice)
+	return bytes(codici[i] | (codici[i + 1] << 4) for i in range(0, len(codici), 2)), indice, predetto
+
+class ScrittoreWAV:
+	#file WAV mono a 16 bit; ogni blocco è accodato con writeframes(), che aggiorna anche le lunghezze
+	#nell'intestazione, così il file resta leggibile durante la registrazione
+	def __init__(self, nome_file, frequenza=FREQUENZA):
+		self.nome_file = nome_file
+		self.file = wave.open(nome_file, "wb")
+		self.file.setnchannels(1)
+		self.file.setsampwidth(2)
+		self.file.setframerate(frequenza)
+
+	def scrivi_blocco(self, campioni):
+		self.file.writeframes(campioni.astype("<i2").tobytes())
+
+	def chiudi(self):
+		self.file.close()
+
+class ScrittorePCM:
+	#campioni PCM a 16 bit little endian senza intestazione (es. per sox o aplay -f S16_LE -r 8000)
+	def __init__(self, nome_file):
+		self.nome_file = nome_file
+		self.file = open(nome_file, "ab")
+
+	def scrivi_blocco(self, campioni):
+		self.file.write(campioni.astype("<i2").tobytes())
+		self.file.flush()
+
+	def chiudi(self):
+		self.file.close()
+
+class DecodificatoreADPCM:
+	#riceve nell'ordine di arrivo i pacchetti audio e quelli di sincronizzazione, accumula i pacchetti audio e li
+	#decodifica a blocchi di PACCHETTI_PER_BLOCCO scrivendo i campioni sugli scrittori.
+	#I pacchetti audio non hanno un contatore, quindi le perdite sono stimate confrontando i campioni ricevuti con
+	#il tempo trascorso: quando l'audio è in ritardo di più di SOGLIA_BUCO si conta un buco (underrun) e, con
+	#riempi_silenzio, i pacchetti mancanti sono sostituiti da silenzio così il file resta allineato al tempo
+	def __init__(self, scrittori, pacchetti_per_blocco=PACCHETTI_PER_BLOCCO, riempi_silenzio=True, soglia_buco=SOGLIA_BUCO):
+		self.scrittori = list(scrittori)
+		self.pacchetti_per_blocco = pacchetti_per_blocco
+		self.riempi_silenzio = riempi_silenzio
+		self.soglia_buco = soglia_buco
+		self.indice = 0
+		self.predetto = 0
+		self.in_attesa = []
+		self.inizio = None
+		self.campioni = 0
+		self.pacchetti = 0
+		self.persi = 0
+		self.buchi = 0
+		self.sincronizzazioni = 0
+		self.scartati = 0
+
+	def audio(self, data, ora):
+		#pacchetto audio ricevuto all'istante "ora" (secondi, time.time())
+		if len(data) != BYTE_PER_PACCHETTO:
+			self.scartati += 1
+			return
+		if self.inizio is None:
+			self.inizio = ora
+		ritardo = ora - self.inizio - (self.campioni + len(self.in_attesa) * CAMPIONI_PER_PACCHETTO) / float(FREQUENZA)
+		if ritardo > self.soglia_buco:
+			mancanti = int(round(ritardo * FREQUENZA / CAMPIONI_PER_PACCHETTO))
+			self.buchi += 1
+			self.persi += mancanti
+			self.svuota()
+			if self.riempi_silenzio:
+				self._scrivi(np.zeros(mancanti * CAMPIONI_PER_PACCHETTO, dtype=np.int16))
+			else:
+				self.inizio += mancanti * CAMPIONI_PER_PACCHETTO / float(FREQUENZA)
+		elif ritardo < -self.soglia_buco:
+			#il dispositivo è più veloce dell'orologio dell'host (o i primi pacchetti sono arrivati in ritardo):
+			#il riferimento viene riallineato ai campioni ricevuti
+			self.inizio += ritardo
+		self.in_attesa.append(data)
+		self.pacchetti += 1
+		if len(self.in_attesa) >= self.pacchetti_per_blocco:
+			self.svuota()
+
+	def sincronizza(self, data):
+		#i parametri valgono dal pacchetto audio successivo: quelli già ricevuti sono decodificati con lo stato attuale
+		if len(data) != FORMATO_SINCRONIZZAZIONE.size:
+			self.scartati += 1
+			return
+		self.svuota()
+		self.indice, self.predetto = FORMATO_SINCRONIZZAZIONE.unpack(data)
+		self.indice = min(len(PASSI) - 1, max(0, self.indice))
+		self.sincronizzazioni += 1
+
+	def svuota(self):
+		if not self.in_attesa:
+			return
+		campioni, self.indice, self.predetto = decodifica_adpcm(b"".join(self.in_attesa), self.indice, self.predetto)
+		self.in_attesa = []
+		self._scrivi(campioni)
+
+	def _scrivi(self, campioni):
+		self.campioni += len(campioni)
+		for scrittore in self.scrittori:
+			scrittore.scrivi_blocco(campioni)
+
+	def resoconto(self):
+		return {"pacchetti": self.pacchetti, "campioni": self.campioni, "durata": self.campioni / float(FREQUENZA),
+			"persi": self.persi, "buchi": self.buchi, "sincronizzazioni": self.sincronizzazioni, "scartati": self.scartati}
+
+	def chiudi(self):
+		self.svuota()
+		for scrittore in self.scrittori:
+			scrittore.chiudi()
+		return self.resoconto()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""Confronto delle notifiche ricevute al secondo con e senza negoziazione di MTU e intervallo di connessione,
+usando il bluepy-helper simulato (helper_simulato.py) al posto del SensorTile.
+
+Il risultato è fissato dal modello del helper simulato (PACCHETTI_PER_EVENTO notifiche per evento di connessione,
+FREQUENZA_AGM pacchetti prodotti al secondo): non misura il collegamento radio, ma verifica che la ricezione
+riceva tutte le notifiche che il modello consegna con l'intervallo proposto"""
+import os
+import time
+import shutil
+import tempfile
+import argparse
+
+#la cartella debugfs simulata va indicata prima di importare i moduli che la usano
+cartella_debugfs = tempfile.mkdtemp(prefix="debugfs_")
+os.environ["BLUETOOTH_DEBUGFS"] = cartella_debugfs
+
+import Ricezione_notifiche as rn
+import negoziazione
+import helper_simulato
+
+class Contatore(rn.DefaultDelegate):
+	def __init__(self):
+		rn.DefaultDelegate.__init__(self)
+		self.ricevute = 0
+
+	def handleNotification(self, cHandle, data):
+		self.ricevute += 1
+
+def prova(durata, mtu=None, intervallo=None):
+	#una sessione con il helper simulato: restituisce i metadati della negoziazione e le notifiche al secondo
+	if intervallo is not None:
+		negoziazione.imposta_intervallo_connessione(*intervallo)
+	conn = rn.Peripheral("c0:86:1d:31:45:48", rn.ADDR_TYPE_RANDOM)
+	try:
+		metadati = negoziazione.negozia_connessione(conn, mtu, intervallo)
+		contatore = Contatore()
+		conn.withDelegate(contatore)
+		ch_acc_gyr_magn = conn.getCharacteristics(0x0001, 0xFFFF, "00e00000-0001-11e1-ac36-0002a5d5c51b")[0]
+		conn.enableNotifications([ch_acc_gyr_magn])
+		inizio = time.time()
+		while time.time() - inizio < durata:
+			conn.waitForNotifications(0.1)
+		return metadati, contatore.ricevute / (time.time() - inizio)
+	finally:
+		conn.disconnect()
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--durata", type=float, default=5.0, help="durata di ogni prova in secondi")
+	parser.add_argument("--mtu", type=int, default=247, help="MTU richiesto nella prova con negoziazione")
+	parser.add_argument("--intervallo", type=float, nargs=2, default=[7.5, 15.0], metavar=("MINIMO", "MASSIMO"),
+		help="intervallo di connessione (ms) richiesto nella prova con negoziazione")
+	args = parser.parse_args()
+
+	#valori predefiniti di BlueZ: 30-50 ms
+	os.makedirs(os.path.join(cartella_debugfs, "hci0"))
+	for nome, valore in (("conn_min_interval", 24), ("conn_max_interval", 40)):
+		with open(os.path.join(cartella_debugfs, "hci0", nome), "w") as fp:
+			fp.write(str(valore))
+	rn.helperExe = os.path.join(os.path.abspath(os.path.dirname(__file__)), "helper_simulato.py")
+
+	print("Produzione del firmware simulato: {:.0f} pacchetti AGM/s, al massimo {} notifiche per evento di connessione".format(
+		helper_simulato.FREQUENZA_AGM, helper_simulato.PACCHETTI_PER_EVENTO))
+	try:
+		for descrizione, mtu, intervallo in (("predefinito", None, None), ("negoziato", args.mtu, args.intervallo)):
+			metadati, frequenza = prova(args.durata, mtu, intervallo)
+			#il helper simulato usa il massimo dell'intervallo proposto
+			attese = helper_simulato.notifiche_al_secondo(metadati["intervallo_proposto"][1])
+			print("{:12s} MTU {:4d}  intervallo proposto {:5.1f}-{:5.1f} ms  ricevute {:6.1f} notifiche/s (modello: {:6.1f})".format(
+				descrizione, metadati["mtu"], metadati["intervallo_proposto"][0], metadati["intervallo_proposto"][1], frequenza, attese))
+	finally:
+		shutil.rmtree(cartella_debugfs)
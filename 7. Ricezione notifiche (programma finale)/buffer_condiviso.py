@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+"""Buffer circolari in memoria condivisa per i processi che leggono i campioni in tempo reale"""
+import os
+import json
+import mmap
+import struct
+import tempfile
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+#intestazione: identificativo, versione, numero di colonne, capacità (in record), contatore di sequenza e
+#generazione. Il contatore è il numero totale di record scritti ed è l'unico campo modificato durante la ricezione;
+#la generazione identifica l'esecuzione che ha creato il buffer, così un lettore distingue un buffer rimasto
+#da un'esecuzione precedente da quello dell'esecuzione che attende
+FORMATO_INTESTAZIONE = struct.Struct('<4sHHQQQ')
+IDENTIFICATIVO = b'BLRB'
+VERSIONE = 2
+POSIZIONE_SEQUENZA = 16
+#dopo l'intestazione ci sono i nomi delle colonne separati da tabulazioni, i record partono da DIMENSIONE_INTESTAZIONE
+POSIZIONE_COLONNE = 64
+DIMENSIONE_INTESTAZIONE = 512
+#bacheca: intestazione (identificativo, versione, generazione, contatore di sequenza, lunghezza del contenuto)
+#seguita dal contenuto JSON dell'ultima pubblicazione; il contatore è dispari mentre il contenuto viene riscritto
+FORMATO_BACHECA = struct.Struct('<4sHQQI')
+IDENTIFICATIVO_BACHECA = b'BLBC'
+POSIZIONE_SEQUENZA_BACHECA = 14
+DIMENSIONE_BACHECA = 1 << 18
+#tentativi di lettura di un contenuto coerente prima di rinunciare
+TENTATIVI_BACHECA = 100
+
+def percorso_buffer(nome):
+	#su Linux /dev/shm è in RAM, altrimenti si usa la cartella temporanea
+	cartella = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+	return os.path.join(cartella, "sensortile_" + nome.replace(os.sep, "_"))
+
+def nuova_generazione():
+	#identificativo casuale (diverso da zero) di un'esecuzione
+	return int.from_bytes(os.urandom(8), "little") or 1
+
+class BufferCircolareScrittura:
+	#un solo processo scrive: i record (double) vengono scritti nello slot sequenza % capacità e solo
+	#dopo viene incrementato il contatore di sequenza, senza lock. Si usa come un sink dei flussi.
+	#Con scale (colonna, scala, offset, unità delle colonne dopo timestamp e time) le righe ricevute contengono
+	#i valori interi del pacchetto, convertiti prima di essere scritti così i lettori vedono sempre i valori scalati.
+	#Senza generazione ogni buffer ne riceve una nuova
+	def __init__(self, nome, colonne, capacita=65536, scale=None, generazione=None):
+		self.colonne = list(colonne)
+		self.capacita = capacita
+		self.conversioni = None
+		if scale is not None:
+			self.conversioni = [(1.0, 0.0)] * (len(self.colonne) - len(scale)) + [(s[1], s[2]) for s in scale]
+		self.record = struct.Struct('<{}d'.format(len(self.colonne)))
+		nomi = "\t".join(self.colonne).encode('utf-8')
+		if len(nomi) > DIMENSIONE_INTESTAZIONE - POSIZIONE_COLONNE:
+			raise ValueError("Troppe colonne per l'intestazione del buffer {}".format(nome))
+		self.percorso = percorso_buffer(nome)
+		self.generazione = nuova_generazione() if generazione is None else generazione
+		dimensione = DIMENSIONE_INTESTAZIONE + capacita * self.record.size
+		#un buffer rimasto dalla connessione precedente viene rimosso e non troncato: i lettori che lo
+		#hanno ancora mappato continuano a vedere i vecchi dati invece di ricevere SIGBUS
+		if os.path.exists(self.percorso):
+			os.unlink(self.percorso)
+		fd = os.open(self.percorso, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+		try:
+			os.ftruncate(fd, dimensione)
+			self.mappa = mmap.mmap(fd, dimensione)
+			self.inode = os.fstat(fd).st_ino
+		finally:
+			os.close(fd)
+		self.mappa[POSIZIONE_COLONNE:POSIZIONE_COLONNE + len(nomi)] = nomi
+		FORMATO_INTESTAZIONE.pack_into(self.mappa, 0, IDENTIFICATIVO, VERSIONE, len(self.colonne), capacita, 0, self.generazione)
+		self.sequenza = 0
+
+	def scrivi(self, righe):
+		for riga in righe:
+			posizione = DIMENSIONE_INTESTAZIONE + (self.sequenza % self.capacita) * self.record.size
+			if self.conversioni is None:
+				self.record.pack_into(self.mappa, posizione, *[float(valore) for valore in riga])
+			else:
+				self.record.pack_into(self.mappa, posizione, *[float(valore) * scala + offset
+					for valore, (scala, offset) in zip(riga, self.conversioni)])
+			self.sequenza += 1
+		#pubblicazione dei nuovi record
+		struct.pack_into('<Q', self.mappa, POSIZIONE_SEQUENZA, self.sequenza)
+
+	def chiudi(self):
+		#il file viene rimosso da /dev/shm (se non è già stato sostituito da un altro scrittore): i lettori che
+		#lo hanno mappato possono finire di leggere gli ultimi campioni, i nuovi lettori non lo trovano più
+		if self.mappa is not None:
+			self.mappa.close()
+			self.mappa = None
+			try:
+				if os.stat(self.percorso).st_ino == self.inode:
+					os.unlink(self.percorso)
+			except OSError:
+				pass
+
+class BufferCircolareLettura:
+	#vista in sola lettura di un buffer circolare; i dati sono esposti come array numpy (capacità, colonne)
+	#senza copie. Un lettore tiene traccia dell'ultima sequenza letta e chiede i record successivi.
+	#Con generazione viene accettato solo il buffer creato da quell'esecuzione (ValueError per un buffer di
+	#un'altra esecuzione o non ancora inizializzato, da riaprire più tardi)
+	def __init__(self, nome, generazione=None):
+		if np is None:
+			raise ImportError("Per leggere i buffer condivisi è necessario il pacchetto numpy")
+		self.percorso = percorso_buffer(nome)
+		fd = os.open(self.percorso, os.O_RDONLY)
+		try:
+			self.inode = os.fstat(fd).st_ino
+			self.mappa = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+		finally:
+			os.close(fd)
+		if len(self.mappa) < DIMENSIONE_INTESTAZIONE:
+			self.mappa.close()
+			raise ValueError("{} non è un buffer circolare valido".format(self.percorso))
+		identificativo, versione, n_colonne, self.capacita, _, self.generazione = FORMATO_INTESTAZIONE.unpack_from(self.mappa, 0)
+		if identificativo != IDENTIFICATIVO or versione != VERSIONE:
+			self.mappa.close()
+			raise ValueError("{} non è un buffer circolare valido".format(self.percorso))
+		if generazione is not None and self.generazione != generazione:
+			self.mappa.close()
+			raise ValueError("{} è di un'altra esecuzione".format(self.percorso))
+		nomi = bytes(self.mappa[POSIZIONE_COLONNE:DIMENSIONE_INTESTAZIONE]).rstrip(b'\x00').decode('utf-8')
+		self.colonne = nomi.split("\t") if nomi else []
+		self.dati = np.frombuffer(self.mappa, dtype='<f8', count=self.capacita * n_colonne,
+			offset=DIMENSIONE_INTESTAZIONE).reshape(self.capacita, n_colonne)
+
+	def sequenza(self):
+		return struct.unpack_from('<Q', self.mappa, POSIZIONE_SEQUENZA)[0]
+
+	def sostituito(self):
+		#True se lo scrittore ha chiuso il buffer o lo ha sostituito con uno nuovo (es. alla connessione successiva):
+		#dopo aver letto gli ultimi record il lettore va chiuso e riaperto
+		try:
+			return os.stat(self.percorso).st_ino != self.inode
+		except OSError:
+			return True
+
+	def leggi(self, da_sequenza):
+		#restituisce (nuova sequenza, viste, persi): le viste (una o due, se il buffer ha fatto il giro)
+		#contengono i record da da_sequenza alla sequenza corrente; persi è il numero di record già
+		#sovrascritti dallo scrittore e quindi non più disponibili
+		fine = self.sequenza()
+		inizio = max(da_sequenza, fine - self.capacita)
+		persi = inizio - da_sequenza
+		if fine <= inizio:
+			return fine, [], persi
+		a, b = inizio % self.capacita, fine % self.capacita
+		if a < b:
+			viste = [self.dati[a:b]]
+		else:
+			viste = [vista for vista in (self.dati[a:], self.dati[:b]) if len(vista)]
+		return fine, viste, persi
+
+	def copia(self, da_sequenza):
+		#come leggi() ma restituisce una copia contigua dei record; i record sovrascritti dallo scrittore
+		#durante la copia vengono scartati e contati tra i persi
+		fine, viste, persi = self.leggi(da_sequenza)
+		dati = np.concatenate(viste) if viste else np.empty((0, self.dati.shape[1]))
+		n = len(dati)
+		sovrascritti = min(n, max(0, self.sequenza() - self.capacita - (fine - n)))
+		return fine, dati[sovrascritti:], persi + sovrascritti
+
+	def ultimi(self, n):
+		#viste sugli ultimi n record scritti
+		fine = self.sequenza()
+		return self.leggi(max(0, fine - n))[1]
+
+	def ancora_validi(self, da_sequenza):
+		#dopo aver usato le viste il lettore controlla che lo scrittore non abbia sovrascritto i record letti
+		return self.sequenza() - da_sequenza <= self.capacita
+
+	def chiudi(self):
+		self.dati = None
+		self.mappa.close()
+
+class BachecaScrittura:
+	#file in memoria condivisa con l'ultima pubblicazione (un dizionario JSON) di un processo, es. i contatori delle
+	#metriche dei processi di raccolta di raccolta_multipla.py letti dall'aggregatore. Un solo processo scrive: il
+	#contatore di sequenza diventa dispari prima di riscrivere il contenuto e pari dopo, così un lettore che trova
+	#un valore dispari o diverso tra l'inizio e la fine della copia riprova (seqlock, senza lock tra i processi)
+	def __init__(self, nome, dimensione=DIMENSIONE_BACHECA, generazione=None):
+		self.percorso = percorso_buffer(nome)
+		self.generazione = nuova_generazione() if generazione is None else generazione
+		if os.path.exists(self.percorso):
+			os.unlink(self.percorso)
+		fd = os.open(self.percorso, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+		try:
+			os.ftruncate(fd, dimensione)
+			self.mappa = mmap.mmap(fd, dimensione)
+			self.inode = os.fstat(fd).st_ino
+		finally:
+			os.close(fd)
+		self.sequenza = 0
+		FORMATO_BACHECA.pack_into(self.mappa, 0, IDENTIFICATIVO_BACHECA, VERSIONE, self.generazione, 0, 0)
+
+	def pubblica(self, dati):
+		contenuto = json.dumps(dati).encode('utf-8')
+		if FORMATO_BACHECA.size + len(contenuto) > len(self.mappa):
+			raise ValueError("Pubblicazione di {} byte troppo lunga per la bacheca {}".format(len(contenuto), self.percorso))
+		struct.pack_into('<Q', self.mappa, POSIZIONE_SEQUENZA_BACHECA, self.sequenza + 1)
+		self.mappa[FORMATO_BACHECA.size:FORMATO_BACHECA.size + len(contenuto)] = contenuto
+		struct.pack_into('<I', self.mappa, POSIZIONE_SEQUENZA_BACHECA + 8, len(contenuto))
+		self.sequenza += 2
+		struct.pack_into('<Q', self.mappa, POSIZIONE_SEQUENZA_BACHECA, self.sequenza)
+
+	def chiudi(self):
+		#come per i buffer circolari il file viene rimosso se non è stato sostituito da un altro scrittore
+		if self.mappa is not None:
+			self.mappa.close()
+			self.mappa = None
+			try:
+				if os.stat(self.percorso).st_ino == self.inode:
+					os.unlink(self.percorso)
+			except OSError:
+				pass
+
+def leggi_bacheca(nome, generazione=None):
+	#ultima pubblicazione di una bacheca, None se la bacheca non esiste, è di un'altra esecuzione, non ha ancora
+	#pubblicazioni o viene riscritta durante tutti i tentativi
+	try:
+		fd = os.open(percorso_buffer(nome), os.O_RDONLY)
+	except OSError:
+		return None
+	try:
+		mappa = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+	except (OSError, ValueError):
+		return None
+	finally:
+		os.close(fd)
+	try:
+		if len(mappa) < FORMATO_BACHECA.size:
+			return None
+		identificativo, versione, generazione_bacheca, _, _ = FORMATO_BACHECA.unpack_from(mappa, 0)
+		if identificativo != IDENTIFICATIVO_BACHECA or versione != VERSIONE:
+			return None
+		if generazione is not None and generazione_bacheca != generazione:
+			return None
+		for _ in range(TENTATIVI_BACHECA):
+			sequenza, lunghezza = struct.unpack_from('<QI', mappa, POSIZIONE_SEQUENZA_BACHECA)
+			if sequenza == 0:
+				return None
+			if sequenza % 2:
+				continue
+			contenuto = bytes(mappa[FORMATO_BACHECA.size:FORMATO_BACHECA.size + lunghezza])
+			if struct.unpack_from('<Q', mappa, POSIZIONE_SEQUENZA_BACHECA)[0] == sequenza:
+				return json.loads(contenuto.decode('utf-8'))
+		return None
+	finally:
+		mappa.close()
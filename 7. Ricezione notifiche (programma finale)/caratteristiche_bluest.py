@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""Tabella delle caratteristiche BlueST del SensorTile: formato dei pacchetti, fattori di scala, unità di misura e
+nomi delle colonne di ciascuna feature, da cui sono generati una sola volta i decodificatori (struct.Struct
+precompilate, una per ogni lunghezza ammessa del pacchetto)"""
+import math
+import struct
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+#parte finale degli uuid delle feature del servizio "Base feature" ("Getting started with the BlueST protocol and SDK.pdf"):
+#i primi 8 caratteri sono la maschera di bit della feature nell'advertising
+UUID_BASE = "-0001-11e1-ac36-0002a5d5c51b"
+#costante per la conversione da radianti a gradi
+RAD_GRADI = 180 / math.pi
+#ogni pacchetto BlueST inizia con un timestamp senza segno a 16 bit
+FORMATO_TIMESTAMP = "<H"
+
+def _richiedi_numpy():
+	if np is None:
+		raise ImportError("Per la conversione vettoriale dei valori è necessario il pacchetto numpy")
+
+class Caratteristica:
+	#voce della tabella: campi è una lista di (colonna, formato struct, divisore, unità di misura) nell'ordine
+	#del pacchetto dopo il timestamp; il valore salvato è il valore ricevuto diviso per il divisore (1 = valore
+	#intero così com'è). I campi dopo i primi "obbligatori" possono mancare (feature con pacchetti di lunghezza
+	#variabile, es. evento dell'accelerometro e livello dei microfoni) e sono salvati come nan.
+	#Le feature senza campi (audio ADPCM, comandi dei motori, ...) sono nella tabella solo per uuid e nome.
+	#nell_annuncio è False per le caratteristiche specifiche del firmware, la cui presenza non si ricava
+	#dalla maschera delle feature trasmessa nell'advertising
+	def __init__(self, nome, feature, maschera, etichetta, campi=None, obbligatori=None, nell_annuncio=True):
+		self.nome = nome
+		self.feature = feature
+		self.maschera = maschera
+		self.nell_annuncio = nell_annuncio
+		self.uuid = "%08x" % maschera + UUID_BASE
+		self.etichetta = etichetta
+		self.campi = list(campi or [])
+		self.decodificabile = campi is not None
+		self.colonne = ["timestamp", "time"] + [c[0] for c in self.campi]
+		self.unita = [c[3] for c in self.campi]
+		self.divisori = tuple(c[2] for c in self.campi)
+		self.struttura = struct.Struct(FORMATO_TIMESTAMP + "".join(c[1] for c in self.campi))
+		#una struttura per ogni lunghezza ammessa, con i nan dei campi mancanti già pronti
+		if obbligatori is None:
+			obbligatori = len(self.campi)
+		self.varianti = {}
+		for n in range(obbligatori, len(self.campi) + 1):
+			variante = struct.Struct(FORMATO_TIMESTAMP + "".join(c[1] for c in self.campi[:n]))
+			self.varianti[variante.size] = (variante, (float("nan"),) * (len(self.campi) - n))
+
+	def annunciata(self, maschera):
+		#True se la maschera delle feature dell'advertising indica che la caratteristica è presente
+		#(per le caratteristiche composte devono esserci i bit di tutte le feature)
+		return not self.nell_annuncio or (maschera & self.maschera) == self.maschera
+
+	def decodifica(self, data):
+		#(timestamp, valori scalati...) di una notifica, None se la lunghezza del pacchetto non è prevista
+		valori = self.decodifica_grezza(data)
+		if valori is None:
+			return None
+		return (valori[0],) + tuple([v / d if d != 1 else v for v, d in zip(valori[1:], self.divisori)])
+
+	def decodifica_grezza(self, data):
+		#(timestamp, valori interi così come ricevuti...) di una notifica, con nan per i campi mancanti
+		variante = self.varianti.get(len(data))
+		if variante is None or not self.decodificabile:
+			return None
+		struttura, mancanti = variante
+		return struttura.unpack(data) + mancanti
+
+	def formatta(self, riga):
+		#testo della notifica decodificata per la stampa a console
+		return "\t\tTimestamp: {}\n".format(riga[0]) + "".join("\t\t{}: {} {}\n".format(colonna, valore, unita)
+			for (colonna, _, _, unita), valore in zip(self.campi, riga[1:]))
+
+_ASSI = ("X", "Y", "Z")
+
+#una voce per ogni feature elencata in "2. Identify sensortile services and characteristics" (stesso ordine),
+#più le caratteristiche composte usate dal firmware del SensorTile; nei pacchetti delle caratteristiche composte
+#i dati delle feature compaiono in ordine di bit decrescente
+TABELLA = [
+	Caratteristica("pedometro", "Pedometer", 0x00000001, "Pedometro",
+		[("passi", "I", 1, "passi"), ("frequenza", "H", 1, "passi/min")]),
+	Caratteristica("gesto_mems", "Mems Gesture", 0x00000002, "Gesto MEMS", [("gesto", "B", 1, "")]),
+	Caratteristica("gesto_prossimita", "Proximity Gesture", 0x00000004, "Gesto prossimita", [("gesto", "B", 1, "")]),
+	Caratteristica("posizione_trasporto", "Carry Position", 0x00000008, "Posizione di trasporto", [("posizione", "B", 1, "")]),
+	Caratteristica("attivita", "Activity detection", 0x00000010, "Attivita", [("attivita", "B", 1, "")]),
+	Caratteristica("bussola", "Compass", 0x00000040, "Bussola", [("angolo", "H", 100, "°")]),
+	Caratteristica("intensita_movimento", "Motion Intensity", 0x00000020, "Intensita del movimento", [("intensita", "B", 1, "")]),
+	#la parte scalare del quaternione è trasmessa solo da alcuni firmware
+	Caratteristica("sensor_fusion_float", "Sensor Fusion", 0x00000080, "Sensor Fusion float",
+		[("qi", "f", 1, ""), ("qj", "f", 1, ""), ("qk", "f", 1, ""), ("qs", "f", 1, "")], obbligatori=3),
+	Caratteristica("sensor_fusion_compact", "Sensor Fusion Compact", 0x00000100, "Sensor Fusion",
+		[(q + str(n), "h", 10000, "") for n in (1, 2, 3) for q in ("qi", "qj", "qk")]),
+	Caratteristica("caduta_libera", "Free Fall", 0x00000200, "Caduta libera", [("evento", "B", 1, "")]),
+	#l'evento e il numero di passi sono presenti o meno a seconda della lunghezza del pacchetto
+	Caratteristica("evento_accelerometro", "Accelerometer Event", 0x00000400, "Evento accelerometro",
+		[("evento", "B", 1, ""), ("passi", "H", 1, "passi")], obbligatori=1),
+	Caratteristica("beam_forming", "Beam Forming", 0x00000800, "Beam forming", [("direzione", "B", 1, "")]),
+	Caratteristica("sd_logging", "SD Logging", 0x00001000, "SD logging"),
+	Caratteristica("motore_passo_passo", "Stepper Motor", 0x00002000, "Motore passo passo"),
+	Caratteristica("motore_dc", "DC motor", 0x00004000, "Motore DC"),
+	Caratteristica("monossido_carbonio", "CO sensor", 0x00008000, "Monossido di carbonio", [("co", "I", 100, "ppm")]),
+	Caratteristica("temperatura_2", "Second Temperature", 0x00010000, "Seconda temperatura", [("temperatura", "h", 10, "°C")]),
+	Caratteristica("batteria", "Battery", 0x00020000, "Batteria",
+		[("livello", "H", 10, "%"), ("tensione", "h", 1000, "V"), ("corrente", "h", 1, "mA"), ("stato", "B", 1, "")]),
+	Caratteristica("temperatura", "Temperature", 0x00040000, "Temperatura", [("temperatura", "h", 10, "°C")]),
+	Caratteristica("umidita", "Humidity", 0x00080000, "Umidita", [("umidita", "H", 10, "%")]),
+	Caratteristica("pressione", "Pressure", 0x00100000, "Pressione", [("pressione", "i", 100, "mbar")]),
+	#stesse unità di accelerometro, giroscopio e magnetometro della caratteristica composta
+	Caratteristica("magnetometro_singolo", "Magnetometer", 0x00200000, "Magnetometro singolo",
+		[(a, "h", 10, "μT") for a in _ASSI]),
+	Caratteristica("giroscopio_singolo", "Gyroscope", 0x00400000, "Giroscopio singolo",
+		[(a, "h", 10, "dps") for a in _ASSI]),
+	Caratteristica("accelerometro_singolo", "Accelerometer", 0x00800000, "Accelerometro singolo",
+		[(a, "h", 1000, "g") for a in _ASSI]),
+	Caratteristica("luxmetro", "Luxmeter", 0x01000000, "Luxmetro", [("luminosita", "H", 1, "lux")]),
+	Caratteristica("prossimita", "Proximity", 0x02000000, "Prossimita", [("distanza", "H", 1, "mm")]),
+	#un byte per microfono
+	Caratteristica("livello_microfoni", "Microphone Level", 0x04000000, "Livello microfoni",
+		[("microfono" + str(n), "B", 1, "dB") for n in (1, 2, 3, 4)], obbligatori=1),
+	#l'audio ADPCM non ha timestamp e va decodificato insieme ai parametri di sincronizzazione
+	Caratteristica("audio_adpcm", "ADPCM Audio", 0x08000000, "Audio ADPCM"),
+	Caratteristica("direzione_arrivo", "Direction of arrival", 0x10000000, "Direzione di arrivo", [("angolo", "h", 1, "°")]),
+	Caratteristica("interruttore", "Switch", 0x20000000, "Interruttore", [("stato", "B", 1, "")]),
+	Caratteristica("sincronizzazione_adpcm", "ADPCM Sync", 0x40000000, "Sincronizzazione ADPCM"),
+	Caratteristica("analogico", "Analog", 0x80000000, "Analogico"),
+	Caratteristica("temperatura_pressione", "Temperature and pressure", 0x00140000, "Temperatura e pressione",
+		[("pressione", "i", 100, "mbar"), ("temperatura", "h", 10, "°C")]),
+	Caratteristica("acc_giro_magn", "Accelerometer, gyroscope and magnetometer", 0x00e00000, "Accelerometro giroscopio magnetometro",
+		[("acc_" + a, "h", 1000, "g") for a in _ASSI] + [("gyr_" + a, "h", 10, "dps") for a in _ASSI] + [("magn_" + a, "h", 10, "μT") for a in _ASSI]),
+	Caratteristica("pitch_roll", "Pitch and roll", 0x00ee0000, "Pitch e roll",
+		[("pitch", "h", 8192 / RAD_GRADI, "°"), ("roll", "h", 8192 / RAD_GRADI, "°")], nell_annuncio=False),
+]
+
+PER_UUID = {c.uuid: c for c in TABELLA}
+PER_NOME = {c.nome: c for c in TABELLA}
+
+#servizi BlueST e caratteristiche che non sono feature ("2. Identify sensortile services and characteristics"),
+#per dare un nome a tutto l'albero GATT; i servizi e le caratteristiche standard hanno il nome di uuids.json
+SERVIZI = {
+	"00000000-0001-11e1-9ab4-0002a5d5c51b": "Base feature",
+	"00000000-000e-11e1-9ab4-0002a5d5c51b": "Debug",
+	"00000000-000f-11e1-9ab4-0002a5d5c51b": "Configuration",
+	"00000000-0002-11e1-9ab4-0002a5d5c51b": "Extend feature",
+}
+ALTRE_CARATTERISTICHE = {
+	"00000001-000e-11e1-ac36-0002a5d5c51b": "Debug characteristic 1",
+	"00000002-000e-11e1-ac36-0002a5d5c51b": "Debug characteristic 2",
+	"00000002-000f-11e1-ac36-0002a5d5c51b": "Configuration characteristic",
+}
+
+#caratteristiche con una decodifica dedicata in elabora_notifica (flussi derivati, filtri sull'host, ...)
+DECODIFICA_DEDICATA = ["temperatura_pressione", "acc_giro_magn", "sensor_fusion_compact", "pitch_roll"]
+#caratteristiche decodificate soltanto tramite la tabella: il loro flusso ha lo stesso nome della caratteristica
+AGGIUNTIVE = [c for c in TABELLA if c.decodificabile and c.nome not in DECODIFICA_DEDICATA]
+
+#formato dei campi dei flussi salvati da elabora_notifica con una decodifica dedicata (stesse voci dei campi della
+#tabella); gli altri flussi hanno i campi della caratteristica con lo stesso nome. I flussi calcolati sull'host
+#(quaternioni completi, pitch e roll stimati dai filtri) non hanno un valore intero ricevuto e sono float
+CAMPI_FLUSSI = {
+	"temperatura_pressione": PER_NOME["temperatura_pressione"].campi,
+	"accelerometro": [(a, "h", 1000, "g") for a in _ASSI],
+	"giroscopio": [(a, "h", 10, "dps") for a in _ASSI],
+	"magnetometro": [(a, "h", 10, "μT") for a in _ASSI],
+	"sensor_fusion": PER_NOME["sensor_fusion_compact"].campi,
+	"quaternioni": [(q, "f", 1, "") for q in ("qs", "qi", "qj", "qk")] + [(a, "f", 1, "°") for a in ("roll", "pitch", "yaw")],
+	"pitch_roll": PER_NOME["pitch_roll"].campi,
+	"pitch_roll_host": [(a, "f", 1, "°") for a in ("pitch_complementare", "roll_complementare", "pitch_kalman", "roll_kalman")],
+}
+
+def valore_mancante(formato):
+	#valore intero che rappresenta un campo mancante (nan) quando si salvano i valori interi ricevuti: il minimo
+	#dei formati con segno, il massimo di quelli senza segno; nan per i formati float
+	if formato in "fd":
+		return float("nan")
+	bit = 8 * struct.calcsize("<" + formato)
+	return -(1 << (bit - 1)) if formato.islower() else (1 << bit) - 1
+
+def campi_flusso(nome_flusso):
+	#campi (colonna, formato struct, divisore, unità) di un flusso, nell'ordine delle colonne dopo timestamp e time
+	if nome_flusso in CAMPI_FLUSSI:
+		return CAMPI_FLUSSI[nome_flusso]
+	return PER_NOME[nome_flusso].campi
+
+def scale_flusso(nome_flusso):
+	#(colonna, scala, offset, unità) delle colonne dopo timestamp e time di un flusso salvato con i valori interi
+	#ricevuti: valore = grezzo * scala + offset (scala 1 per i flussi float calcolati sull'host)
+	return [(colonna, 1.0 / divisore, 0.0, unita) for colonna, _, divisore, unita in campi_flusso(nome_flusso)]
+
+def applica_scala(dati, scale):
+	#conversione vettoriale dei valori grezzi di un array (N, 2 + colonne) con timestamp e time nelle prime due colonne
+	_richiedi_numpy()
+	dati = np.array(dati, dtype=float)
+	dati[:, 2:] = dati[:, 2:] * np.array([s[1] for s in scale]) + np.array([s[2] for s in scale])
+	return dati
+
+def annunciate(maschera):
+	#caratteristiche della tabella presenti secondo la maschera delle feature dell'advertising
+	return [c for c in TABELLA if c.nell_annuncio and c.annunciata(maschera)]
+
+def per_uuid(uuid):
+	#voce della tabella per un uuid (stringa o UUID di bluepy), None se la caratteristica non è una feature nota
+	return PER_UUID.get(str(uuid).lower())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+"""Catalogo SQLite delle sessioni registrate: dispositivo, inizio e fine di ogni connessione, flussi salvati con
+righe e perdite, e punti di controllo periodici (ora, riga, posizione in byte nel file) per leggere un intervallo di
+tempo andando direttamente alla posizione giusta dei file"""
+import os
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import threading
+
+from contenitore import LettoreContenitore, ESTENSIONE as ESTENSIONE_CONTENITORE
+
+#nome del file del catalogo nella cartella dei dati
+NOME_CATALOGO = "catalogo.sqlite"
+#intervallo minimo tra due punti di controllo dello stesso flusso (s)
+INTERVALLO_PUNTI = 10.0
+#ritardo massimo previsto tra la ricezione di una notifica e la scrittura della riga (code della pipeline, s):
+#la lettura di un intervallo prosegue fino al primo punto di controllo successivo a fine + MARGINE_SCRITTURA
+MARGINE_SCRITTURA = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessioni (
+	id INTEGER PRIMARY KEY,
+	indirizzo TEXT NOT NULL,
+	inizio REAL NOT NULL,
+	fine REAL,
+	cartella TEXT,
+	scartati INTEGER NOT NULL DEFAULT 0,
+	degradati INTEGER NOT NULL DEFAULT 0,
+	metadati TEXT
+);
+CREATE TABLE IF NOT EXISTS flussi (
+	id INTEGER PRIMARY KEY,
+	sessione INTEGER NOT NULL REFERENCES sessioni(id),
+	nome TEXT NOT NULL,
+	file TEXT NOT NULL,
+	righe INTEGER NOT NULL DEFAULT 0,
+	byte INTEGER NOT NULL DEFAULT 0,
+	persi INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS punti (
+	flusso INTEGER NOT NULL REFERENCES flussi(id),
+	tempo REAL NOT NULL,
+	riga INTEGER NOT NULL,
+	posizione INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessioni_dispositivo ON sessioni (indirizzo, inizio);
+CREATE INDEX IF NOT EXISTS flussi_sessione ON flussi (sessione, nome);
+CREATE INDEX IF NOT EXISTS punti_tempo ON punti (flusso, tempo);
+"""
+
+class Catalogo:
+	#i punti di controllo sono registrati dal thread che scrive i file (thread dei sink della pipeline) e le
+	#sessioni dal ciclo di connessione: una sola connessione SQLite protetta da un lock, con una transazione
+	#per ogni scrittura così il catalogo resta valido anche se il programma si interrompe
+	def __init__(self, percorso):
+		self.percorso = percorso
+		self.lock = threading.Lock()
+		self.db = sqlite3.connect(percorso, check_same_thread=False)
+		with self.lock, self.db:
+			self.db.executescript(SCHEMA)
+
+	def _esegui(self, sql, parametri=()):
+		with self.lock, self.db:
+			return self.db.execute(sql, parametri).lastrowid
+
+	def _interroga(self, sql, parametri=()):
+		with self.lock:
+			return self.db.execute(sql, parametri).fetchall()
+
+	def apri_sessione(self, indirizzo, cartella=None, metadati=None, inizio=None):
+		#restituisce la sessione a cui registrare i flussi della connessione
+		inizio = time.time() if inizio is None else inizio
+		identificativo = self._esegui("INSERT INTO sessioni (indirizzo, inizio, cartella, metadati) VALUES (?, ?, ?, ?)",
+			(indirizzo.lower(), inizio, cartella, json.dumps(metadati) if metadati is not None else None))
+		return SessioneCatalogo(self, identificativo)
+
+	def sessioni(self, indirizzo=None, inizio=None, fine=None):
+		#sessioni (id, indirizzo, inizio, fine, scartati, degradati) che si sovrappongono all'intervallo [inizio, fine]
+		#(ore in secondi dall'epoch, None = senza limite); una sessione senza fine è stata interrotta e vale fino
+		#al suo ultimo punto di controllo
+		condizioni, parametri = [], []
+		if indirizzo is not None:
+			condizioni.append("indirizzo = ?")
+			parametri.append(indirizzo.lower())
+		if fine is not None:
+			condizioni.append("inizio <= ?")
+			parametri.append(fine)
+		if inizio is not None:
+			condizioni.append("COALESCE(fine, (SELECT MAX(p.tempo) FROM punti p JOIN flussi f ON p.flusso = f.id "
+				"WHERE f.sessione = sessioni.id), inizio) >= ?")
+			parametri.append(inizio)
+		return self._interroga("SELECT id, indirizzo, inizio, fine, scartati, degradati FROM sessioni" +
+			(" WHERE " + " AND ".join(condizioni) if condizioni else "") + " ORDER BY inizio", parametri)
+
+	def flussi(self, sessione):
+		#flussi (id, nome, file, righe, byte, persi) di una sessione
+		return self._interroga("SELECT id, nome, file, righe, byte, persi FROM flussi WHERE sessione = ? ORDER BY nome", (sessione,))
+
+	def tratti(self, indirizzo, nome_flusso, inizio, fine):
+		#parti dei file del flusso che contengono le righe ricevute tra inizio e fine (secondi dall'epoch):
+		#lista di (file, posizione iniziale, posizione finale o None = fino alla fine del file, ora del punto iniziale).
+		#Si parte dall'ultimo punto di controllo non successivo a inizio e ci si ferma al primo successivo
+		#a fine + MARGINE_SCRITTURA, quindi il tratto può contenere qualche riga in più da filtrare
+		risultato = []
+		for sessione in self.sessioni(indirizzo, inizio, fine):
+			for flusso in self._interroga("SELECT id, file FROM flussi WHERE sessione = ? AND nome = ?", (sessione[0], nome_flusso)):
+				da = self._interroga("SELECT posizione, tempo FROM punti WHERE flusso = ? AND tempo <= ? ORDER BY tempo DESC LIMIT 1",
+					(flusso[0], inizio))
+				a = self._interroga("SELECT posizione FROM punti WHERE flusso = ? AND tempo > ? ORDER BY tempo LIMIT 1",
+					(flusso[0], fine + MARGINE_SCRITTURA))
+				posizione, tempo = da[0] if da else (0, sessione[2])
+				risultato.append((flusso[1], posizione, a[0][0] if a else None, tempo))
+		return risultato
+
+	def leggi(self, indirizzo, nome_flusso, inizio, fine):
+		#righe (lista di stringhe separate da tabulazioni) del flusso ricevute tra inizio e fine: i file sono letti solo
+		#nei tratti indicati dai punti di controllo e le righe sono filtrate con l'ora dell'host (colonna "time",
+		#HHMMSS.ffffff) ricostruendo la data a partire dall'ora del punto di controllo iniziale
+		righe = []
+		for nome_file, posizione, posizione_finale, tempo in self.tratti(indirizzo, nome_flusso, inizio, fine):
+			try:
+				if nome_file.endswith(ESTENSIONE_CONTENITORE):
+					#i punti di controllo di un contenitore giornaliero sono posizioni di record
+					testo = LettoreContenitore(nome_file).righe(nome_flusso, posizione, posizione_finale)
+				else:
+					with open(nome_file, "rb") as fp:
+						fp.seek(posizione)
+						dati = fp.read() if posizione_finale is None else fp.read(posizione_finale - posizione)
+					testo = dati.decode("utf-8").splitlines()
+			except (IOError, ValueError):
+				print("Errore di I/O sul file.")
+				continue
+			punto = datetime.datetime.fromtimestamp(tempo)
+			giorno = punto.replace(hour=0, minute=0, second=0, microsecond=0)
+			precedente = (punto - giorno).total_seconds()
+			for riga in testo:
+				campi = riga.split("\t")
+				if len(campi) < 2:
+					continue
+				ora = _ora_del_giorno(campi[1])
+				if ora is None:
+					continue
+				#dopo la mezzanotte l'ora del giorno riparte da 0 (una riga ricevuta poco prima del punto di controllo
+				#può invece essere del giorno precedente)
+				if ora < precedente - 12 * 3600:
+					giorno += datetime.timedelta(days=1)
+				elif ora > precedente + 12 * 3600:
+					giorno -= datetime.timedelta(days=1)
+				precedente = ora
+				istante = time.mktime(giorno.timetuple()) + ora
+				if inizio <= istante <= fine:
+					righe.append(riga)
+		return righe
+
+	def chiudi(self):
+		with self.lock:
+			self.db.close()
+
+class SessioneCatalogo:
+	def __init__(self, catalogo, identificativo):
+		self.catalogo = catalogo
+		self.id = identificativo
+		self.indici = {}
+
+	def flusso(self, nome_flusso, nome_file, intervallo=INTERVALLO_PUNTI):
+		#indice da passare al sink di testo del flusso
+		identificativo = self.catalogo._esegui("INSERT INTO flussi (sessione, nome, file) VALUES (?, ?, ?)",
+			(self.id, nome_flusso, os.path.abspath(nome_file)))
+		self.indici[nome_flusso] = IndiceFlusso(self.catalogo, identificativo, intervallo)
+		return self.indici[nome_flusso]
+
+	def perdite(self, nome_flusso, persi):
+		#righe del flusso perse prima della scrittura (es. coda di salvataggio piena)
+		indice = self.indici.get(nome_flusso)
+		if indice is not None:
+			indice.persi += persi
+
+	def chiudi(self, scartati=0, degradati=0, fine=None):
+		#scartati e degradati: notifiche perse o salvate solo nel registro grezzo per sovraccarico delle code
+		fine = time.time() if fine is None else fine
+		for indice in self.indici.values():
+			indice.aggiorna()
+		self.catalogo._esegui("UPDATE sessioni SET fine = ?, scartati = ?, degradati = ? WHERE id = ?",
+			(fine, scartati, degradati, self.id))
+
+class IndiceFlusso:
+	#aggiornato da SinkTesto: prima di accodare un gruppo di righe comunica la posizione a cui saranno scritte,
+	#e se è passato l'intervallo dall'ultimo punto di controllo ne registra uno nuovo (con i contatori del flusso)
+	def __init__(self, catalogo, identificativo, intervallo=INTERVALLO_PUNTI):
+		self.catalogo = catalogo
+		self.id = identificativo
+		self.intervallo = intervallo
+		self.ultimo = None
+		self.righe = 0
+		self.posizione = 0
+		self.persi = 0
+
+	def prima_di_scrivere(self, posizione, ora=None):
+		ora = time.time() if ora is None else ora
+		self.posizione = posizione
+		if self.ultimo is None or ora - self.ultimo >= self.intervallo:
+			self.ultimo = ora
+			self.catalogo._esegui("INSERT INTO punti (flusso, tempo, riga, posizione) VALUES (?, ?, ?, ?)",
+				(self.id, ora, self.righe, posizione))
+			self.aggiorna()
+
+	def dopo_aver_scritto(self, righe, posizione):
+		self.righe += righe
+		self.posizione = posizione
+
+	def aggiorna(self):
+		self.catalogo._esegui("UPDATE flussi SET righe = ?, byte = ?, persi = ? WHERE id = ?",
+			(self.righe, self.posizione, self.persi, self.id))
+
+def _ora_del_giorno(testo):
+	#secondi dalla mezzanotte della colonna "time" (HHMMSS.ffffff)
+	try:
+		return int(testo[0:2]) * 3600 + int(testo[2:4]) * 60 + float(testo[4:])
+	except ValueError:
+		return None
+
+def _istante(testo):
+	#ora locale "AAAA-MM-GG HH:MM[:SS]" in secondi dall'epoch
+	for formato in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+		try:
+			return time.mktime(datetime.datetime.strptime(testo, formato).timetuple())
+		except ValueError:
+			pass
+	raise argparse.ArgumentTypeError("Ora non valida: {} (formato AAAA-MM-GG HH:MM[:SS])".format(testo))
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Consultazione del catalogo delle sessioni registrate")
+	parser.add_argument("catalogo", help="file SQLite del catalogo (" + NOME_CATALOGO + " nella cartella dei dati)")
+	parser.add_argument("--indirizzo", help="mac-address del SensorTile")
+	parser.add_argument("--flusso", help="nome del flusso di cui stampare le righe (es. accelerometro)")
+	parser.add_argument("--da", type=_istante, help="inizio dell'intervallo, ora locale AAAA-MM-GG HH:MM[:SS]")
+	parser.add_argument("--a", type=_istante, help="fine dell'intervallo, ora locale AAAA-MM-GG HH:MM[:SS]")
+	args = parser.parse_args()
+	catalogo = Catalogo(args.catalogo)
+	if args.flusso is None:
+		#elenco delle sessioni nell'intervallo con i relativi flussi
+		for identificativo, indirizzo, inizio, fine, scartati, degradati in catalogo.sessioni(args.indirizzo, args.da, args.a):
+			print("Sessione {} di {}: {} - {}, {} notifiche scartate, {} solo nel registro grezzo".format(identificativo, indirizzo,
+				datetime.datetime.fromtimestamp(inizio), datetime.datetime.fromtimestamp(fine) if fine else "interrotta", scartati, degradati))
+			for _, nome, nome_file, righe, byte, persi in catalogo.flussi(identificativo):
+				print("\t{}: {} righe, {} byte, {} persi ({})".format(nome, righe, byte, persi, nome_file))
+	else:
+		if args.da is None or args.a is None:
+			parser.error("con --flusso vanno indicati --da e --a")
+		for riga in catalogo.leggi(args.indirizzo, args.flusso, args.da, args.a):
+			print(riga)
+	catalogo.chiudi()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""Codifica compressa dei blocchi di righe dei flussi: per ogni colonna intera differenza dal valore precedente,
+zigzag e varint, seguite eventualmente da un compressore generico (zlib o zstd) sull'intero blocco.
+Ogni blocco si decodifica da solo, con operazioni vettoriali di numpy"""
+import zlib
+import struct
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+try:
+	import zstandard
+except ImportError:
+	zstandard = None
+
+from caratteristiche_bluest import valore_mancante
+
+#compressori del blocco, indicati dal primo byte del blocco codificato
+NESSUNO = 0
+ZLIB = 1
+ZSTD = 2
+COMPRESSORI = {None: NESSUNO, "zlib": ZLIB, "zstd": ZSTD}
+#livello di zlib: il più veloce, la maggior parte della riduzione viene già dalle differenze
+LIVELLO_ZLIB = 1
+LIVELLO_ZSTD = 3
+#microsecondi in un'ora, un minuto e un secondo per la colonna "time" (HHMMSS.ffffff)
+_US_ORA = 3600 * 10 ** 6
+_US_MINUTO = 60 * 10 ** 6
+_US_SECONDO = 10 ** 6
+
+def _richiedi_numpy():
+	if np is None:
+		raise ImportError("Per la compressione dei flussi è necessario il pacchetto numpy")
+
+def codifica_varint(valori):
+	#interi senza segno a 64 bit in varint (7 bit per byte, il bit alto indica che il valore continua)
+	valori = np.asarray(valori, dtype=np.uint64)
+	lunghezze = np.ones(len(valori), dtype=np.int64)
+	for k in range(1, 10):
+		lunghezze += valori >= (1 << (7 * k))
+	fine = np.cumsum(lunghezze)
+	inizio = fine - lunghezze
+	uscita = np.empty(int(fine[-1]) if len(fine) else 0, dtype=np.uint8)
+	for k in range(int(lunghezze.max()) if len(lunghezze) else 0):
+		scelti = lunghezze > k
+		byte = (valori[scelti] >> np.uint64(7 * k)) & np.uint64(0x7F)
+		uscita[inizio[scelti] + k] = byte | np.where(lunghezze[scelti] > k + 1, np.uint64(0x80), np.uint64(0))
+	return uscita.tobytes()
+
+def decodifica_varint(dati):
+	#inverso di codifica_varint: ogni byte contribuisce con 7 bit spostati della sua posizione nel valore
+	byte = np.frombuffer(dati, dtype=np.uint8)
+	fine = np.flatnonzero(byte < 0x80)
+	if len(fine) == 0:
+		return np.empty(0, dtype=np.uint64)
+	byte = byte[:fine[-1] + 1]
+	inizio = np.empty_like(fine)
+	inizio[0] = 0
+	inizio[1:] = fine[:-1] + 1
+	posizione = np.arange(len(byte)) - np.repeat(inizio, fine - inizio + 1)
+	contributi = (byte & 0x7F).astype(np.uint64) << (7 * posizione).astype(np.uint64)
+	return np.add.reduceat(contributi, inizio)
+
+def zigzag(valori):
+	#interi con segno in interi senza segno piccoli per valori vicini a zero: 0, -1, 1, -2, ... -> 0, 1, 2, 3, ...
+	valori = np.asarray(valori, dtype=np.int64)
+	return ((valori << 1) ^ (valori >> 63)).astype(np.uint64)
+
+def inverso_zigzag(valori):
+	valori = np.asarray(valori, dtype=np.uint64)
+	return (valori >> np.uint64(1)).astype(np.int64) ^ -(valori & np.uint64(1)).astype(np.int64)
+
+def _leggi_varint(dati, posizione):
+	#lettura di un solo varint dell'intestazione del blocco: (valore, posizione successiva)
+	valore = spostamento = 0
+	while True:
+		byte = dati[posizione]
+		valore |= (byte & 0x7F) << spostamento
+		posizione += 1
+		if byte < 0x80:
+			return valore, posizione
+		spostamento += 7
+
+def microsecondi_del_giorno(testo):
+	#colonna "time" (HHMMSS.ffffff) in microsecondi dalla mezzanotte
+	return int(testo[0:2]) * _US_ORA + int(testo[2:4]) * _US_MINUTO + int(testo[4:6]) * _US_SECONDO + int(testo[7:13].ljust(6, "0"))
+
+def testo_del_giorno(microsecondi):
+	secondi, frazione = divmod(int(microsecondi), _US_SECONDO)
+	return "{:02d}{:02d}{:02d}.{:06d}".format(secondi // 3600, secondi // 60 % 60, secondi % 60, frazione)
+
+class CodificaDelta:
+	#codifica dei blocchi di righe (timestamp, time, valori...) di un flusso con i campi della tabella delle
+	#caratteristiche (colonna, formato struct, divisore, unità). Le colonne intere sono salvate come i valori
+	#ricevuti (valore scalato per il divisore); le colonne float (flussi calcolati sull'host) come float a 32 bit.
+	#Il timestamp è moltiplicato per suddivisioni per i flussi con tempi frazionari (vedi archivio_memoria.py).
+	#Con grezzi=True le righe contengono già i valori interi ricevuti, che righe_testo restituisce così come sono.
+	#Blocco: compressore (1 byte) e contenuto, eventualmente compresso: numero di righe e lunghezza della parte varint
+	#(varint), poi le colonne intere una dopo l'altra (timestamp, time in microsecondi dalla mezzanotte, valori) come
+	#differenze dal valore precedente del blocco in zigzag e varint, poi le colonne float in little endian
+	def __init__(self, campi, compressore=None, suddivisioni=1, grezzi=False):
+		_richiedi_numpy()
+		if compressore not in COMPRESSORI:
+			raise ValueError("Compressore sconosciuto: {} (previsti: zlib, zstd)".format(compressore))
+		if compressore == "zstd" and zstandard is None:
+			raise ImportError("Per la compressione zstd è necessario il pacchetto zstandard")
+		self.campi = list(campi)
+		self.compressore = compressore
+		self.suddivisioni = suddivisioni
+		self.grezzi = grezzi
+		self.interi = [i for i, c in enumerate(self.campi) if c[1] not in "fd"]
+		self.float = [i for i, c in enumerate(self.campi) if c[1] in "fd"]
+		self.divisori = np.array([self.campi[i][2] for i in self.interi], dtype=float)
+		self.moltiplicatori = np.ones(len(self.interi)) if grezzi else self.divisori
+		self.mancanti = np.array([valore_mancante(self.campi[i][1]) for i in self.interi], dtype=np.int64)
+
+	def codifica(self, righe):
+		n = len(righe)
+		colonne = np.empty((2 + len(self.interi), n), dtype=np.int64)
+		colonne[0] = np.rint(np.array([riga[0] for riga in righe], dtype=float) * self.suddivisioni)
+		colonne[1] = [microsecondi_del_giorno(riga[1]) for riga in righe]
+		valori = np.array([riga[2:] for riga in righe], dtype=float).reshape(n, len(self.campi))
+		if self.interi:
+			grezzi = valori[:, self.interi] * self.moltiplicatori
+			mancanti = np.isnan(grezzi)
+			grezzi[mancanti] = 0
+			colonne[2:] = np.where(mancanti, self.mancanti, np.rint(grezzi).astype(np.int64)).T
+		differenze = np.diff(colonne, axis=1, prepend=0)
+		parte_varint = codifica_varint(zigzag(differenze.ravel()))
+		corpo = (codifica_varint([n, len(parte_varint)]) + parte_varint +
+			np.ascontiguousarray(valori[:, self.float].T, dtype="<f4").tobytes())
+		if self.compressore == "zlib":
+			corpo = zlib.compress(corpo, LIVELLO_ZLIB)
+		elif self.compressore == "zstd":
+			corpo = zstandard.ZstdCompressor(level=LIVELLO_ZSTD).compress(corpo)
+		return struct.pack("<B", COMPRESSORI[self.compressore]) + corpo
+
+	def _corpo(self, blocco):
+		compressore, corpo = blocco[0], bytes(blocco[1:])
+		if compressore == ZLIB:
+			return zlib.decompress(corpo)
+		if compressore == ZSTD:
+			if zstandard is None:
+				raise ImportError("Per la decompressione zstd è necessario il pacchetto zstandard")
+			return zstandard.ZstdDecompressor().decompress(corpo)
+		return corpo
+
+	def righe(self, blocco):
+		#numero di righe di un blocco, senza decodificarlo
+		return _leggi_varint(self._corpo(blocco), 0)[0]
+
+	def decodifica(self, blocco):
+		#(timestamp (N,), microsecondi dalla mezzanotte (N,), valori interi ricevuti (N, colonne intere),
+		#valori float (N, colonne float)) di un blocco
+		corpo = self._corpo(blocco)
+		n, posizione = _leggi_varint(corpo, 0)
+		lunghezza, posizione = _leggi_varint(corpo, posizione)
+		differenze = inverso_zigzag(decodifica_varint(corpo[posizione:posizione + lunghezza]))
+		colonne = np.cumsum(differenze.reshape(2 + len(self.interi), n), axis=1)
+		valori_float = np.frombuffer(corpo, dtype="<f4", offset=posizione + lunghezza, count=n * len(self.float))
+		return colonne[0], colonne[1], colonne[2:].T, valori_float.reshape(len(self.float), n).T
+
+	def valori(self, blocco):
+		#array (N, 2 + campi) con timestamp, ora dell'host in secondi dalla mezzanotte e valori scalati
+		#(nan per i campi mancanti), nell'ordine delle colonne del flusso
+		timestamp, microsecondi, interi, valori_float = self.decodifica(blocco)
+		risultato = np.empty((len(timestamp), 2 + len(self.campi)))
+		risultato[:, 0] = timestamp / float(self.suddivisioni)
+		risultato[:, 1] = microsecondi / float(_US_SECONDO)
+		scalati = interi / self.divisori
+		scalati[interi == self.mancanti] = np.nan
+		risultato[:, [2 + i for i in self.interi]] = scalati
+		risultato[:, [2 + i for i in self.float]] = valori_float
+		return risultato
+
+	def righe_testo(self, blocco):
+		#righe come nei file di testo (valori interi divisi per il divisore o così come ricevuti con grezzi,
+		#float a 32 bit arrotondati a 7 cifre)
+		timestamp, microsecondi, interi, valori_float = self.decodifica(blocco)
+		if self.suddivisioni != 1:
+			timestamp = timestamp / float(self.suddivisioni)
+		colonne = [None] * len(self.campi)
+		for j, i in enumerate(self.interi):
+			divisore = 1 if self.grezzi else self.campi[i][2]
+			colonne[i] = [str(v / divisore if divisore != 1 else v) if v != self.mancanti[j] else "nan" for v in interi[:, j].tolist()]
+		for j, i in enumerate(self.float):
+			colonne[i] = ["{:.7g}".format(v) for v in valori_float[:, j].tolist()]
+		return ["\t".join([str(t), testo_del_giorno(us)] + list(valori)) for t, us, *valori in
+			zip(timestamp.tolist(), microsecondi.tolist(), *colonne)]
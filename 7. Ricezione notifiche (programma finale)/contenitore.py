@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+
+"""Contenitore giornaliero dei dati di un dispositivo: tutti i flussi di tutte le connessioni di un giorno sono
+accodati in un solo file a record, con un marcatore di segmento ad ogni connessione invece di una nuova serie di file"""
+import os
+import json
+import time
+import struct
+import argparse
+import datetime
+import threading
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from compressione import CodificaDelta, microsecondi_del_giorno
+from caratteristiche_bluest import applica_scala
+
+#intestazione del file: identificativo, versione e ora di creazione
+FORMATO_INTESTAZIONE = struct.Struct("<4sHd")
+IDENTIFICATIVO = b"STCN"
+VERSIONE = 1
+ESTENSIONE = ".stc"
+#ogni record è preceduto dal tipo (1 byte) e dalla lunghezza del contenuto (4 byte), così un lettore passa da un
+#record al successivo senza leggerne il contenuto
+FORMATO_RECORD = struct.Struct("<BI")
+#marcatore di segmento: JSON con numero del segmento, ora di inizio, indirizzo e metadati della connessione
+#(ripetuto con "continua": true all'inizio di un nuovo file se la connessione prosegue)
+SEGMENTO = 1
+#dichiarazione di un flusso del segmento: JSON con nome e colonne (per i flussi compressi campi, suddivisioni del
+#timestamp e compressione; per i flussi con i valori interi ricevuti le scale [colonna, scala, offset, unità])
+FLUSSO = 2
+#gruppo di righe di un flusso: lunghezza del nome (1 byte), nome e righe di testo separate da tabulazioni
+#come nei file di SinkTesto; ogni record contiene il nome, quindi si può leggere partendo da qualsiasi record
+RIGHE = 3
+#gruppo di righe compresso: lunghezza del nome (1 byte), nome e blocco di CodificaDelta (vedi compressione.py),
+#decodificabile da solo come i record di testo
+RIGHE_COMPRESSE = 4
+#compressione dei flussi con campi noti: "delta" (solo differenze e varint) o con un compressore generico sul blocco
+COMPRESSIONI = {"delta": None, "zlib": "zlib", "zstd": "zstd"}
+#dimensione oltre la quale si passa a un nuovo file dello stesso giorno ("<dispositivo> <giorno> 2.stc", ...)
+DIMENSIONE_MASSIMA = 1 << 30
+#le righe di un flusso sono raccolte in un record finchè non sono RIGHE_PER_RECORD o finchè la prima non
+#attende da ATTESA_MASSIMA secondi
+RIGHE_PER_RECORD = 256
+ATTESA_MASSIMA = 1.0
+
+class Contenitore:
+	#uno per dispositivo, aperto per tutta l'esecuzione: segmento() va chiamato ad ogni connessione, prima di
+	#creare i sink dei flussi con flusso(). I sink scrivono dal thread di salvataggio della pipeline e il
+	#segmento è aperto dal ciclo di connessione, quindi le scritture sul file sono protette da un lock.
+	#Con compressione (una delle COMPRESSIONI) i flussi dichiarati con i loro campi sono salvati in record compressi
+	def __init__(self, cartella, indirizzo, dimensione_massima=DIMENSIONE_MASSIMA, compressione=None):
+		if compressione is not None and compressione not in COMPRESSIONI:
+			raise ValueError("Compressione sconosciuta: {} (previste: {})".format(compressione, ", ".join(COMPRESSIONI)))
+		self.cartella = cartella
+		self.indirizzo = indirizzo
+		self.dimensione_massima = dimensione_massima
+		self.compressione = compressione
+		self.lock = threading.RLock()
+		self.file = None
+		self.percorso = None
+		self.giorno = None
+		self.numero_segmento = 0
+		self.segmento_corrente = None
+		self.sink = {}
+		self.sessione = None
+
+	def segmento(self, metadati=None, sessione=None):
+		#marcatore dell'inizio di una connessione; con una sessione del catalogo (vedi catalogo_sessioni.py)
+		#i flussi sono registrati nel catalogo con punti di controllo sulle posizioni dei record
+		with self.lock:
+			for sink in self.sink.values():
+				sink.svuota()
+			self.sink = {}
+			self.sessione = sessione
+			self.segmento_corrente = None
+			self._verifica_file(0)
+			self.numero_segmento += 1
+			self.segmento_corrente = {"segmento": self.numero_segmento, "inizio": time.time(), "indirizzo": self.indirizzo,
+				"metadati": metadati}
+			self._scrivi_record(SEGMENTO, json.dumps(self.segmento_corrente).encode("utf-8"))
+			return self.numero_segmento
+
+	def flusso(self, nome_flusso, colonne, campi=None, suddivisioni=1, scale=None):
+		#sink del flusso nel segmento corrente; con i campi (colonna, formato struct, divisore, unità) delle colonne
+		#dopo timestamp e time il flusso è compresso se il contenitore usa una compressione. Con scale (colonna,
+		#scala, offset, unità) le righe contengono i valori interi ricevuti e le scale sono nella dichiarazione
+		with self.lock:
+			codifica = None
+			if self.compressione is not None and campi is not None:
+				codifica = CodificaDelta(campi, COMPRESSIONI[self.compressione], suddivisioni, scale is not None)
+			sink = SinkContenitore(self, nome_flusso, colonne, codifica, scale)
+			self.sink[nome_flusso] = sink
+			self._verifica_file(0)
+			self._dichiara(sink)
+			return sink
+
+	def _dichiara(self, sink):
+		dichiarazione = {"nome": sink.nome, "colonne": sink.colonne}
+		if sink.codifica is not None:
+			dichiarazione.update(campi=sink.codifica.campi, suddivisioni=sink.codifica.suddivisioni, compressione=self.compressione)
+		if sink.scale is not None:
+			dichiarazione["scale"] = sink.scale
+		self._scrivi_record(FLUSSO, json.dumps(dichiarazione).encode("utf-8"))
+		if self.sessione is not None:
+			#nel catalogo ogni file del contenitore è un flusso a sé: quello del file precedente riceve i contatori finali
+			if sink.indice is not None:
+				sink.indice.aggiorna()
+			sink.indice = self.sessione.flusso(sink.nome, self.percorso)
+
+	def scrivi_righe(self, sink, righe):
+		nome = sink.nome.encode("utf-8")
+		if sink.codifica is not None:
+			tipo, dati = RIGHE_COMPRESSE, sink.codifica.codifica(righe)
+		else:
+			tipo, dati = RIGHE, "".join("\t".join(str(valore) for valore in riga) + "\n" for riga in righe).encode("utf-8")
+		contenuto = struct.pack("<B", len(nome)) + nome + dati
+		with self.lock:
+			self._verifica_file(FORMATO_RECORD.size + len(contenuto))
+			if sink.indice is not None:
+				sink.indice.prima_di_scrivere(self.file.tell())
+			self._scrivi_record(tipo, contenuto)
+			if sink.indice is not None:
+				sink.indice.dopo_aver_scritto(len(righe), self.file.tell())
+
+	def _scrivi_record(self, tipo, contenuto):
+		#il file resta aperto, ogni record viene passato subito al sistema operativo così resta leggibile
+		try:
+			self.file.write(FORMATO_RECORD.pack(tipo, len(contenuto)) + contenuto)
+			self.file.flush()
+		except IOError:
+			print ("Errore di I/O sul file.")
+
+	def _verifica_file(self, lunghezza):
+		#apre il file del giorno se è cambiato il giorno o se il record non ci sta nel file corrente
+		giorno = datetime.date.today()
+		if self.file is not None and giorno == self.giorno and self.file.tell() + lunghezza <= self.dimensione_massima:
+			return
+		if self.file is not None:
+			self.file.close()
+		if giorno != self.giorno:
+			#primo file del giorno di questa esecuzione: la numerazione dei segmenti prosegue da quella dei file
+			#del giorno scritti da un'esecuzione precedente
+			self.numero_segmento = max(self.numero_segmento, self._ultimo_segmento(giorno))
+		self.giorno = giorno
+		self.percorso = self._percorso_libero(giorno, lunghezza)
+		self.file = open(self.percorso, "ab")
+		if self.file.tell() < FORMATO_INTESTAZIONE.size:
+			#file nuovo o con l'intestazione incompleta
+			self.file.truncate(0)
+			self.file.write(FORMATO_INTESTAZIONE.pack(IDENTIFICATIVO, VERSIONE, time.time()))
+		else:
+			#file dello stesso giorno di un'esecuzione precedente: un record rimasto incompleto (es. per
+			#un'interruzione durante la scrittura) viene tolto
+			fine = LettoreContenitore(self.percorso).fine_valida()
+			if fine < self.file.tell():
+				self.file.truncate(fine)
+		#la connessione in corso continua nel nuovo file: segmento e flussi sono dichiarati di nuovo
+		if self.segmento_corrente is not None:
+			self._scrivi_record(SEGMENTO, json.dumps(dict(self.segmento_corrente, continua=True)).encode("utf-8"))
+			for sink in self.sink.values():
+				self._dichiara(sink)
+
+	def _percorso(self, giorno, numero):
+		nome = "{} {}{}".format(self.indirizzo.replace(":", ""), giorno.isoformat(), "" if numero == 1 else " {}".format(numero))
+		return os.path.join(self.cartella, nome + ESTENSIONE)
+
+	def _percorso_libero(self, giorno, lunghezza):
+		numero = 1
+		while True:
+			percorso = self._percorso(giorno, numero)
+			if not os.path.exists(percorso) or os.path.getsize(percorso) + lunghezza <= self.dimensione_massima:
+				return percorso
+			numero += 1
+
+	def _ultimo_segmento(self, giorno):
+		#numero più alto dei segmenti nei file già presenti del giorno (i marcatori "continua" ripetono il numero)
+		ultimo = 0
+		numero = 1
+		while os.path.exists(self._percorso(giorno, numero)):
+			try:
+				segmenti = LettoreContenitore(self._percorso(giorno, numero)).segmenti()
+			except ValueError:
+				segmenti = []
+			ultimo = max([ultimo] + [marcatore["segmento"] for _, marcatore in segmenti])
+			numero += 1
+		return ultimo
+
+	def chiudi(self):
+		with self.lock:
+			for sink in self.sink.values():
+				sink.svuota()
+			if self.file is not None:
+				self.file.close()
+				self.file = None
+
+class SinkContenitore:
+	#sink di un flusso: le righe sono raccolte in memoria e accodate al contenitore come un solo record.
+	#Usa il lock del contenitore perchè il registro grezzo è scritto sia dal thread di decodifica sia da quello
+	#di salvataggio (notifiche degradate)
+	def __init__(self, contenitore, nome, colonne, codifica=None, scale=None):
+		self.contenitore = contenitore
+		self.nome = nome
+		self.colonne = list(colonne)
+		self.codifica = codifica
+		self.scale = scale
+		self.indice = None
+		self.righe = []
+		self.prima = None
+
+	def scrivi(self, righe):
+		ora = time.time()
+		with self.contenitore.lock:
+			if not self.righe:
+				self.prima = ora
+			self.righe.extend(righe)
+			if len(self.righe) >= RIGHE_PER_RECORD or ora - self.prima >= ATTESA_MASSIMA:
+				self.svuota()
+
+	def scrivi_blocco(self, dati):
+		#accoda un array numpy (N, colonne) di campioni
+		self.scrivi(dati.tolist())
+
+	def svuota(self):
+		with self.contenitore.lock:
+			if self.righe:
+				righe, self.righe = self.righe, []
+				self.contenitore.scrivi_righe(self, righe)
+
+	def chiudi(self):
+		#il contenitore resta aperto per le connessioni successive
+		self.svuota()
+
+class LettoreContenitore:
+	#lettura di un contenitore, anche mentre viene scritto: un record incompleto alla fine del file viene ignorato
+	def __init__(self, percorso):
+		self.percorso = percorso
+		with open(percorso, "rb") as fp:
+			intestazione = fp.read(FORMATO_INTESTAZIONE.size)
+		if len(intestazione) < FORMATO_INTESTAZIONE.size or intestazione[:4] != IDENTIFICATIVO:
+			raise ValueError("{} non è un contenitore".format(percorso))
+		_, self.versione, self.creazione = FORMATO_INTESTAZIONE.unpack(intestazione)
+		self.codifiche = None
+
+	def record(self, posizione=None, posizione_finale=None, flusso=None):
+		#(posizione, tipo, contenuto) dei record da posizione (inizio di un record) a posizione_finale esclusa;
+		#con flusso sono restituiti solo i marcatori, le dichiarazioni e le righe di quel flusso (con flusso=""
+		#nessun record di righe, di cui viene letta solo l'intestazione)
+		nome_flusso = flusso.encode("utf-8") if flusso is not None else None
+		with open(self.percorso, "rb") as fp:
+			fp.seek(0, os.SEEK_END)
+			fine = fp.tell() if posizione_finale is None else min(posizione_finale, fp.tell())
+			posizione = FORMATO_INTESTAZIONE.size if posizione is None else max(posizione, FORMATO_INTESTAZIONE.size)
+			while posizione + FORMATO_RECORD.size <= fine:
+				fp.seek(posizione)
+				tipo, lunghezza = FORMATO_RECORD.unpack(fp.read(FORMATO_RECORD.size))
+				if posizione + FORMATO_RECORD.size + lunghezza > fine:
+					break
+				if tipo in (RIGHE, RIGHE_COMPRESSE) and nome_flusso is not None:
+					#il nome è letto prima del resto del record per saltare senza leggerle le righe degli altri flussi
+					nome = fp.read(1 + len(nome_flusso))
+					if nome[0] != len(nome_flusso) or nome[1:] != nome_flusso:
+						posizione += FORMATO_RECORD.size + lunghezza
+						continue
+					contenuto = nome + fp.read(lunghezza - len(nome))
+				else:
+					contenuto = fp.read(lunghezza)
+				yield posizione, tipo, contenuto
+				posizione += FORMATO_RECORD.size + lunghezza
+
+	def fine_valida(self):
+		#posizione successiva all'ultimo record completo, di qualsiasi tipo: sono lette solo le intestazioni dei record
+		with open(self.percorso, "rb") as fp:
+			fp.seek(0, os.SEEK_END)
+			dimensione = fp.tell()
+			fine = FORMATO_INTESTAZIONE.size
+			while fine + FORMATO_RECORD.size <= dimensione:
+				fp.seek(fine)
+				_, lunghezza = FORMATO_RECORD.unpack(fp.read(FORMATO_RECORD.size))
+				if fine + FORMATO_RECORD.size + lunghezza > dimensione:
+					break
+				fine += FORMATO_RECORD.size + lunghezza
+		return fine
+
+	def segmenti(self):
+		#(posizione, marcatore) dei segmenti del file
+		return [(posizione, json.loads(contenuto.decode("utf-8"))) for posizione, tipo, contenuto in self.record(flusso="")
+			if tipo == SEGMENTO]
+
+	def dichiarazioni(self):
+		#dichiarazioni (nome, colonne ed eventuali campi) dei flussi del file, per nome
+		dichiarati = {}
+		for _, tipo, contenuto in self.record(flusso=""):
+			if tipo == FLUSSO:
+				voce = json.loads(contenuto.decode("utf-8"))
+				dichiarati[voce["nome"]] = voce
+		return dichiarati
+
+	def flussi(self):
+		#nomi e colonne dei flussi dichiarati nel file
+		return {nome: voce["colonne"] for nome, voce in self.dichiarazioni().items()}
+
+	def codifica(self, nome_flusso):
+		#CodificaDelta dei record compressi di un flusso, dai campi della sua dichiarazione: le dichiarazioni sono
+		#lette una volta sola, perchè una lettura da un punto di controllo parte dopo la dichiarazione del flusso
+		if self.codifiche is None:
+			self.codifiche = {nome: CodificaDelta([tuple(c) for c in voce["campi"]], suddivisioni=voce.get("suddivisioni", 1),
+				grezzi="scale" in voce)
+				for nome, voce in self.dichiarazioni().items() if "campi" in voce}
+		return self.codifiche[nome_flusso]
+
+	def blocchi(self, nome_flusso, posizione=None, posizione_finale=None, segmento=None):
+		#(tipo, dati) dei record di righe del flusso, eventualmente solo di un segmento
+		corrente = None
+		for _, tipo, contenuto in self.record(posizione, posizione_finale, nome_flusso):
+			if tipo == SEGMENTO:
+				corrente = json.loads(contenuto.decode("utf-8"))["segmento"]
+			elif tipo in (RIGHE, RIGHE_COMPRESSE) and (segmento is None or corrente == segmento):
+				yield tipo, contenuto[1 + contenuto[0]:]
+
+	def righe(self, nome_flusso, posizione=None, posizione_finale=None, segmento=None):
+		#righe di testo del flusso (senza il carattere di fine riga), eventualmente solo di un segmento
+		risultato = []
+		for tipo, dati in self.blocchi(nome_flusso, posizione, posizione_finale, segmento):
+			if tipo == RIGHE_COMPRESSE:
+				risultato.extend(self.codifica(nome_flusso).righe_testo(dati))
+			else:
+				risultato.extend(dati.decode("utf-8").splitlines())
+		return risultato
+
+	def valori(self, nome_flusso, posizione=None, posizione_finale=None, segmento=None):
+		#array numpy (N, colonne) del flusso con la colonna time in secondi dalla mezzanotte e i valori scalati:
+		#i record compressi sono decodificati in modo vettoriale, quelli di testo convertiti riga per riga e,
+		#se contengono i valori interi ricevuti, scalati in modo vettoriale con le scale della dichiarazione
+		parti = []
+		testo = []
+		for tipo, dati in self.blocchi(nome_flusso, posizione, posizione_finale, segmento):
+			if tipo == RIGHE_COMPRESSE:
+				parti.append(self.codifica(nome_flusso).valori(dati))
+			else:
+				righe = [riga.split("\t") for riga in dati.decode("utf-8").splitlines()]
+				parti.append(np.array([[float(riga[0]), microsecondi_del_giorno(riga[1]) / 1e6] + [float(v) for v in riga[2:]]
+					for riga in righe]))
+				testo.append(len(parti) - 1)
+		scale = self.dichiarazioni().get(nome_flusso, {}).get("scale") if testo else None
+		for i in testo if scale is not None else ():
+			parti[i] = applica_scala(parti[i], scale)
+		colonne = len(self.flussi().get(nome_flusso, [])) if not parti else parti[0].shape[1]
+		return np.concatenate(parti) if parti else np.empty((0, colonne))
+
+	def conta_righe(self, tipo, dati, nome_flusso):
+		if tipo == RIGHE_COMPRESSE:
+			return self.codifica(nome_flusso).righe(dati)
+		return dati.count(b"\n")
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Contenuto di un contenitore giornaliero")
+	parser.add_argument("contenitore", help="file " + ESTENSIONE)
+	parser.add_argument("--flusso", help="nome del flusso di cui stampare le righe (es. accelerometro)")
+	parser.add_argument("--segmento", type=int, help="con --flusso, solo le righe del segmento indicato")
+	args = parser.parse_args()
+	lettore = LettoreContenitore(args.contenitore)
+	if args.flusso is None:
+		#elenco dei segmenti (connessioni) e dei flussi con il numero di righe
+		for posizione, marcatore in lettore.segmenti():
+			print("Segmento {} di {}: {}{} (byte {})".format(marcatore["segmento"], marcatore["indirizzo"],
+				datetime.datetime.fromtimestamp(marcatore["inizio"]), ", continua" if marcatore.get("continua") else "", posizione))
+		conteggi = {}
+		byte = {}
+		for _, tipo, contenuto in lettore.record():
+			if tipo in (RIGHE, RIGHE_COMPRESSE):
+				nome = contenuto[1:1 + contenuto[0]].decode("utf-8")
+				conteggi[nome] = conteggi.get(nome, 0) + lettore.conta_righe(tipo, contenuto[1 + contenuto[0]:], nome)
+				byte[nome] = byte.get(nome, 0) + len(contenuto)
+		for nome, voce in sorted(lettore.dichiarazioni().items()):
+			print("\t{}: {} righe, {} byte ({}){}".format(nome, conteggi.get(nome, 0), byte.get(nome, 0), ", ".join(voce["colonne"]),
+				", compressione " + voce["compressione"] if "compressione" in voce else ""))
+	else:
+		for riga in lettore.righe(args.flusso, segmento=args.segmento):
+			print(riga)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""Decimazione e aggregazione dei flussi dei sensori prima del salvataggio"""
+import math
+from collections import deque
+
+#numero di colonne iniziali di ogni riga che contengono i tempi (timestamp del dispositivo e ora dell'host)
+#queste colonne non vengono mediate ma copiate dalla riga rappresentativa
+COLONNE_TEMPO = 2
+
+class DecimatoreOgniN:
+	#mantiene una riga ogni n
+	def __init__(self, n, colonne_tempo=COLONNE_TEMPO):
+		if n < 1:
+			raise ValueError("Il fattore di decimazione deve essere almeno 1, ricevuto {}".format(n))
+		self.n = n
+		self.colonne_tempo = colonne_tempo
+		self.contatore = 0
+
+	def aggiungi(self, riga):
+		#restituisce la lista delle righe da salvare (vuota o con un solo elemento)
+		uscita = [riga] if self.contatore == 0 else []
+		self.contatore = (self.contatore + 1) % self.n
+		return uscita
+
+	def svuota(self):
+		self.contatore = 0
+		return []
+
+class DecimatoreBlocchi:
+	#aggrega blocchi di n righe con la media, il minimo o il massimo di ogni colonna di dati
+	#i tempi della riga in uscita sono quelli dell'ultima riga del blocco
+	funzioni = {
+		"media": lambda valori: math.fsum(valori) / len(valori),
+		"minimo": min,
+		"massimo": max,
+	}
+
+	def __init__(self, n, funzione="media", colonne_tempo=COLONNE_TEMPO):
+		if n < 1:
+			raise ValueError("Il fattore di decimazione deve essere almeno 1, ricevuto {}".format(n))
+		if funzione not in self.funzioni:
+			raise ValueError("Funzione di aggregazione sconosciuta: {} (previste: {})".format(funzione, ", ".join(self.funzioni)))
+		self.n = n
+		self.funzione = self.funzioni[funzione]
+		self.colonne_tempo = colonne_tempo
+		self.blocco = []
+
+	def _aggrega(self):
+		ultima = self.blocco[-1]
+		dati = zip(*[riga[self.colonne_tempo:] for riga in self.blocco])
+		riga = tuple(ultima[:self.colonne_tempo]) + tuple(self.funzione(colonna) for colonna in dati)
+		self.blocco = []
+		return riga
+
+	def aggiungi(self, riga):
+		self.blocco.append(riga)
+		if len(self.blocco) < self.n:
+			return []
+		return [self._aggrega()]
+
+	def svuota(self):
+		#aggrega l'eventuale blocco incompleto (es. alla disconnessione)
+		if not self.blocco:
+			return []
+		return [self._aggrega()]
+
+class DecimatoreAntiAliasing:
+	#sottocampionamento di un fattore n preceduto da un filtro passa-basso FIR (sinc finestrata con Hamming)
+	#viene calcolata solo un'uscita ogni n ingressi; i tempi in uscita sono quelli del campione centrale
+	#del filtro, così il ritardo di gruppo è compensato
+	def __init__(self, n, taps_per_fattore=8, banda=0.9, colonne_tempo=COLONNE_TEMPO):
+		if n < 1:
+			raise ValueError("Il fattore di decimazione deve essere almeno 1, ricevuto {}".format(n))
+		self.n = n
+		self.colonne_tempo = colonne_tempo
+		self.coefficienti = self.progetta_filtro(n, taps_per_fattore, banda)
+		self.finestra = deque(maxlen=len(self.coefficienti))
+		self.contatore = 0
+
+	@staticmethod
+	def progetta_filtro(n, taps_per_fattore=8, banda=0.9):
+		#frequenza di taglio normalizzata (cicli/campione) pari a una frazione della nuova frequenza di Nyquist
+		if n == 1:
+			return [1.0]
+		lunghezza = taps_per_fattore * n + 1
+		centro = (lunghezza - 1) / 2
+		taglio = banda * 0.5 / n
+		coefficienti = []
+		for k in range(lunghezza):
+			x = k - centro
+			sinc = 2 * taglio if x == 0 else math.sin(2 * math.pi * taglio * x) / (math.pi * x)
+			hamming = 0.54 - 0.46 * math.cos(2 * math.pi * k / (lunghezza - 1))
+			coefficienti.append(sinc * hamming)
+		#guadagno unitario in continua
+		somma = math.fsum(coefficienti)
+		return [c / somma for c in coefficienti]
+
+	def aggiungi(self, riga):
+		self.finestra.append(riga)
+		if len(self.finestra) < len(self.coefficienti):
+			return []
+		self.contatore += 1
+		if (self.contatore - 1) % self.n:
+			return []
+		centrale = self.finestra[len(self.coefficienti) // 2]
+		colonne = len(riga) - self.colonne_tempo
+		valori = [0.0] * colonne
+		for c, r in zip(self.coefficienti, self.finestra):
+			dati = r[self.colonne_tempo:]
+			for i in range(colonne):
+				valori[i] += c * dati[i]
+		return [tuple(centrale[:self.colonne_tempo]) + tuple(valori)]
+
+	def svuota(self):
+		#le righe rimaste nella finestra non bastano per un'uscita filtrata e vengono scartate
+		self.finestra.clear()
+		self.contatore = 0
+		return []
+
+def crea_decimatore(modo, n, **opzioni):
+	#costruisce un decimatore a partire da una descrizione testuale ("ogni_n", "media", "minimo", "massimo", "anti_aliasing")
+	if modo is None or n is None or n <= 1:
+		return None
+	if modo == "ogni_n":
+		return DecimatoreOgniN(n, **opzioni)
+	if modo == "anti_aliasing":
+		return DecimatoreAntiAliasing(n, **opzioni)
+	return DecimatoreBlocchi(n, modo, **opzioni)
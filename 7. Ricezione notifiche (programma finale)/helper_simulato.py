@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""bluepy-helper simulato: risponde ai comandi di Peripheral come un SensorTile con firmware BlueST e genera
+notifiche di accelerometro, giroscopio e magnetometro (più batteria, umidità e audio ADPCM), per provare la ricezione senza il dispositivo"""
+import os
+import sys
+import time
+import math
+import select
+import struct
+import binascii
+from collections import deque
+
+import negoziazione
+import audio_adpcm
+
+#caratteristiche simulate: uuid -> (handle della dichiarazione, handle del valore); il CCCD segue il valore
+CARATTERISTICHE = {
+	"00140000-0001-11e1-ac36-0002a5d5c51b": (0x0d, 0x0e),
+	"00e00000-0001-11e1-ac36-0002a5d5c51b": (0x10, 0x11),
+	"00000100-0001-11e1-ac36-0002a5d5c51b": (0x13, 0x14),
+	"00ee0000-0001-11e1-ac36-0002a5d5c51b": (0x16, 0x17),
+	"00020000-0001-11e1-ac36-0002a5d5c51b": (0x19, 0x1a),
+	"00080000-0001-11e1-ac36-0002a5d5c51b": (0x1c, 0x1d),
+	"08000000-0001-11e1-ac36-0002a5d5c51b": (0x1f, 0x20),
+	"40000000-0001-11e1-ac36-0002a5d5c51b": (0x22, 0x23),
+}
+HANDLE_AGM = 0x11
+#servizi simulati: uuid -> (primo handle, ultimo handle); le caratteristiche sono tutte nel servizio delle feature
+SERVIZI = {
+	"00001801-0000-1000-8000-00805f9b34fb": (0x01, 0x04),
+	"00001800-0000-1000-8000-00805f9b34fb": (0x05, 0x0b),
+	"00000000-0001-11e1-9ab4-0002a5d5c51b": (0x0c, 0x24),
+}
+#caratteristiche lente (batteria e umidità): un pacchetto per evento di connessione, dato il timestamp
+PACCHETTI_LENTI = {
+	0x1a: lambda t: struct.pack("<HHhhB", t, 875, 3900, -120, 1),
+	0x1d: lambda t: struct.pack("<HH", t, 455 + t % 10),
+}
+#audio ADPCM (un tono a 440 Hz): pacchetti prodotti al secondo, lunghezza della coda di trasmissione
+#dell'audio e pacchetti audio tra due pacchetti di sincronizzazione
+HANDLE_AUDIO = 0x20
+HANDLE_SINCRONIZZAZIONE = 0x23
+FREQUENZA_AUDIO = float(audio_adpcm.FREQUENZA) / audio_adpcm.CAMPIONI_PER_PACCHETTO
+CODA_AUDIO = 32
+PACCHETTI_PER_SINCRONIZZAZIONE = 20
+#tabella degli attributi restituita dal comando desc: dichiarazione, valore e CCCD di ogni caratteristica
+ATTRIBUTI = {_inizio: "00002800-0000-1000-8000-00805f9b34fb" for _inizio, _ in SERVIZI.values()}
+for _uuid, (_hnd, _vhnd) in CARATTERISTICHE.items():
+	ATTRIBUTI[_hnd] = "00002803-0000-1000-8000-00805f9b34fb"
+	ATTRIBUTI[_vhnd] = _uuid
+	ATTRIBUTI[_vhnd + 1] = "00002902-0000-1000-8000-00805f9b34fb"
+PROPRIETA = 0x12					#READ | NOTIFY
+
+#intervallo usato dal kernel se i parametri di connessione non sono stati modificati (BlueZ: 30-50 ms)
+INTERVALLO_PREDEFINITO = 50.0
+#modello della trasmissione: la periferica trasmette al massimo PACCHETTI_PER_EVENTO notifiche per evento di
+#connessione (limite dei buffer del controller, non calcolato dall'MTU), quindi le notifiche al secondo sono
+#min(FREQUENZA_AGM, PACCHETTI_PER_EVENTO * 1000 / intervallo). Un pacchetto AGM è una notifica di 20 byte,
+#quindi un MTU più grande non cambia le notifiche al secondo nel modello
+PACCHETTI_PER_EVENTO = 4
+#frequenza con cui il firmware produce i pacchetti AGM e lunghezza della sua coda di trasmissione
+FREQUENZA_AGM = 200.0
+CODA_TRASMISSIONE = 8
+#MTU massimo supportato dalla periferica simulata
+MTU_PERIFERICA = 158
+
+def notifiche_al_secondo(intervallo):
+	#notifiche AGM al secondo consegnate dal modello con l'intervallo di connessione (ms)
+	return min(FREQUENZA_AGM, PACCHETTI_PER_EVENTO * 1000.0 / intervallo)
+
+def valore(v):
+	if isinstance(v, int):
+		return "h%X" % v
+	if isinstance(v, bytes):
+		return "b" + binascii.b2a_hex(v).decode("ascii")
+	return "$" + v
+
+def rispondi(*campi):
+	sys.stdout.write("\x1e".join("%s=%s" % (tag, valore(v)) for tag, v in campi) + "\n")
+	sys.stdout.flush()
+
+class Periferica:
+	def __init__(self):
+		self.connessa = False
+		self.mtu = negoziazione.MTU_PREDEFINITO
+		self.intervallo = INTERVALLO_PREDEFINITO
+		self.notifiche = set()
+		self.prodotti = 0
+		self.coda = 0
+		self.inizio = None
+		self.prossimo_evento = None
+		self.azzera_audio()
+
+	def azzera_audio(self):
+		self.prodotti_audio = 0
+		self.coda_audio = deque()
+		self.indice_audio = 0
+		self.predetto_audio = 0
+
+	def produci_audio(self, n):
+		#codifica dell'n-esimo pacchetto audio, preceduto ogni PACCHETTI_PER_SINCRONIZZAZIONE dallo stato del codificatore;
+		#i pacchetti che non entrano nella coda di trasmissione sono persi (e la decodifica resta sbagliata
+		#fino alla sincronizzazione successiva)
+		if n % PACCHETTI_PER_SINCRONIZZAZIONE == 0:
+			self.accoda_audio(HANDLE_SINCRONIZZAZIONE, audio_adpcm.FORMATO_SINCRONIZZAZIONE.pack(self.indice_audio, self.predetto_audio))
+		campioni = [int(8000 * math.sin(2 * math.pi * 440 * k / audio_adpcm.FREQUENZA))
+			for k in range(n * audio_adpcm.CAMPIONI_PER_PACCHETTO, (n + 1) * audio_adpcm.CAMPIONI_PER_PACCHETTO)]
+		dati, self.indice_audio, self.predetto_audio = audio_adpcm.codifica_adpcm(campioni, self.indice_audio, self.predetto_audio)
+		self.accoda_audio(HANDLE_AUDIO, dati)
+
+	def accoda_audio(self, hnd, dati):
+		if len(self.coda_audio) < CODA_AUDIO:
+			self.coda_audio.append((hnd, dati))
+
+	def stato(self):
+		if self.connessa:
+			rispondi(("rsp", "stat"), ("state", "conn"), ("mtu", self.mtu))
+		else:
+			rispondi(("rsp", "stat"), ("state", "disc"))
+
+	def connetti(self):
+		#il kernel propone alla periferica il massimo dell'intervallo impostato in debugfs
+		intervallo = negoziazione.leggi_intervallo_connessione()
+		self.intervallo = intervallo[1] if intervallo is not None else INTERVALLO_PREDEFINITO
+		self.connessa = True
+		rispondi(("rsp", "stat"), ("state", "tryconn"))
+		self.stato()
+
+	def comando(self, riga):
+		parti = riga.split()
+		if not parti:
+			return True
+		cmd = parti[0]
+		if cmd == "quit":
+			return False
+		if cmd == "conn":
+			self.connetti()
+		elif cmd == "disc":
+			self.connessa = False
+			self.notifiche.clear()
+			self.inizio = self.prossimo_evento = None
+			self.prodotti = self.coda = 0
+			self.azzera_audio()
+			self.stato()
+		elif cmd == "stat":
+			self.stato()
+		elif cmd == "mtu":
+			self.mtu = min(int(parti[1], 16), MTU_PERIFERICA)
+			self.stato()
+		elif cmd == "svcs":
+			campi = [("rsp", "find")]
+			for u, (inizio, fine) in sorted(SERVIZI.items(), key=lambda x: x[1]):
+				if len(parti) < 2 or parti[1].lower() == u:
+					campi += [("hstart", inizio), ("hend", fine), ("uuid", u)]
+			rispondi(*campi)
+		elif cmd == "char":
+			uuid = parti[3] if len(parti) > 3 else None
+			trovate = [(u, h) for u, h in sorted(CARATTERISTICHE.items(), key=lambda x: x[1]) if uuid in (None, u)]
+			if not trovate:
+				#come il bluepy-helper quando la ricerca non trova attributi (errore ATT 0x0a, attribute not found)
+				rispondi(("rsp", "err"), ("code", "atterr"), ("esta", 0x0a))
+				return True
+			campi = [("rsp", "find")]
+			for u, (hnd, vhnd) in trovate:
+				campi += [("hnd", hnd), ("uuid", u), ("props", PROPRIETA), ("vhnd", vhnd)]
+			rispondi(*campi)
+		elif cmd == "desc":
+			inizio, fine = int(parti[1], 16), int(parti[2], 16)
+			campi = [("rsp", "desc")]
+			for hnd, uuid in sorted(ATTRIBUTI.items()):
+				if inizio <= hnd <= fine:
+					campi += [("hnd", hnd), ("uuid", uuid)]
+			rispondi(*campi)
+		elif cmd in ("wr", "wrr"):
+			hnd, dati = int(parti[1], 16), binascii.a2b_hex(parti[2])
+			if dati[:1] == b"\x01":
+				self.notifiche.add(hnd - 1)
+			else:
+				self.notifiche.discard(hnd - 1)
+			if self.notifiche and self.inizio is None:
+				self.inizio = self.prossimo_evento = time.time()
+			rispondi(("rsp", "wr"))
+		elif cmd == "rd":
+			rispondi(("rsp", "rd"), ("d", struct.pack("<Hlh", 0, 100000, 250)))
+		else:
+			rispondi(("rsp", "err"), ("code", "badcmd"))
+		return True
+
+	def evento(self, ora):
+		#evento di connessione: il firmware accoda i pacchetti prodotti dall'ultimo evento (scartando quelli
+		#che non entrano nella coda di trasmissione) e ne trasmette al massimo PACCHETTI_PER_EVENTO
+		prodotti = int((ora - self.inizio) * FREQUENZA_AGM)
+		self.coda = min(self.coda + prodotti - self.prodotti, CODA_TRASMISSIONE)
+		self.prodotti = prodotti
+		inviati = min(self.coda, PACCHETTI_PER_EVENTO) if HANDLE_AGM in self.notifiche else 0
+		self.coda -= inviati
+		for i in range(inviati):
+			t = (prodotti - self.coda - inviati + i) & 0xFFFF
+			acc = [int(1000 * math.sin(t / 50.0 + k)) for k in range(3)]
+			rispondi(("rsp", "ntfy"), ("hnd", HANDLE_AGM), ("d", struct.pack("<H9h", t, *(acc + [0, 0, 0, 300, 0, -400]))))
+		#l'audio usa i pacchetti dell'evento rimasti dopo quelli AGM
+		if HANDLE_AUDIO in self.notifiche:
+			prodotti_audio = int((ora - self.inizio) * FREQUENZA_AUDIO)
+			for n in range(self.prodotti_audio, prodotti_audio):
+				self.produci_audio(n)
+			self.prodotti_audio = prodotti_audio
+			for _ in range(min(len(self.coda_audio), PACCHETTI_PER_EVENTO - inviati)):
+				hnd, dati = self.coda_audio.popleft()
+				rispondi(("rsp", "ntfy"), ("hnd", hnd), ("d", dati))
+		for hnd, pacchetto in sorted(PACCHETTI_LENTI.items()):
+			if hnd in self.notifiche:
+				rispondi(("rsp", "ntfy"), ("hnd", hnd), ("d", pacchetto(prodotti & 0xFFFF)))
+
+	def esegui(self):
+		#i comandi possono arrivare più di uno alla volta (scritture in sequenza), quindi stdin viene letto
+		#direttamente dal descrittore e diviso in righe qui
+		fd = sys.stdin.fileno()
+		ricevuto = b""
+		while True:
+			attesa = None
+			if self.connessa and self.prossimo_evento is not None:
+				attesa = max(0.0, self.prossimo_evento - time.time())
+			pronti, _, _ = select.select([fd], [], [], attesa)
+			if pronti:
+				blocco = os.read(fd, 4096)
+				if not blocco:
+					return
+				ricevuto += blocco
+				while b"\n" in ricevuto:
+					riga, ricevuto = ricevuto.split(b"\n", 1)
+					if not self.comando(riga.decode("utf-8")):
+						return
+			ora = time.time()
+			if self.connessa and self.prossimo_evento is not None and ora >= self.prossimo_evento:
+				if self.notifiche:
+					self.evento(ora)
+				self.prossimo_evento += self.intervallo / 1000.0
+
+if __name__ == '__main__':
+	Periferica().esegui()
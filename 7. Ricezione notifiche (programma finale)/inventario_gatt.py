@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""Inventario GATT del SensorTile in JSON: servizi, caratteristiche e descrittori sono scoperti con tre sole richieste
+al bluepy-helper (servizi, tutte le caratteristiche, tutti i descrittori) e ogni caratteristica riceve il nome della
+feature BlueST con una ricerca per uuid nella tabella di caratteristiche_bluest, invece di confrontare ogni uuid con
+l'elenco di tutte le feature come "2. Identify sensortile services and characteristics"""
+import json
+import time
+import bisect
+import argparse
+import datetime
+
+import caratteristiche_bluest
+
+VERSIONE = 1
+#uuid delle dichiarazioni di servizi e caratteristiche e del CCCD nell'elenco dei descrittori
+DICHIARAZIONI = {"00002800-0000-1000-8000-00805f9b34fb", "00002801-0000-1000-8000-00805f9b34fb", "00002803-0000-1000-8000-00805f9b34fb"}
+UUID_CCCD = "00002902-0000-1000-8000-00805f9b34fb"
+#proprietà delle caratteristiche (bit della dichiarazione)
+PROPRIETA = [(0x01, "BROADCAST"), (0x02, "READ"), (0x04, "WRITE NO RESPONSE"), (0x08, "WRITE"), (0x10, "NOTIFY"),
+	(0x20, "INDICATE"), (0x40, "WRITE SIGNED"), (0x80, "EXTENDED PROPERTIES")]
+
+def _nome(uuid, tabella):
+	#nome BlueST dalla tabella oppure nome standard del Bluetooth SIG (uuids.json); None se l'uuid non è noto
+	nome = tabella.get(str(uuid))
+	if nome is not None:
+		return nome
+	comune = uuid.getCommonName()
+	return comune if comune != str(uuid) else None
+
+def inventario(conn):
+	#albero GATT della periferica connessa: una richiesta "svcs", una "char" e una "desc" su tutti gli handle,
+	#poi caratteristiche e descrittori sono assegnati ai servizi confrontando gli handle
+	servizi = sorted(conn.discoverServices().values(), key=lambda s: s.hndStart)
+	caratteristiche = sorted(conn.getCharacteristics(), key=lambda c: c.handle)
+	descrittori = sorted(conn.getDescriptors(), key=lambda d: d.handle)
+	inizi = [s.hndStart for s in servizi]
+	handle_descrittori = [d.handle for d in descrittori]
+	risultato = [{"uuid": str(s.uuid), "nome": _nome(s.uuid, caratteristiche_bluest.SERVIZI), "inizio": s.hndStart,
+		"fine": s.hndEnd, "caratteristiche": []} for s in servizi]
+	indice = {}
+	for n, ch in enumerate(caratteristiche):
+		#i descrittori di una caratteristica vanno dal valore alla dichiarazione successiva (o alla fine del servizio)
+		i = bisect.bisect_right(inizi, ch.handle) - 1
+		fine = risultato[i]["fine"] if i >= 0 else 0xFFFF
+		if n + 1 < len(caratteristiche):
+			fine = min(fine, caratteristiche[n + 1].handle - 1)
+		propri = []
+		for d in descrittori[bisect.bisect_right(handle_descrittori, ch.valHandle):bisect.bisect_right(handle_descrittori, fine)]:
+			if str(d.uuid) in DICHIARAZIONI:
+				break
+			propri.append({"uuid": str(d.uuid), "nome": _nome(d.uuid, {}), "handle": d.handle})
+		cccd = next((d["handle"] for d in propri if d["uuid"] == UUID_CCCD), None)
+		voce_tabella = caratteristiche_bluest.per_uuid(ch.uuid)
+		voce = {"uuid": str(ch.uuid), "nome": voce_tabella.nome if voce_tabella is not None else None,
+			"descrizione": voce_tabella.feature if voce_tabella is not None else _nome(ch.uuid, caratteristiche_bluest.ALTRE_CARATTERISTICHE),
+			"handle": ch.handle, "handle_valore": ch.valHandle, "proprieta": [p for bit, p in PROPRIETA if ch.properties & bit],
+			"cccd": cccd, "descrittori": propri}
+		if i >= 0:
+			risultato[i]["caratteristiche"].append(voce)
+		#indice per la cache degli handle: nome della tabella delle feature -> handle
+		if voce["nome"] is not None:
+			indice[voce["nome"]] = {"uuid": voce["uuid"], "handle": ch.handle, "handle_valore": ch.valHandle,
+				"proprieta": ch.properties, "cccd": cccd}
+	return {"servizi": risultato, "handle": indice}
+
+def carica_inventario(percorso, indirizzo=None):
+	#inventario salvato da questo programma; con indirizzo, None se l'inventario è di un altro dispositivo
+	with open(percorso, encoding="utf-8") as fp:
+		dati = json.load(fp)
+	if dati.get("versione") != VERSIONE:
+		raise ValueError("{}: versione dell'inventario non supportata ({})".format(percorso, dati.get("versione")))
+	if indirizzo is not None and dati.get("indirizzo", "").lower() != indirizzo.lower():
+		return None
+	return dati
+
+if __name__ == '__main__':
+	import Ricezione_notifiche as rn
+	parser = argparse.ArgumentParser(description="Inventario GATT del SensorTile in formato JSON")
+	parser.add_argument("indirizzo", help="mac-address del SensorTile")
+	parser.add_argument("--tipo-indirizzo", default=rn.ADDR_TYPE_RANDOM, choices=[rn.ADDR_TYPE_PUBLIC, rn.ADDR_TYPE_RANDOM])
+	parser.add_argument("--uscita", help="file JSON in cui salvare l'inventario (predefinito: stampato a console)")
+	args = parser.parse_args()
+	conn = rn.Peripheral(args.indirizzo, args.tipo_indirizzo)
+	try:
+		inizio = time.perf_counter()
+		dati = inventario(conn)
+		durata = time.perf_counter() - inizio
+	finally:
+		conn.disconnect()
+	dati = dict({"versione": VERSIONE, "indirizzo": args.indirizzo.lower(), "tipo_indirizzo": args.tipo_indirizzo,
+		"data": datetime.datetime.now().isoformat(), "durata": durata}, **dati)
+	testo = json.dumps(dati, indent=1, ensure_ascii=False)
+	if args.uscita is None:
+		print(testo)
+	else:
+		with open(args.uscita, "w", encoding="utf-8") as fp:
+			fp.write(testo + "\n")
+		print("{} servizi, {} caratteristiche note su {} in {:.3f} s".format(len(dati["servizi"]), len(dati["handle"]),
+			sum(len(s["caratteristiche"]) for s in dati["servizi"]), durata))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""Metriche della ricezione in formato Prometheus, esposte via HTTP su localhost"""
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+TIPO_CONTENUTO = "text/plain; version=0.0.4; charset=utf-8"
+
+#nome, tipo e descrizione delle metriche esposte
+METRICHE = [
+	("sensortile_connected", "gauge", "1 se il dispositivo è connesso"),
+	("sensortile_reconnects_total", "counter", "riconnessioni dopo una disconnessione"),
+	("sensortile_reconnect_duration_seconds", "summary", "tempo tra la disconnessione e la riconnessione"),
+	("sensortile_connection_uptime_seconds", "gauge", "durata della connessione attuale"),
+	("sensortile_notifications_total", "counter", "notifiche ricevute nella connessione attuale"),
+	("sensortile_notification_bytes_total", "counter", "byte ricevuti nella connessione attuale"),
+	("sensortile_notification_rate_hz", "gauge", "frequenza delle notifiche nell'ultima finestra"),
+	("sensortile_notification_peak_rate_hz", "gauge", "frequenza di picco delle notifiche"),
+	("sensortile_notifications_lost_total", "counter", "pacchetti persi via radio, dai salti del timestamp del dispositivo"),
+	("sensortile_notification_gaps_total", "counter", "salti del timestamp del dispositivo con pacchetti persi"),
+	("sensortile_queue_depth", "gauge", "elementi in coda nella pipeline"),
+	("sensortile_queue_dropped_total", "counter", "elementi scartati perchè la coda era piena"),
+	("sensortile_queue_degraded_total", "counter", "notifiche salvate solo nel registro grezzo"),
+	("sensortile_stage_seconds", "summary", "tempo speso negli stadi parse, decodifica e sink"),
+	("sensortile_stage_max_seconds", "gauge", "tempo massimo di un'esecuzione dello stadio"),
+	("sensortile_ring_lost_total", "counter", "campioni sovrascritti nei buffer circolari prima di essere letti"),
+]
+
+def _etichette(etichette):
+	return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in etichette) + "}"
+
+class StatoDispositivo:
+	#aggiornato dal ciclo di connessione con semplici assegnazioni; il thread HTTP legge solo copie dei valori
+	def __init__(self, indirizzo, traccia_connessione=True):
+		self.indirizzo = indirizzo
+		#False per i processi che non gestiscono la connessione (es. l'aggregatore di raccolta_multipla)
+		self.traccia_connessione = traccia_connessione
+		self.connesso = False
+		self.connesso_da = None
+		self.disconnesso_da = None
+		self.riconnessioni = 0
+		self.durata_riconnessioni = 0.0
+		self.statistiche = None
+		self.pipeline = None
+		self.nomi_handle = {}
+		self.persi_buffer = {}
+
+	def connessione(self, statistiche=None, pipeline=None, nomi_handle=None):
+		ora = time.time()
+		if self.disconnesso_da is not None:
+			self.riconnessioni += 1
+			self.durata_riconnessioni += ora - self.disconnesso_da
+			self.disconnesso_da = None
+		self.statistiche = statistiche
+		self.pipeline = pipeline
+		self.nomi_handle = dict(nomi_handle or {})
+		self.connesso_da = ora
+		self.connesso = True
+
+	def disconnessione(self):
+		if self.connesso:
+			self.disconnesso_da = time.time()
+		self.connesso = False
+		self.pipeline = None
+
+	def istantanea(self):
+		#copia dei valori esposti, serializzabile in JSON per la pubblicazione ad un altro processo
+		statistiche = self.statistiche
+		pipeline = self.pipeline
+		return {"connesso": self.connesso, "connesso_da": self.connesso_da, "riconnessioni": self.riconnessioni,
+			"durata_riconnessioni": self.durata_riconnessioni,
+			"riepilogo": statistiche.riepilogo() if statistiche is not None else None,
+			"code": pipeline.contatori() if pipeline is not None else None,
+			"nomi_handle": dict(self.nomi_handle)}
+
+class StatoRemoto(StatoDispositivo):
+	#stato di un dispositivo gestito da un altro processo (es. i processi di raccolta di raccolta_multipla):
+	#leggi restituisce l'ultima istantanea pubblicata, o None se non ce ne sono ancora
+	def __init__(self, indirizzo, leggi):
+		StatoDispositivo.__init__(self, indirizzo)
+		self.leggi = leggi
+
+	def istantanea(self):
+		istantanea = self.leggi()
+		if istantanea is None:
+			return None
+		#in JSON le chiavi sono stringhe: gli handle tornano interi
+		if istantanea["riepilogo"] is not None:
+			istantanea["riepilogo"]["handle"] = {int(h): v for h, v in istantanea["riepilogo"]["handle"].items()}
+		istantanea["nomi_handle"] = {int(h): v for h, v in istantanea["nomi_handle"].items()}
+		return istantanea
+
+class PubblicazioneMetriche:
+	#thread che pubblica periodicamente l'istantanea di uno stato con pubblica (es. BachecaScrittura.pubblica
+	#di buffer_condiviso), così le metriche di un processo sono servite dal registro di un altro
+	def __init__(self, stato, pubblica, intervallo=1.0):
+		self.stato = stato
+		self.pubblica = pubblica
+		self.intervallo = intervallo
+		self.fermato = threading.Event()
+		self.thread = threading.Thread(target=self._esegui, name="pubblicazione metriche")
+		self.thread.daemon = True
+
+	def _esegui(self):
+		while not self.fermato.wait(self.intervallo):
+			self.pubblica(self.stato.istantanea())
+
+	def avvia(self):
+		self.pubblica(self.stato.istantanea())
+		self.thread.start()
+		return self
+
+	def ferma(self):
+		#ultima pubblicazione con i contatori finali
+		self.fermato.set()
+		self.thread.join()
+		self.pubblica(self.stato.istantanea())
+
+class RegistroMetriche:
+	def __init__(self):
+		self.dispositivi = {}
+
+	def dispositivo(self, indirizzo, traccia_connessione=True):
+		if indirizzo not in self.dispositivi:
+			self.dispositivi[indirizzo] = StatoDispositivo(indirizzo, traccia_connessione)
+		return self.dispositivi[indirizzo]
+
+	def remoto(self, indirizzo, leggi):
+		#dispositivo le cui metriche sono pubblicate da un altro processo (vedi StatoRemoto)
+		self.dispositivi[indirizzo] = StatoRemoto(indirizzo, leggi)
+		return self.dispositivi[indirizzo]
+
+	def _campioni(self):
+		#(nome, etichette, valore) di tutte le metriche, letti senza lock dallo stato dei dispositivi
+		ora = time.time()
+		for d in list(self.dispositivi.values()):
+			base = [("device", d.indirizzo)]
+			istantanea = d.istantanea()
+			if istantanea is not None:
+				for campione in self._campioni_dispositivo(d, istantanea, base, ora):
+					yield campione
+			for flusso, persi in sorted(list(d.persi_buffer.items())):
+				yield "sensortile_ring_lost_total", base + [("stream", flusso)], persi
+
+	def _campioni_dispositivo(self, d, istantanea, base, ora):
+		if d.traccia_connessione:
+			yield "sensortile_connected", base, 1 if istantanea["connesso"] else 0
+			yield "sensortile_reconnects_total", base, istantanea["riconnessioni"]
+			yield "sensortile_reconnect_duration_seconds_sum", base, istantanea["durata_riconnessioni"]
+			yield "sensortile_reconnect_duration_seconds_count", base, istantanea["riconnessioni"]
+			connesso_da = istantanea["connesso_da"]
+			yield "sensortile_connection_uptime_seconds", base, ora - connesso_da if istantanea["connesso"] and connesso_da else 0
+		riepilogo = istantanea["riepilogo"]
+		if riepilogo is not None:
+			for handle, valori in sorted(riepilogo["handle"].items()):
+				etichette = base + [("handle", "0x%04x" % handle), ("characteristic", istantanea["nomi_handle"].get(handle, ""))]
+				yield "sensortile_notifications_total", etichette, valori["conteggio"]
+				yield "sensortile_notification_bytes_total", etichette, valori["byte"]
+				yield "sensortile_notification_rate_hz", etichette, valori["frequenza"]
+				yield "sensortile_notification_peak_rate_hz", etichette, valori["picco"]
+				yield "sensortile_notifications_lost_total", etichette, valori["persi"]
+				yield "sensortile_notification_gaps_total", etichette, valori["buchi"]
+			for nome, valori in sorted(riepilogo["stadi"].items()):
+				etichette = base + [("stage", nome)]
+				yield "sensortile_stage_seconds_sum", etichette, valori["totale"]
+				yield "sensortile_stage_seconds_count", etichette, valori["conteggio"]
+				yield "sensortile_stage_max_seconds", etichette, valori["massimo"]
+		code = istantanea["code"]
+		if code is not None:
+			for coda, contatori in sorted(code.items()):
+				for flusso, valori in sorted(contatori.items(), key=lambda x: str(x[0])):
+					etichette = base + [("queue", coda), ("stream", flusso)]
+					yield "sensortile_queue_depth", etichette, valori["profondita"]
+					yield "sensortile_queue_dropped_total", etichette, valori["scartati"]
+					yield "sensortile_queue_degraded_total", etichette, valori["degradati"]
+
+	def testo(self):
+		#formato di esposizione testuale di Prometheus: # HELP / # TYPE seguiti dai campioni della metrica
+		campioni = {}
+		for nome, etichette, valore in self._campioni():
+			campioni.setdefault(nome, []).append((etichette, valore))
+		righe = []
+		for nome, tipo, descrizione in METRICHE:
+			nomi = [nome + "_sum", nome + "_count"] if tipo == "summary" else [nome]
+			if not any(n in campioni for n in nomi):
+				continue
+			righe.append("# HELP {} {}".format(nome, descrizione))
+			righe.append("# TYPE {} {}".format(nome, tipo))
+			for n in nomi:
+				for etichette, valore in campioni.get(n, ()):
+					righe.append("{}{} {}".format(n, _etichette(etichette), repr(float(valore))))
+		return "\n".join(righe) + "\n"
+
+class _GestoreRichieste(BaseHTTPRequestHandler):
+	def do_GET(self):
+		if self.path.split("?")[0] not in ("/metrics", "/"):
+			self.send_error(404)
+			return
+		corpo = self.server.registro.testo().encode("utf-8")
+		self.send_response(200)
+		self.send_header("Content-Type", TIPO_CONTENUTO)
+		self.send_header("Content-Length", str(len(corpo)))
+		self.end_headers()
+		self.wfile.write(corpo)
+
+	def log_message(self, formato, *args):
+		#nessuna riga sulla console per ogni richiesta
+		pass
+
+class ServerMetriche:
+	#le richieste sono servite da un thread separato che legge soltanto lo stato del registro,
+	#quindi il ciclo di ricezione non viene mai bloccato
+	def __init__(self, registro, porta=9108, indirizzo="127.0.0.1"):
+		self.server = HTTPServer((indirizzo, porta), _GestoreRichieste)
+		self.server.registro = registro
+		self.thread = threading.Thread(target=self.server.serve_forever, name="metriche")
+		self.thread.daemon = True
+
+	def avvia(self):
+		self.thread.start()
+		return self
+
+	def ferma(self):
+		self.server.shutdown()
+		self.server.server_close()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""Negoziazione dell'MTU e dei parametri di connessione per aumentare le notifiche ricevute al secondo"""
+import os
+
+#cartella debugfs del kernel con i parametri proposti dall'host alle nuove connessioni LE
+#(conn_min_interval e conn_max_interval sono in unità di 1.25 ms, scrivibili solo da root);
+#la variabile d'ambiente permette di usare un'altra cartella con gli stessi file (es. con helper_simulato.py)
+CARTELLA_DEBUGFS = os.environ.get("BLUETOOTH_DEBUGFS", "/sys/kernel/debug/bluetooth")
+UNITA_INTERVALLO = 1.25
+#MTU predefinito dell'ATT su LE (payload di una notifica = MTU - 3 byte)
+MTU_PREDEFINITO = 23
+
+def _file_intervallo(hci, nome):
+	return os.path.join(CARTELLA_DEBUGFS, "hci{}".format(hci), nome)
+
+def leggi_intervallo_connessione(hci=0):
+	#intervallo (minimo, massimo) in ms proposto alle nuove connessioni, None se non è leggibile
+	try:
+		valori = []
+		for nome in ("conn_min_interval", "conn_max_interval"):
+			with open(_file_intervallo(hci, nome)) as fp:
+				valori.append(int(fp.read().strip()) * UNITA_INTERVALLO)
+		return tuple(valori)
+	except (IOError, OSError, ValueError):
+		return None
+
+def imposta_intervallo_connessione(minimo, massimo, hci=0):
+	#va chiamata prima della connessione: il kernel propone l'intervallo (in ms) alla periferica quando
+	#crea la connessione. Restituisce l'intervallo precedente oppure None se non è stato possibile impostarlo
+	#(debugfs non montato o permessi insufficienti), nel qual caso restano i valori predefiniti.
+	#L'impostazione vale per tutte le connessioni LE dell'adattatore: l'intervallo precedente va ripristinato alla fine
+	precedente = leggi_intervallo_connessione(hci)
+	if precedente is None:
+		return None
+	unita_min = int(round(minimo / UNITA_INTERVALLO))
+	unita_max = int(round(massimo / UNITA_INTERVALLO))
+	#il kernel rifiuta un minimo maggiore del massimo attuale (e viceversa), quindi l'ordine di scrittura
+	#dipende dalla direzione in cui si sposta l'intervallo
+	if unita_min > precedente[1] / UNITA_INTERVALLO:
+		ordine = [("conn_max_interval", unita_max), ("conn_min_interval", unita_min)]
+	else:
+		ordine = [("conn_min_interval", unita_min), ("conn_max_interval", unita_max)]
+	scritti = []
+	try:
+		for nome, valore in ordine:
+			with open(_file_intervallo(hci, nome), "w") as fp:
+				fp.write(str(valore))
+			scritti.append(nome)
+	except (IOError, OSError):
+		#se solo il primo valore è stato scritto si ripristina quello precedente
+		intervalli_precedenti = {"conn_min_interval": precedente[0], "conn_max_interval": precedente[1]}
+		for nome in scritti:
+			try:
+				with open(_file_intervallo(hci, nome), "w") as fp:
+					fp.write(str(int(round(intervalli_precedenti[nome] / UNITA_INTERVALLO))))
+			except (IOError, OSError):
+				pass
+		return None
+	return precedente
+
+def negozia_mtu(conn, mtu):
+	#chiede al bluepy-helper lo scambio dell'MTU; la risposta di stato contiene l'MTU concesso
+	#(il minimo tra quello richiesto e quello supportato dalla periferica)
+	rsp = conn.setMTU(mtu)
+	if rsp is not None and "mtu" in rsp:
+		return rsp["mtu"][0]
+	return None
+
+def negozia_connessione(conn, mtu=None, intervallo=None, hci=0):
+	#da chiamare subito dopo la connessione (l'intervallo va impostato prima, con imposta_intervallo_connessione);
+	#restituisce i metadati della sessione con l'MTU richiesto e quello concesso. Dell'intervallo si conoscono solo
+	#quello richiesto e i limiti che il kernel ha proposto alla periferica (letti da debugfs): l'intervallo scelto
+	#dalla periferica non è esposto né dal bluepy-helper né da debugfs
+	metadati = {
+		"mtu_richiesto": mtu,
+		"mtu": MTU_PREDEFINITO,
+		"intervallo_richiesto": list(intervallo) if intervallo is not None else None,
+		"intervallo_proposto": leggi_intervallo_connessione(hci),
+	}
+	if metadati["intervallo_proposto"] is not None:
+		metadati["intervallo_proposto"] = list(metadati["intervallo_proposto"])
+	if mtu is not None and mtu > MTU_PREDEFINITO:
+		concesso = negozia_mtu(conn, mtu)
+		if concesso is not None:
+			metadati["mtu"] = concesso
+	metadati["payload_notifica"] = metadati["mtu"] - 3
+	return metadati
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+"""Stima di pitch e roll lato host a partire da accelerometro e giroscopio"""
+import math
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+#costante per la conversione da radianti a gradi
+RAD_GRADI = 180 / math.pi
+
+def angoli_accelerometro(acc_x, acc_y, acc_z):
+	#pitch e roll (in gradi) ricavati dalle sole componenti della gravità misurate dall'accelerometro
+	pitch = math.atan2(-acc_x, math.sqrt(acc_y * acc_y + acc_z * acc_z)) * RAD_GRADI
+	roll = math.atan2(acc_y, acc_z) * RAD_GRADI
+	return pitch, roll
+
+def angoli_accelerometro_array(acc):
+	#versione vettoriale di angoli_accelerometro, acc ha forma (N, 3) e il risultato ha forma (N, 2)
+	_richiedi_numpy()
+	acc = np.asarray(acc, dtype=float)
+	pitch = np.arctan2(-acc[..., 0], np.hypot(acc[..., 1], acc[..., 2]))
+	roll = np.arctan2(acc[..., 1], acc[..., 2])
+	return np.stack((pitch, roll), axis=-1) * RAD_GRADI
+
+def _richiedi_numpy():
+	if np is None:
+		raise ImportError("Per l'elaborazione vettoriale è necessario il pacchetto numpy")
+
+def _intervalli(t, t_precedente):
+	#intervalli di tempo tra un campione e il precedente (il primo rispetto all'ultimo campione già elaborato)
+	t = np.asarray(t, dtype=float)
+	dt = np.empty_like(t)
+	dt[1:] = t[1:] - t[:-1]
+	dt[0] = 0.0 if t_precedente is None else t[0] - t_precedente
+	#un tempo che torna indietro (es. cambio dell'ora di sistema) non deve far divergere il filtro
+	np.maximum(dt, 0.0, out=dt)
+	return dt
+
+def _scan_lineare(A, b):
+	#risolve la ricorrenza x[k] = A[k] @ x[k-1] + b[k] per tutti i k con una scansione parallela
+	#(log2(N) passi vettoriali invece di N iterazioni in Python)
+	#A ha forma (N, ..., n, n), b ha forma (N, ..., n); restituisce le coppie cumulative (A, b)
+	#tali che x[k] = A[k] @ x[-1] + b[k]
+	A = A.copy()
+	b = b.copy()
+	passo = 1
+	n = A.shape[0]
+	while passo < n:
+		A_prec = A[:-passo]
+		b_prec = b[:-passo]
+		b[passo:] = np.einsum('...ij,...j->...i', A[passo:], b_prec) + b[passo:]
+		A[passo:] = np.matmul(A[passo:], A_prec)
+		passo *= 2
+	return A, b
+
+class FiltroComplementare:
+	#filtro complementare: integra il giroscopio e corregge la deriva con gli angoli dell'accelerometro
+	#alpha vicino a 1 dà più peso al giroscopio
+	def __init__(self, alpha=0.98):
+		self.alpha = alpha
+		self.reset()
+
+	def reset(self):
+		self.pitch = None
+		self.roll = None
+		self.t = None
+
+	def aggiorna(self, acc, gyr, t):
+		#elaborazione incrementale di un pacchetto: acc in g, gyr in dps, t in secondi
+		pitch_acc, roll_acc = angoli_accelerometro(acc[0], acc[1], acc[2])
+		if self.pitch is None:
+			#primo campione: nessun dato del giroscopio da integrare
+			self.pitch, self.roll = pitch_acc, roll_acc
+		else:
+			dt = max(t - self.t, 0.0)
+			a = self.alpha
+			self.pitch = a * (self.pitch + gyr[1] * dt) + (1 - a) * pitch_acc
+			self.roll = a * (self.roll + gyr[0] * dt) + (1 - a) * roll_acc
+		self.t = t
+		return self.pitch, self.roll
+
+	def elabora(self, acc, gyr, t):
+		#elaborazione vettoriale di un intero registrato: acc e gyr hanno forma (N, 3), t ha forma (N,)
+		#restituisce un array (N, 2) con pitch e roll in gradi; lo stato finale resta disponibile per aggiorna()
+		_richiedi_numpy()
+		angoli_acc = angoli_accelerometro_array(acc)
+		if len(angoli_acc) == 0:
+			return angoli_acc
+		gyr = np.asarray(gyr, dtype=float)
+		dt = _intervalli(t, self.t)
+		a = self.alpha
+		#la ricorrenza è y[k] = a * y[k-1] + u[k]
+		u = a * gyr[:, [1, 0]] * dt[:, None] + (1 - a) * angoli_acc
+		A = np.full((len(u), 2, 1, 1), a)
+		if self.pitch is None:
+			#il primo campione inizializza il filtro con gli angoli dell'accelerometro
+			A[0] = 0.0
+			u[0] = angoli_acc[0]
+			stato = np.zeros(2)
+		else:
+			stato = np.array([self.pitch, self.roll])
+		A_cum, b_cum = _scan_lineare(A, u[..., None])
+		angoli = A_cum[..., 0, 0] * stato + b_cum[..., 0]
+		self.pitch, self.roll = float(angoli[-1, 0]), float(angoli[-1, 1])
+		self.t = float(np.asarray(t, dtype=float)[-1])
+		return angoli
+
+class FiltroKalman:
+	#filtro di Kalman a due stati (angolo e bias del giroscopio) per ciascun asse
+	#q_angolo e q_bias sono le varianze di processo, r_misura la varianza degli angoli dell'accelerometro
+	def __init__(self, q_angolo=0.001, q_bias=0.003, r_misura=0.03):
+		self.q_angolo = q_angolo
+		self.q_bias = q_bias
+		self.r_misura = r_misura
+		self.reset()
+
+	def reset(self):
+		#stato [angolo, bias] per pitch e roll
+		self.stato = [[0.0, 0.0], [0.0, 0.0]]
+		#la covarianza è la stessa per i due assi perchè dipende solo dagli intervalli di tempo
+		self.P = [[0.0, 0.0], [0.0, 0.0]]
+		self.t = None
+
+	@property
+	def pitch(self):
+		return None if self.t is None else self.stato[0][0]
+
+	@property
+	def roll(self):
+		return None if self.t is None else self.stato[1][0]
+
+	def _guadagno(self, dt):
+		#predizione e aggiornamento della covarianza, restituisce il guadagno di Kalman (k0, k1)
+		P = self.P
+		p00 = P[0][0] + dt * (dt * P[1][1] - P[0][1] - P[1][0] + self.q_angolo)
+		p01 = P[0][1] - dt * P[1][1]
+		p10 = P[1][0] - dt * P[1][1]
+		p11 = P[1][1] + self.q_bias * dt
+		s = p00 + self.r_misura
+		k0 = p00 / s
+		k1 = p10 / s
+		self.P = [[p00 - k0 * p00, p01 - k0 * p01], [p10 - k1 * p00, p11 - k1 * p01]]
+		return k0, k1
+
+	def aggiorna(self, acc, gyr, t):
+		#elaborazione incrementale di un pacchetto: acc in g, gyr in dps, t in secondi
+		misure = angoli_accelerometro(acc[0], acc[1], acc[2])
+		if self.t is None:
+			self.stato = [[misure[0], 0.0], [misure[1], 0.0]]
+			self.t = t
+			return misure
+		dt = max(t - self.t, 0.0)
+		k0, k1 = self._guadagno(dt)
+		#il pitch ruota attorno all'asse y, il roll attorno all'asse x
+		for asse, velocita in ((0, gyr[1]), (1, gyr[0])):
+			angolo, bias = self.stato[asse]
+			angolo += dt * (velocita - bias)
+			errore = misure[asse] - angolo
+			self.stato[asse] = [angolo + k0 * errore, bias + k1 * errore]
+		self.t = t
+		return self.pitch, self.roll
+
+	def elabora(self, acc, gyr, t):
+		#elaborazione vettoriale di un intero registrato: acc e gyr hanno forma (N, 3), t ha forma (N,)
+		#i guadagni non dipendono dalle misure e vengono calcolati a parte, la ricorrenza sugli stati
+		#viene poi risolta con una scansione parallela
+		_richiedi_numpy()
+		misure = angoli_accelerometro_array(acc)
+		n = len(misure)
+		if n == 0:
+			return misure
+		gyr = np.asarray(gyr, dtype=float)
+		t = np.asarray(t, dtype=float)
+		dt = _intervalli(t, self.t)
+		inizio = 0
+		if self.t is None:
+			#il primo campione inizializza il filtro con gli angoli dell'accelerometro
+			self.stato = [[misure[0, 0], 0.0], [misure[0, 1], 0.0]]
+			inizio = 1
+		K = self._guadagni(dt[inizio:])
+		dt_s = dt[inizio:]
+		velocita = gyr[inizio:][:, [1, 0]]
+		#x[k] = (I - K H) (F x[k-1] + B u[k]) + K z[k] con F = [[1, -dt], [0, 1]], B = [dt, 0], H = [1, 0]
+		m = len(dt_s)
+		IKH = np.zeros((m, 2, 2))
+		IKH[:, 0, 0] = 1 - K[:, 0]
+		IKH[:, 1, 0] = -K[:, 1]
+		IKH[:, 1, 1] = 1
+		F = np.zeros((m, 2, 2))
+		F[:, 0, 0] = 1
+		F[:, 0, 1] = -dt_s
+		F[:, 1, 1] = 1
+		A = np.matmul(IKH, F)
+		#per gli assi (pitch, roll) le matrici sono le stesse, cambiano solo ingressi e misure
+		Bu = np.zeros((m, 2, 2))
+		Bu[:, :, 0] = dt_s[:, None] * velocita
+		b = np.einsum('kij,kaj->kai', IKH, Bu) + K[:, None, :] * misure[inizio:][:, :, None]
+		A_cum, b_cum = _scan_lineare(np.broadcast_to(A[:, None], (m, 2, 2, 2)), b)
+		x0 = np.array(self.stato, dtype=float)
+		stati = np.einsum('kaij,aj->kai', A_cum, x0) + b_cum
+		angoli = np.empty((n, 2))
+		if inizio:
+			angoli[0] = misure[0]
+		angoli[inizio:] = stati[..., 0]
+		if m:
+			self.stato = stati[-1].tolist()
+		self.t = float(t[-1])
+		return angoli
+
+	def _guadagni(self, dt):
+		#sequenza dei guadagni di Kalman per tutti gli intervalli; quando il guadagno converge e
+		#l'intervallo resta costante, il resto del tratto a intervallo costante riusa lo stesso guadagno
+		n = len(dt)
+		K = np.empty((n, 2))
+		cambi = np.flatnonzero(np.diff(dt)) + 1
+		k = 0
+		precedente = None
+		while k < n:
+			K[k] = guadagno = self._guadagno(float(dt[k]))
+			if precedente is not None and dt[k] == dt[k - 1] and \
+				abs(guadagno[0] - precedente[0]) < 1e-12 and abs(guadagno[1] - precedente[1]) < 1e-12:
+				#fine del tratto a intervallo costante
+				fine = cambi[np.searchsorted(cambi, k, side='right')] if len(cambi) and cambi[-1] > k else n
+				K[k + 1:fine] = guadagno
+				k = fine
+				precedente = None
+				continue
+			precedente = guadagno
+			k += 1
+		return K
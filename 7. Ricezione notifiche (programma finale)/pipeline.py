@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""Ricezione delle notifiche disaccoppiata da decodifica e salvataggio tramite thread di lavoro"""
+import time
+import struct
+import datetime
+import threading
+from collections import deque
+
+import profilazione
+from caratteristiche_bluest import FORMATO_TIMESTAMP
+
+#politiche applicate quando la coda di un flusso è piena
+BLOCCA = "blocca"						#chi inserisce attende che si liberi spazio (contropressione verso il bluepy-helper)
+SCARTA_VECCHI = "scarta_vecchi"			#l'elemento più vecchio viene scartato per fare posto al nuovo
+SCARTA_NUOVI = "scarta_nuovi"			#il nuovo elemento viene scartato
+SOLO_GREZZO = "solo_grezzo"				#la notifica non viene decodificata ma solo salvata nel registro grezzo
+POLITICHE = (BLOCCA, SCARTA_VECCHI, SCARTA_NUOVI, SOLO_GREZZO)
+#coda di salvataggio delle notifiche degradate (quando è piena le notifiche vengono scartate)
+REGISTRO_GREZZO = "registro_grezzo"
+#timestamp del dispositivo all'inizio dei pacchetti BlueST
+TIMESTAMP = struct.Struct(FORMATO_TIMESTAMP)
+
+class CodeFlussi:
+	#code limitate, una per flusso, consumate da un solo thread; tutte le code condividono una condizione
+	#così il thread consumatore si sveglia quando arriva un elemento su una qualsiasi di esse
+	def __init__(self, capacita=1024, politica=BLOCCA, politiche=None):
+		for p in [politica] + list((politiche or {}).values()):
+			if p not in POLITICHE:
+				raise ValueError("Politica sconosciuta: {} (previste: {})".format(p, ", ".join(POLITICHE)))
+		self.capacita = capacita
+		self.politica = politica
+		self.politiche = dict(politiche or {})
+		self.condizione = threading.Condition()
+		self.code = {}
+		self.scartati = {}
+		self.degradati = {}
+		self.chiusa = False
+
+	def _coda(self, chiave):
+		if chiave not in self.code:
+			self.code[chiave] = deque()
+			self.scartati[chiave] = 0
+			self.degradati[chiave] = 0
+		return self.code[chiave]
+
+	def politica_flusso(self, chiave):
+		return self.politiche.get(chiave, self.politica)
+
+	def _inserisci(self, chiave, elemento):
+		#da chiamare con la condizione acquisita
+		coda = self._coda(chiave)
+		if len(coda) >= self.capacita:
+			politica = self.politica_flusso(chiave)
+			if politica == BLOCCA:
+				while len(coda) >= self.capacita and not self.chiusa:
+					#il consumatore va svegliato anche per gli elementi del lotto già accodati
+					self.condizione.notify_all()
+					self.condizione.wait()
+			elif politica == SCARTA_VECCHI:
+				coda.popleft()
+				self.scartati[chiave] += 1
+			elif politica == SOLO_GREZZO:
+				self.degradati[chiave] += 1
+				return False
+			else:
+				self.scartati[chiave] += 1
+				return False
+		coda.append(elemento)
+		return True
+
+	def inserisci(self, chiave, elemento):
+		#restituisce True se l'elemento è stato accodato, False se è stato scartato oppure se va degradato
+		#(in quel caso il chiamante lo gestisce e il contatore dei degradati è già stato incrementato)
+		with self.condizione:
+			accodato = self._inserisci(chiave, elemento)
+			if accodato:
+				self.condizione.notify_all()
+			return accodato
+
+	def inserisci_lotto(self, elementi):
+		#come inserisci() per una lista di (chiave, elemento), acquisendo la condizione una sola volta;
+		#restituisce la lista degli esiti
+		with self.condizione:
+			esiti = [self._inserisci(chiave, elemento) for chiave, elemento in elementi]
+			if any(esiti):
+				self.condizione.notify_all()
+			return esiti
+
+	def preleva_lotto(self, massimo):
+		#attende almeno un elemento e preleva fino a "massimo" elementi alternando le code dei flussi;
+		#restituisce None quando la coda è stata chiusa ed è vuota
+		with self.condizione:
+			while not self.chiusa and not any(self.code.values()):
+				self.condizione.wait()
+			lotto = []
+			while len(lotto) < massimo and any(self.code.values()):
+				for chiave, coda in self.code.items():
+					if coda and len(lotto) < massimo:
+						lotto.append((chiave, coda.popleft()))
+			if lotto:
+				#si è liberato spazio per chi è bloccato in inserisci()
+				self.condizione.notify_all()
+				return lotto
+			return None
+
+	def chiudi(self):
+		with self.condizione:
+			self.chiusa = True
+			self.condizione.notify_all()
+
+	def contatori(self):
+		#letti senza acquisire la condizione (anche dal thread delle metriche, vedi metriche.py): i valori
+		#sono una fotografia approssimata ma chi inserisce o preleva non viene mai rallentato
+		return {chiave: {"profondita": len(coda), "scartati": self.scartati.get(chiave, 0), "degradati": self.degradati.get(chiave, 0)}
+			for chiave, coda in list(self.code.items())}
+
+class PipelineNotifiche:
+	#si usa come delegate della Peripheral: il thread che legge dal bluepy-helper (quello che chiama
+	#drainNotifications o waitForNotifications) si limita ad accodare (ora di ricezione, pacchetto) nella coda dell'handle;
+	#un thread di decodifica chiama delegate.elabora_notifica() su lotti di notifiche e un thread di
+	#salvataggio scrive sui sink le righe prodotte, così una scrittura lenta su disco non rallenta la lettura.
+	#Le code sono limitate: quando una coda è piena si applica la politica del flusso (vedi CodeFlussi);
+	#le notifiche degradate vengono passate a scrivi_grezzo dal thread di salvataggio (senza scrivi_grezzo, cioè
+	#senza registro grezzo, la politica "solo_grezzo" scarta la notifica e la conta tra gli scartati).
+	#Se è indicato un oggetto Statistiche vi sono registrati i tempi degli stadi "decodifica" e "sink" e, prima di
+	#accodare le notifiche, i timestamp del dispositivo: così i pacchetti persi via radio non comprendono le
+	#notifiche scartate dalle code, che sono contate a parte
+	def __init__(self, delegate, scrivi_sink, scrivi_grezzo=None, dimensione_lotto=64,
+		capacita=1024, politica=BLOCCA, politiche=None, statistiche=None):
+		self.delegate = delegate
+		self.statistiche = statistiche
+		self.scrivi_sink = scrivi_sink
+		self.scrivi_grezzo = scrivi_grezzo
+		self.dimensione_lotto = dimensione_lotto
+		#le politiche sono indicate per nome del flusso; la coda di ricezione usa gli handle finchè
+		#non viene chiamato imposta_nomi_handle()
+		self.politiche = dict(politiche or {})
+		if scrivi_grezzo is None:
+			politica = SCARTA_NUOVI if politica == SOLO_GREZZO else politica
+			self.politiche = {k: (SCARTA_NUOVI if p == SOLO_GREZZO else p) for k, p in self.politiche.items()}
+		self.nomi_handle = {}
+		self.handle_timestamp = frozenset()
+		self.coda_ricezione = CodeFlussi(capacita, politica, self.politiche)
+		self.coda_salvataggio = CodeFlussi(capacita, politica, dict(self.politiche, **{REGISTRO_GREZZO: SCARTA_NUOVI}))
+		self.thread_decodifica = threading.Thread(target=self._decodifica, name="decodifica")
+		self.thread_salvataggio = threading.Thread(target=self._salvataggio, name="salvataggio")
+		self.thread_decodifica.daemon = True
+		self.thread_salvataggio.daemon = True
+
+	def avvia(self):
+		self.thread_decodifica.start()
+		self.thread_salvataggio.start()
+		return self
+
+	def imposta_nomi_handle(self, nomi_handle, handle_timestamp=()):
+		#associa a ciascun handle il nome del flusso, usato per le politiche e i contatori della coda di ricezione;
+		#handle_timestamp sono gli handle i cui pacchetti iniziano con il timestamp del dispositivo (tutti tranne l'audio)
+		self.nomi_handle = dict(nomi_handle)
+		self.handle_timestamp = frozenset(handle_timestamp)
+
+	def handleNotification(self, cHandle, data):
+		self.handleNotifications([(cHandle, data)])
+
+	def handleNotifications(self, lotto):
+		#notifiche lette dal bluepy-helper con un solo risveglio (Peripheral.drainNotifications):
+		#hanno tutte la stessa ora di ricezione e sono accodate con un solo accesso alla coda
+		ora = time.time()
+		if self.statistiche is not None:
+			for cHandle, data in lotto:
+				if cHandle in self.handle_timestamp and len(data) >= TIMESTAMP.size:
+					self.statistiche.timestamp(cHandle, TIMESTAMP.unpack_from(data)[0])
+		elementi = [(self.nomi_handle.get(cHandle, cHandle), (cHandle, ora, data)) for cHandle, data in lotto]
+		for (chiave, elemento), accodato in zip(elementi, self.coda_ricezione.inserisci_lotto(elementi)):
+			if not accodato and self.coda_ricezione.politica_flusso(chiave) == SOLO_GREZZO:
+				#la notifica salta la decodifica e va direttamente al thread di salvataggio
+				self.coda_salvataggio.inserisci(REGISTRO_GREZZO, elemento)
+
+	def handleDiscovery(self, scanEntry, isNewDev, isNewData):
+		self.delegate.handleDiscovery(scanEntry, isNewDev, isNewData)
+
+	def accoda_righe(self, nome_flusso, righe):
+		#chiamata durante la decodifica al posto della scrittura diretta sui sink
+		self.coda_salvataggio.inserisci(nome_flusso, righe)
+
+	def _decodifica(self):
+		while True:
+			lotto = self.coda_ricezione.preleva_lotto(self.dimensione_lotto)
+			if lotto is None:
+				self.coda_salvataggio.chiudi()
+				return
+			for _, (cHandle, ora, data) in lotto:
+				span = profilazione.inizio(radice=True)
+				inizio = time.perf_counter()
+				try:
+					self.delegate.elabora_notifica(cHandle, data, datetime.datetime.fromtimestamp(ora))
+				except Exception as e:
+					print("Errore nella decodifica: ", e)
+				if self.statistiche is not None:
+					self.statistiche.stadio("decodifica", time.perf_counter() - inizio)
+				if span is not None:
+					profilazione.fine("decodifica", span, radice=True)
+
+	def _salvataggio(self):
+		while True:
+			lotto = self.coda_salvataggio.preleva_lotto(self.dimensione_lotto)
+			if lotto is None:
+				return
+			#le righe dello stesso flusso all'interno del lotto sono scritte con una sola chiamata
+			righe_flussi = {}
+			for nome_flusso, elemento in lotto:
+				if nome_flusso == REGISTRO_GREZZO:
+					#notifica degradata: solo registro grezzo
+					cHandle, ora, data = elemento
+					self.scrivi_grezzo(cHandle, data, datetime.datetime.fromtimestamp(ora).strftime("%H%M%S.%f"))
+				else:
+					righe_flussi.setdefault(nome_flusso, []).extend(elemento)
+			for nome_flusso, righe in righe_flussi.items():
+				span = profilazione.inizio(radice=True)
+				inizio = time.perf_counter()
+				try:
+					self.scrivi_sink(nome_flusso, righe)
+				except Exception as e:
+					print("Errore nel salvataggio: ", e)
+				if self.statistiche is not None:
+					self.statistiche.stadio("sink", time.perf_counter() - inizio)
+				if span is not None:
+					profilazione.fine("sink", span, radice=True)
+
+	def contatori(self):
+		#profondità delle code e numero di elementi scartati e degradati per flusso, per le due code
+		return {"ricezione": self.coda_ricezione.contatori(), "salvataggio": self.coda_salvataggio.contatori()}
+
+	def ferma(self):
+		#svuota le code (tutte le notifiche già ricevute vengono decodificate e salvate) e termina i thread
+		self.coda_ricezione.chiudi()
+		if self.thread_decodifica.is_alive():
+			self.thread_decodifica.join()
+		self.coda_salvataggio.chiudi()
+		if self.thread_salvataggio.is_alive():
+			self.thread_salvataggio.join()
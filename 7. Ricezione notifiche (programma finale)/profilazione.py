@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""Profilazione campionata del percorso di ricezione: intervalli con nome per ogni stadio, esportazione nel
+formato JSON di Chrome (chrome://tracing, Perfetto) e percentili dei tempi per stadio"""
+import os
+import json
+import time
+import threading
+
+#traccia attiva, None quando la profilazione è disattivata: in quel caso inizio() restituisce subito None
+#e ogni punto di misura costa una chiamata di funzione
+traccia = None
+
+class Traccia:
+	#il campionamento è deciso sugli intervalli radice (es. una lettura dal bluepy-helper, la decodifica di una
+	#notifica nel thread della pipeline): se la radice è campionata vengono registrati anche tutti gli
+	#intervalli annidati nello stesso thread, così la traccia mostra l'intera catena di stadi. Il contatore delle
+	#radici è per thread (ricezione, decodifica e salvataggio), così ogni thread campiona una radice ogni "periodo"
+	#senza lock
+	def __init__(self, periodo=1, massimo_eventi=1000000):
+		self.periodo = max(1, int(periodo))
+		self.massimo_eventi = massimo_eventi
+		self.locale = threading.local()
+		self.eventi = []
+		self.nomi_thread = {}
+		self.persi = 0
+		self.origine = time.perf_counter()
+
+	def inizio(self, radice=False):
+		if radice:
+			contatore = getattr(self.locale, "contatore", 0) + 1
+			self.locale.contatore = contatore
+			attivo = contatore % self.periodo == 0
+			self.locale.attivo = attivo
+			if not attivo:
+				return None
+		elif not getattr(self.locale, "attivo", False):
+			return None
+		return time.perf_counter()
+
+	def fine(self, nome, inizio, radice=False):
+		durata = time.perf_counter() - inizio
+		if radice:
+			self.locale.attivo = False
+		if len(self.eventi) >= self.massimo_eventi:
+			self.persi += 1
+			return
+		tid = threading.get_ident()
+		if tid not in self.nomi_thread:
+			self.nomi_thread[tid] = threading.current_thread().name
+		self.eventi.append((nome, inizio, durata, tid))
+
+	def percentili(self, percentuali=(50, 90, 99)):
+		#per ogni stadio: numero di campioni, percentili e massimo delle durate in secondi
+		durate = {}
+		for nome, _, durata, _ in list(self.eventi):
+			durate.setdefault(nome, []).append(durata)
+		risultato = {}
+		for nome, valori in durate.items():
+			valori.sort()
+			voce = {"conteggio": len(valori), "massimo": valori[-1]}
+			for p in percentuali:
+				voce["p{}".format(p)] = valori[min(len(valori) - 1, int(len(valori) * p / 100.0))]
+			risultato[nome] = voce
+		return risultato
+
+	def esporta_chrome(self, percorso):
+		#eventi completi ("ph": "X") con tempi in microsecondi dall'attivazione, più i nomi dei thread
+		pid = os.getpid()
+		eventi = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": nome}}
+			for tid, nome in self.nomi_thread.items()]
+		for nome, inizio, durata, tid in list(self.eventi):
+			eventi.append({"name": nome, "cat": "ricezione", "ph": "X", "pid": pid, "tid": tid,
+				"ts": (inizio - self.origine) * 1e6, "dur": durata * 1e6})
+		with open(percorso, "w") as fp:
+			json.dump({"traceEvents": eventi, "displayTimeUnit": "ms",
+				"otherData": {"periodo_campionamento": self.periodo, "eventi_persi": self.persi}}, fp)
+
+def attiva(periodo=1, massimo_eventi=1000000):
+	#campiona un intervallo radice ogni "periodo"
+	global traccia
+	traccia = Traccia(periodo, massimo_eventi)
+	return traccia
+
+def disattiva():
+	global traccia
+	traccia, precedente = None, traccia
+	return precedente
+
+def inizio(radice=False):
+	#restituisce l'istante di inizio se l'intervallo va registrato, altrimenti None
+	if traccia is None:
+		return None
+	return traccia.inizio(radice)
+
+def fine(nome, inizio, radice=False):
+	#da chiamare solo se inizio() non ha restituito None
+	if traccia is not None:
+		traccia.fine(nome, inizio, radice)
+
+def stampa_percentili(percentili):
+	for nome, voce in sorted(percentili.items()):
+		print("{:20s} {:8d} campioni  p50 {:9.1f} us  p90 {:9.1f} us  p99 {:9.1f} us  max {:9.1f} us".format(
+			nome, voce["conteggio"], voce["p50"] * 1e6, voce["p90"] * 1e6, voce["p99"] * 1e6, voce["massimo"] * 1e6))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""Profili di sottoscrizione per la ricezione non interattiva (file di configurazione JSON)"""
+import os
+import json
+
+from decimazione import crea_decimatore
+from pipeline import POLITICHE, SOLO_GREZZO
+from caratteristiche_bluest import AGGIUNTIVE
+from contenitore import COMPRESSIONI
+
+#caratteristiche di cui è possibile abilitare le notifiche (chiavi delle scelte di abilita_notifiche)
+CARATTERISTICHE = ["temperatura_pressione", "acc_giro_magn", "sensor_fusion_compact", "pitch_roll"]
+#altre feature BlueST, decodificate tramite la tabella di caratteristiche_bluest (un flusso con lo stesso nome)
+CARATTERISTICHE_AGGIUNTIVE = [c.nome for c in AGGIUNTIVE]
+#audio ADPCM con i relativi pacchetti di sincronizzazione, salvato in un file WAV o PCM (vedi audio_adpcm.py)
+CARATTERISTICHE_AUDIO = ["audio_adpcm"]
+
+#valori usati per le voci non indicate nel profilo
+SINK_PREDEFINITI = {
+	"cartella": "/home/matteo/Scrivania/MATLAB/Pitch e Roll/",
+	"mat": False,
+	"buffer_condiviso": False,
+	"capacita_buffer_condiviso": 65536,
+	"registro_grezzo": False,
+	"audio": "wav",
+	"archivio_memoria": False,
+	"cartella_archivio": None,
+	"catalogo": True,
+	"contenitore": False,
+	"dimensione_contenitore": 1 << 30,
+	"compressione_contenitore": None,
+	"valori_grezzi": False,
+	"pitch_roll_host": False,
+	"stampa": True,
+}
+CODE_PREDEFINITE = {
+	"pipeline": True,
+	"capacita": 1024,
+	"politica": "blocca",
+	"politiche": {},
+}
+CONNESSIONE_PREDEFINITA = {
+	"mtu": 247,
+	"intervallo": [7.5, 15.0],
+	"inventario": None,
+}
+
+class ProfiloSottoscrizione:
+	#caratteristiche da abilitare, decimazione e sink da applicare automaticamente ad ogni connessione
+	def __init__(self, nome, caratteristiche, indirizzo=None, tipo_indirizzo="random", decimazione=None, sink=None, code=None, connessione=None):
+		previste = CARATTERISTICHE + CARATTERISTICHE_AGGIUNTIVE + CARATTERISTICHE_AUDIO
+		sconosciute = [c for c in caratteristiche if c not in previste]
+		if sconosciute:
+			raise ValueError("Profilo {}: caratteristiche sconosciute {} (previste: {})".format(nome, sconosciute, ", ".join(previste)))
+		self.nome = nome
+		self.caratteristiche = list(caratteristiche)
+		self.indirizzo = indirizzo
+		self.tipo_indirizzo = tipo_indirizzo
+		self.decimazione = {flusso: self._decimazione(flusso, valore) for flusso, valore in (decimazione or {}).items()}
+		self.sink = dict(SINK_PREDEFINITI, **(sink or {}))
+		self.code = dict(CODE_PREDEFINITE, **(code or {}))
+		self.connessione = dict(CONNESSIONE_PREDEFINITA, **(connessione or {}))
+		if self.sink["audio"] not in ("wav", "pcm"):
+			raise ValueError("Profilo {}: formato audio sconosciuto {} (previsti: wav, pcm)".format(nome, self.sink["audio"]))
+		if self.sink["compressione_contenitore"] not in [None] + list(COMPRESSIONI):
+			raise ValueError("Profilo {}: compressione sconosciuta {} (previste: {})".format(nome, self.sink["compressione_contenitore"],
+				", ".join(COMPRESSIONI)))
+		for politica in [self.code["politica"]] + list(self.code["politiche"].values()):
+			if politica not in POLITICHE:
+				raise ValueError("Profilo {}: politica sconosciuta {} (previste: {})".format(nome, politica, ", ".join(POLITICHE)))
+			#senza registro grezzo le notifiche degradate andrebbero perse
+			if politica == SOLO_GREZZO and not self.sink["registro_grezzo"]:
+				raise ValueError("Profilo {}: la politica {} richiede \"registro_grezzo\": true nei sink".format(nome, SOLO_GREZZO))
+
+	def _decimazione(self, flusso, valore):
+		#la decimazione si indica come [modo, fattore] oppure come frequenze:
+		#{"modo": "anti_aliasing", "frequenza_ingresso": 50, "frequenza": 10}
+		if isinstance(valore, dict):
+			modo = valore.get("modo", "anti_aliasing")
+			if "fattore" in valore:
+				fattore = int(valore["fattore"])
+			else:
+				fattore = int(round(float(valore["frequenza_ingresso"]) / float(valore["frequenza"])))
+		else:
+			modo, fattore = valore
+		#controllo che il modo sia valido creando un decimatore di prova
+		try:
+			crea_decimatore(modo, int(fattore))
+		except (ValueError, TypeError) as e:
+			raise ValueError("Profilo {}, decimazione di {}: {}".format(self.nome, flusso, e))
+		return (modo, int(fattore))
+
+	def scelte(self):
+		#scelte "s"/"n" da passare ad abilita_notifiche
+		return {c: ("s" if c in self.caratteristiche else "n") for c in CARATTERISTICHE + CARATTERISTICHE_AGGIUNTIVE + CARATTERISTICHE_AUDIO}
+
+def carica_profilo(percorso, nome):
+	#il file contiene {"profili": {"<nome>": {...}}}; ogni profilo ha le chiavi "caratteristiche",
+	#"dispositivo" ({"indirizzo", "tipo_indirizzo"}), "decimazione", "sink", "code" e "connessione"
+	#({"mtu", "intervallo": [minimo, massimo] in ms}, null per non negoziare) tutte opzionali tranne "caratteristiche"
+	with open(percorso, "rb") as fp:
+		configurazione = json.loads(fp.read().decode("utf-8"))
+	profili = configurazione.get("profili", {})
+	if nome not in profili:
+		raise ValueError("Profilo {} non presente in {} (disponibili: {})".format(nome, percorso, ", ".join(sorted(profili))))
+	voce = profili[nome]
+	if "caratteristiche" not in voce:
+		raise ValueError("Profilo {}: manca l'elenco delle caratteristiche".format(nome))
+	dispositivo = voce.get("dispositivo", {})
+	return ProfiloSottoscrizione(nome, voce["caratteristiche"], dispositivo.get("indirizzo"),
+		dispositivo.get("tipo_indirizzo", "random"), voce.get("decimazione"), voce.get("sink"), voce.get("code"),
+		voce.get("connessione"))
+
+def percorso_predefinito():
+	return os.path.join(os.path.abspath(os.path.dirname(__file__)), "profili.json")
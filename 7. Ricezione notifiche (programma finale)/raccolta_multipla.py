@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+
+"""Ricezione da più SensorTile: un processo di raccolta per dispositivo e un aggregatore che salva i dati"""
+import os
+import sys
+import time
+import sqlite3
+import datetime
+import argparse
+import multiprocessing
+
+import Ricezione_notifiche as rn
+import caratteristiche_bluest
+from buffer_condiviso import (BufferCircolareScrittura, BufferCircolareLettura, BachecaScrittura, leggi_bacheca,
+	nuova_generazione)
+from salvataggio import SinkTesto
+from salvataggio_mat import SinkMat
+from catalogo_sessioni import Catalogo, NOME_CATALOGO
+from contenitore import Contenitore, COMPRESSIONI
+from archivio_memoria import SUDDIVISIONI_TEMPO
+from profili import CARATTERISTICHE, CARATTERISTICHE_AGGIUNTIVE, SINK_PREDEFINITI, carica_profilo, percorso_predefinito
+from metriche import RegistroMetriche, ServerMetriche, StatoDispositivo, PubblicazioneMetriche
+
+def nome_buffer(indirizzo, nome_flusso):
+	return indirizzo.replace(":", "") + "_" + nome_flusso
+
+def nome_bacheca(indirizzo):
+	return nome_buffer(indirizzo, "metriche")
+
+def flussi_raccolti(stima_host):
+	#flussi pubblicati dai processi di raccolta e salvati dall'aggregatore: pitch_roll_host solo con la stima sull'host
+	return [nome_flusso for nome_flusso in rn.colonne_flussi if stima_host or nome_flusso != "pitch_roll_host"]
+
+def processo_raccolta(indirizzo, tipo_indirizzo, scelte, capacita, silenzioso=True, generazione=None, stima_host=False):
+	#ogni processo di raccolta usa Scanner e Peripheral come il programma finale, ma invece di scrivere
+	#sui file pubblica le righe decodificate nei buffer circolari in memoria condivisa del proprio dispositivo,
+	#con la generazione dell'esecuzione attesa dall'aggregatore. I contatori della connessione sono pubblicati
+	#nella bacheca del dispositivo e serviti dal registro delle metriche dell'aggregatore
+	if silenzioso:
+		sys.stdout = open(os.devnull, "w")
+		#le notifiche non sono nemmeno formattate per la stampa
+		rn.stampa_notifiche = False
+	stato = StatoDispositivo(indirizzo)
+	bacheca = BachecaScrittura(nome_bacheca(indirizzo), generazione=generazione)
+	pubblicazione = PubblicazioneMetriche(stato, bacheca.pubblica).avvia()
+	rn.devAddr = indirizzo
+	#l'audio ADPCM non ha colonne da pubblicare nei buffer circolari, quindi non viene abilitato
+	scelte = dict(scelte, audio_adpcm="n")
+	rn.registra_flussi_bluest(scelte)
+	rn.stima_host = stima_host
+	rn.sink_flussi = {}
+	for nome_flusso in flussi_raccolti(stima_host):
+		rn.sink_flussi[nome_flusso] = [BufferCircolareScrittura(nome_buffer(indirizzo, nome_flusso), rn.colonne_flussi[nome_flusso],
+			capacita, generazione=generazione)]
+	SensorTile_state = 0
+	annuncio = None
+	try:
+		while True:
+			conn = None
+			try:
+				if (SensorTile_state == 0):
+					annuncio = rn.cerca_dispositivo(indirizzo, tipo_indirizzo).getBlueST()
+					SensorTile_state = 1
+				conn = rn.Peripheral(indirizzo, tipo_indirizzo)
+				rn.statistiche = conn.statistics
+				rn.inizializza_stati()
+				if not rn.abilita_notifiche(conn, scelte, annuncio=annuncio):
+					return
+				stato.connessione(conn.statistics, nomi_handle=rn.nomi_handle())
+				rn.ricevi_notifiche(conn)
+			except rn.BTLEException as e:
+				#il SensorTile è disconnesso, si riprende la ricerca
+				SensorTile_state = 0
+				print("Errore: ", e)
+			finally:
+				stato.disconnessione()
+				if conn is not None:
+					conn.disconnect()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		#i buffer sono rimossi da /dev/shm, l'aggregatore legge gli ultimi record dalla sua mappatura
+		for sink in rn.sink_flussi.values():
+			for s in sink:
+				s.chiudi()
+		pubblicazione.ferma()
+		bacheca.chiudi()
+
+class Aggregatore:
+	#legge i buffer circolari di tutti i processi di raccolta e possiede i sink: sink è un dizionario con le
+	#chiavi di profili.SINK_PREDEFINITI (cartella, mat, catalogo, contenitore, valori_grezzi, ...). Come nel
+	#programma finale ogni dispositivo ha una sessione nel catalogo e, con il contenitore, un segmento con i
+	#metadati della raccolta; i contatori dei processi di raccolta sono letti dalle loro bacheche.
+	#Con generazione sono letti solo i buffer creati dai processi di raccolta di questa esecuzione
+	def __init__(self, indirizzi, sink=None, registro_metriche=None, generazione=None):
+		sink = dict(SINK_PREDEFINITI, **(sink or {}))
+		self.indirizzi = indirizzi
+		self.generazione = generazione
+		self.valori_grezzi = sink["valori_grezzi"]
+		#i campioni persi nei buffer circolari sono esposti nelle metriche dell'aggregatore
+		self.registro_metriche = registro_metriche
+		if registro_metriche is not None:
+			for indirizzo in indirizzi:
+				registro_metriche.remoto(indirizzo, lambda indirizzo=indirizzo: leggi_bacheca(nome_bacheca(indirizzo), generazione))
+		self.lettori = {}
+		self.sequenze = {}
+		self.persi = {}
+		self.sink = {}
+		self.sink_blocchi = {}
+		self.catalogo = None
+		self.sessioni = {}
+		self.contenitori = {}
+		#colonne intere e conversione inversa (scala, offset) dei valori salvati come interi ricevuti
+		self.colonne_intere = {}
+		self.inverse = {}
+		cartella = sink["cartella"]
+		if sink["catalogo"]:
+			try:
+				self.catalogo = Catalogo(os.path.join(cartella, NOME_CATALOGO))
+			except sqlite3.Error as e:
+				print("Catalogo delle sessioni non disponibile: ", e)
+		tempo = str(datetime.datetime.now())
+		metadati = {"inizio": tempo, "raccolta_multipla": True, "generazione": generazione}
+		for indirizzo in indirizzi:
+			sessione = None
+			if self.catalogo is not None:
+				sessione = self.sessioni[indirizzo] = self.catalogo.apri_sessione(indirizzo, cartella, dict(metadati, indirizzo=indirizzo))
+			if sink["contenitore"]:
+				self.contenitori[indirizzo] = Contenitore(cartella, indirizzo, sink["dimensione_contenitore"], sink["compressione_contenitore"])
+				self.contenitori[indirizzo].segmento(dict(metadati, indirizzo=indirizzo), sessione)
+			for nome_flusso in flussi_raccolti(sink["pitch_roll_host"]):
+				chiave = (indirizzo, nome_flusso)
+				colonne = rn.colonne_flussi[nome_flusso]
+				scale = caratteristiche_bluest.scale_flusso(nome_flusso) if self.valori_grezzi else None
+				nome_file = os.path.join(cartella, "{} {} {}.txt".format(rn.etichette_flussi[nome_flusso], indirizzo.replace(":", ""), tempo))
+				if indirizzo in self.contenitori:
+					self.sink[chiave] = [self.contenitori[indirizzo].flusso(nome_flusso, colonne,
+						caratteristiche_bluest.campi_flusso(nome_flusso), SUDDIVISIONI_TEMPO.get(nome_flusso, 1), scale)]
+				else:
+					self.sink[chiave] = [SinkTesto(nome_file, sessione.flusso(nome_flusso, nome_file) if sessione is not None else None, scale)]
+				self.sink_blocchi[chiave] = []
+				if sink["mat"] and indirizzo not in self.contenitori:
+					self.sink_blocchi[chiave].append(SinkMat(nome_file[:-len(".txt")] + ".mat", colonne, nome_flusso, scale=scale))
+				self.persi[chiave] = 0
+			for nome_flusso in flussi_raccolti(sink["pitch_roll_host"]):
+				campi = caratteristiche_bluest.campi_flusso(nome_flusso)
+				#timestamp intero tranne che per i flussi con più campioni per notifica (tempo frazionario)
+				intere = [0] if SUDDIVISIONI_TEMPO.get(nome_flusso, 1) == 1 else []
+				if self.valori_grezzi:
+					intere += [2 + i for i, campo in enumerate(campi) if campo[1][-1] not in "fd"]
+					self.inverse[nome_flusso] = [(1.0 / scala, offset) for _, scala, offset, _ in caratteristiche_bluest.scale_flusso(nome_flusso)]
+				self.colonne_intere[nome_flusso] = intere
+
+	def _converti(self, nome_flusso, dati):
+		#i buffer contengono i valori in unità fisiche: con valori_grezzi si torna ai valori interi ricevuti
+		if nome_flusso in self.inverse:
+			dati = dati.copy()
+			for i, (inverso, offset) in enumerate(self.inverse[nome_flusso]):
+				dati[:, 2 + i] = (dati[:, 2 + i] - offset) * inverso
+			intere = [i for i in self.colonne_intere[nome_flusso] if i >= 2]
+			dati[:, intere] = dati[:, intere].round()
+		return dati
+
+	def _righe(self, nome_flusso, dati):
+		#righe come quelle del programma finale: ora dell'host nel formato HHMMSS.ffffff e colonne intere
+		#senza parte decimale (i valori mancanti restano nan)
+		intere = self.colonne_intere[nome_flusso]
+		righe = dati.tolist()
+		for riga in righe:
+			riga[1] = "%013.6f" % riga[1]
+			for i in intere:
+				if riga[i] == riga[i]:
+					riga[i] = int(riga[i])
+		return righe
+
+	def _lettore(self, chiave):
+		#i buffer vengono creati dai processi di raccolta, finchè non esistono (o restano quelli di un'esecuzione
+		#precedente o non sono ancora inizializzati) si riprova al ciclo successivo
+		if chiave not in self.lettori:
+			try:
+				self.lettori[chiave] = BufferCircolareLettura(nome_buffer(*chiave), self.generazione)
+			except (IOError, OSError, ValueError):
+				return None
+			self.sequenze[chiave] = 0
+		return self.lettori[chiave]
+
+	def raccogli(self):
+		#un passaggio su tutti i buffer: restituisce il numero di campioni salvati
+		campioni = 0
+		for chiave, sink in self.sink.items():
+			lettore = self._lettore(chiave)
+			if lettore is None:
+				continue
+			sostituito = lettore.sostituito()
+			self.sequenze[chiave], dati, persi = lettore.copia(self.sequenze[chiave])
+			if sostituito:
+				#gli ultimi record del buffer sono stati letti: il buffer nuovo viene aperto al ciclo successivo
+				lettore.chiudi()
+				del self.lettori[chiave]
+			self.persi[chiave] += persi
+			if persi and self.registro_metriche is not None:
+				self.registro_metriche.dispositivo(chiave[0], traccia_connessione=False).persi_buffer[chiave[1]] = self.persi[chiave]
+			if persi and chiave[0] in self.sessioni:
+				self.sessioni[chiave[0]].perdite(chiave[1], persi)
+			if len(dati):
+				dati = self._converti(chiave[1], dati)
+				righe = self._righe(chiave[1], dati)
+				for s in sink:
+					s.scrivi(righe)
+				for s in self.sink_blocchi[chiave]:
+					s.scrivi_blocco(dati)
+				campioni += len(dati)
+		return campioni
+
+	def esegui(self, intervallo=0.05):
+		while True:
+			if not self.raccogli():
+				time.sleep(intervallo)
+
+	def chiudi(self):
+		self.raccogli()
+		for chiave, sink in self.sink.items():
+			for s in sink + self.sink_blocchi[chiave]:
+				s.chiudi()
+		for contenitore in self.contenitori.values():
+			contenitore.chiudi()
+		for sessione in self.sessioni.values():
+			sessione.chiudi()
+		if self.catalogo is not None:
+			self.catalogo.chiudi()
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Ricezione delle notifiche da più SensorTile con un processo per dispositivo")
+	parser.add_argument("indirizzi", nargs="+", help="mac-address dei SensorTile")
+	parser.add_argument("--tipo-indirizzo", default="random", choices=[rn.ADDR_TYPE_PUBLIC, rn.ADDR_TYPE_RANDOM])
+	parser.add_argument("--cartella", help="cartella in cui salvare i file (quella del profilo o la cartella corrente)")
+	parser.add_argument("--caratteristiche", nargs="+", default=CARATTERISTICHE, choices=CARATTERISTICHE + CARATTERISTICHE_AGGIUNTIVE,
+		help="caratteristiche di cui abilitare le notifiche (anche le altre feature BlueST, es. batteria)")
+	parser.add_argument("--profilo", help="profilo di sottoscrizione da cui prendere le caratteristiche da abilitare")
+	parser.add_argument("--configurazione", default=percorso_predefinito(), help="file JSON con i profili di sottoscrizione")
+	parser.add_argument("--capacita", type=int, default=65536, help="capacità (in campioni) di ogni buffer circolare")
+	parser.add_argument("--mat", action="store_true", help="salvare anche i file .mat")
+	parser.add_argument("--senza-catalogo", action="store_true", help="non registrare le sessioni nel catalogo")
+	parser.add_argument("--contenitore", action="store_true", help="salvare i flussi nel contenitore giornaliero di ogni dispositivo")
+	parser.add_argument("--compressione", choices=list(COMPRESSIONI), help="compressione dei flussi nel contenitore")
+	parser.add_argument("--valori-grezzi", action="store_true", help="salvare i valori interi ricevuti con le scale nell'intestazione")
+	parser.add_argument("--pitch-roll-host", action="store_true", help="stimare pitch e roll anche sull'host (flusso pitch_roll_host)")
+	parser.add_argument("--porta-metriche", type=int, help="porta delle metriche Prometheus di tutti i dispositivi, servite dall'aggregatore")
+	args = parser.parse_args()
+
+	if not os.path.isfile(rn.helperExe):
+		raise ImportError("Cannot find required executable '%s'" % rn.helperExe)
+
+	#con un profilo i sink sono quelli del profilo, altrimenti sono scelti con le opzioni
+	if args.profilo is not None:
+		profilo = carica_profilo(args.configurazione, args.profilo)
+		scelte = profilo.scelte()
+		sink = dict(profilo.sink)
+	else:
+		scelte = {c: ("s" if c in args.caratteristiche else "n") for c in CARATTERISTICHE + CARATTERISTICHE_AGGIUNTIVE}
+		sink = dict(SINK_PREDEFINITI, cartella=".", mat=args.mat, catalogo=not args.senza_catalogo,
+			contenitore=args.contenitore, compressione_contenitore=args.compressione, valori_grezzi=args.valori_grezzi,
+			pitch_roll_host=args.pitch_roll_host)
+	if args.cartella is not None:
+		sink["cartella"] = args.cartella
+	#i flussi delle altre feature devono esistere anche nell'aggregatore
+	rn.registra_flussi_bluest(scelte)
+	#generazione dell'esecuzione: l'aggregatore ignora i buffer rimasti in /dev/shm da esecuzioni precedenti
+	generazione = nuova_generazione()
+	processi = []
+	for indirizzo in args.indirizzi:
+		processo = multiprocessing.Process(target=processo_raccolta, name="raccolta " + indirizzo,
+			args=(indirizzo, args.tipo_indirizzo, scelte, args.capacita, True, generazione, sink["pitch_roll_host"]))
+		processo.daemon = True
+		processo.start()
+		processi.append(processo)
+
+	registro_metriche = None
+	if args.porta_metriche is not None:
+		registro_metriche = RegistroMetriche()
+	aggregatore = Aggregatore(args.indirizzi, sink, registro_metriche, generazione)
+	if registro_metriche is not None:
+		ServerMetriche(registro_metriche, args.porta_metriche).avvia()
+	try:
+		aggregatore.esegui()
+	#premere CTRL + C per terminare la raccolta
+	except KeyboardInterrupt:
+		print("Interruzione da tastiera")
+	finally:
+		for processo in processi:
+			processo.join(5)
+		aggregatore.chiudi()
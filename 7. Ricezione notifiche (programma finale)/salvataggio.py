@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""Salvataggio dei flussi decodificati su file"""
+import time
+import threading
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+from caratteristiche_bluest import applica_scala
+
+#le righe dell'intestazione iniziano con "%", che MATLAB (load) tratta come commento
+COMMENTO = "%"
+#una riga dell'intestazione per colonna dei valori grezzi: "% scala<TAB>colonna<TAB>scala<TAB>offset<TAB>unità"
+ETICHETTA_SCALA = "scala"
+#le righe del registro grezzo sono scritte sul file quando sono RIGHE_PER_SCRITTURA o quando la prima
+#attende da ATTESA_MASSIMA secondi
+RIGHE_PER_SCRITTURA = 256
+ATTESA_MASSIMA = 1.0
+
+class SinkTesto:
+	#file di testo con una riga per campione e colonne separate da tabulazioni, da importare in MATLAB
+	#con un indice del catalogo delle sessioni (vedi catalogo_sessioni.py) la posizione in byte di ogni gruppo di
+	#righe viene comunicata al catalogo, che vi registra periodicamente un punto di controllo.
+	#Con scale (colonna, scala, offset, unità) le righe contengono i valori interi ricevuti e un nuovo file
+	#inizia con un'intestazione che indica come convertirli (vedi leggi_testo)
+	def __init__(self, nome_file, indice=None, scale=None):
+		self.nome_file = nome_file
+		self.indice = indice
+		self.scale = scale
+
+	def _intestazione(self):
+		righe = ["{} valori interi ricevuti: valore = grezzo * scala + offset\n".format(COMMENTO)]
+		righe.extend("{} {}\t{}\t{!r}\t{!r}\t{}\n".format(COMMENTO, ETICHETTA_SCALA, colonna, scala, offset, unita)
+			for colonna, scala, offset, unita in self.scale)
+		return "".join(righe)
+
+	def scrivi(self, righe):
+		#il file viene aperto e chiuso ad ogni scrittura così resta leggibile durante la ricezione
+		try:
+			file_flusso = open(self.nome_file, 'a+', encoding="utf-8")
+			if self.scale is not None and file_flusso.tell() == 0:
+				file_flusso.write(self._intestazione())
+			if self.indice is not None:
+				self.indice.prima_di_scrivere(file_flusso.tell())
+			for riga in righe:
+				file_flusso.write("\t".join(str(valore) for valore in riga) + "\n")
+			if self.indice is not None:
+				self.indice.dopo_aver_scritto(len(righe), file_flusso.tell())
+			file_flusso.close()
+		except IOError:
+			print ("Errore di I/O sul file.")
+
+	def scrivi_blocco(self, dati):
+		#accoda un array numpy (N, colonne) di campioni
+		self.scrivi(dati.tolist())
+
+	def chiudi(self):
+		pass
+
+class RegistroGrezzo:
+	#file "Notifiche grezze" con una riga per notifica (time, handle, byte in esadecimale): le righe sono raccolte
+	#in memoria e accodate al file a gruppi, invece di aprire il file ad ogni notifica. Riceve le righe
+	#(handle, time, dati) come il flusso "notifiche_grezze" del contenitore; è scritto sia dal thread di
+	#decodifica sia da quello di salvataggio (notifiche degradate), quindi usa un lock
+	def __init__(self, nome_file):
+		self.nome_file = nome_file
+		self.lock = threading.Lock()
+		self.righe = []
+		self.prima = None
+
+	def scrivi(self, righe):
+		ora = time.time()
+		with self.lock:
+			if not self.righe:
+				self.prima = ora
+			self.righe.extend("{}\t{}\t{}\n".format(ora_riga, handle, dati) for handle, ora_riga, dati in righe)
+			if len(self.righe) >= RIGHE_PER_SCRITTURA or ora - self.prima >= ATTESA_MASSIMA:
+				self._svuota()
+
+	def _svuota(self):
+		righe, self.righe = self.righe, []
+		if not righe:
+			return
+		try:
+			with open(self.nome_file, 'a+') as file_grezzo:
+				file_grezzo.write("".join(righe))
+		except IOError:
+			print ("Errore di I/O sul file.")
+
+	def chiudi(self):
+		with self.lock:
+			self._svuota()
+
+def leggi_testo(nome_file):
+	#array numpy (N, colonne) di un file di SinkTesto (time resta nel formato HHMMSS.ffffff): se il file ha
+	#l'intestazione dei valori grezzi, la conversione è applicata in modo vettoriale a tutte le colonne
+	if np is None:
+		raise ImportError("Per leggere i file dei flussi è necessario il pacchetto numpy")
+	scale = []
+	with open(nome_file, encoding="utf-8") as fp:
+		for riga in fp:
+			if not riga.startswith(COMMENTO):
+				break
+			campi = riga[len(COMMENTO):].strip().split("\t")
+			if campi[0] == ETICHETTA_SCALA and len(campi) >= 4:
+				scale.append((campi[1], float(campi[2]), float(campi[3]), campi[4] if len(campi) > 4 else ""))
+	dati = np.loadtxt(nome_file, delimiter="\t", comments=COMMENTO, ndmin=2, encoding="utf-8")
+	return applica_scala(dati, scale) if scale else dati
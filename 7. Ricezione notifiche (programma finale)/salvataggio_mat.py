@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""Scrittura incrementale di file MATLAB (.mat, versione 5) per i flussi decodificati"""
+import struct
+import sys
+import datetime
+from array import array
+
+#tipi di dato e classi del formato MAT versione 5
+miINT8 = 1
+miUINT16 = 4
+miINT32 = 5
+miUINT32 = 6
+miDOUBLE = 9
+miMATRIX = 14
+mxCHAR_CLASS = 4
+mxDOUBLE_CLASS = 6
+
+def _riempimento(n):
+	#i data element del formato MAT sono allineati a 8 byte
+	return (8 - n % 8) % 8
+
+def _elemento(tipo, dati):
+	return struct.pack('<II', tipo, len(dati)) + dati + b'\x00' * _riempimento(len(dati))
+
+def _intestazione_matrice(classe, nome, righe, colonne):
+	#sottoelementi di un miMATRIX prima della parte reale: flag, dimensioni e nome
+	flag = _elemento(miUINT32, struct.pack('<II', classe, 0))
+	dimensioni = _elemento(miINT32, struct.pack('<ii', righe, colonne))
+	nome = _elemento(miINT8, nome.encode('ascii'))
+	return flag + dimensioni + nome
+
+def valore_numerico(valore):
+	#l'ora dell'host è salvata nel formato testuale HHMMSS.ffffff, nel file .mat diventa un double
+	return float(valore)
+
+class SinkMat:
+	#file .mat con una matrice di double che cresce di un blocco di campioni alla volta
+	#la matrice ha una riga per colonna del file di testo e una colonna per campione (in MATLAB
+	#dati = load(nome_file).<nome_variabile>.' riporta la stessa disposizione del file di testo);
+	#dopo ogni blocco l'intestazione viene aggiornata, così il file resta leggibile anche se il
+	#programma si interrompe e in memoria restano al massimo righe_per_blocco campioni.
+	#il file viene creato alla prima scrittura, così i flussi non abilitati non lasciano file vuoti.
+	#Con scale (colonna, scala, offset, unità delle colonne dopo timestamp e time) i dati sono i valori interi
+	#ricevuti e il file contiene anche <nome_variabile>_scala (righe scala e offset, una colonna per colonna dei
+	#dati) e <nome_variabile>_unita: in MATLAB dati .* scala(1, :).' + scala(2, :).' dà i valori convertiti
+	def __init__(self, nome_file, colonne, nome_variabile="dati", righe_per_blocco=1024, scale=None):
+		self.nome_file = nome_file
+		self.colonne = list(colonne)
+		self.scale = scale
+		self.nome_variabile = nome_variabile
+		self.righe_per_blocco = righe_per_blocco
+		self.buffer = array('d')
+		self.campioni = 0
+		self.file = None
+
+	def _apri(self):
+		self.file = open(self.nome_file, 'wb')
+		self._scrivi_intestazione()
+
+	def _scrivi_intestazione(self):
+		testo = "MATLAB 5.0 MAT-file, Platform: Python, Created on: {}".format(datetime.datetime.now().strftime("%a %b %d %H:%M:%S %Y"))
+		testo = testo.encode('ascii')[:116].ljust(116, b' ')
+		self.file.write(testo + b'\x00' * 8 + struct.pack('<H', 0x0100) + b'IM')
+		#variabile con i nomi delle colonne (matrice di caratteri, una riga per colonna)
+		self._scrivi_testi(self.nome_variabile + "_colonne", self.colonne)
+		if self.scale is not None:
+			#timestamp e time non sono convertiti
+			scale = [(1.0, 0.0, "")] * (len(self.colonne) - len(self.scale)) + [s[1:] for s in self.scale]
+			valori = array('d', [v for scala, offset, _ in scale for v in (scala, offset)])
+			if sys.byteorder != 'little':
+				valori.byteswap()
+			contenuto = _intestazione_matrice(mxDOUBLE_CLASS, self.nome_variabile + "_scala", 2, len(scale))
+			contenuto += _elemento(miDOUBLE, valori.tobytes())
+			self.file.write(_elemento(miMATRIX, contenuto))
+			self._scrivi_testi(self.nome_variabile + "_unita", [s[2] for s in scale])
+		#matrice dei dati, inizialmente vuota: la sua intestazione viene riscritta ad ogni blocco
+		self.posizione_matrice = self.file.tell()
+		self._scrivi_intestazione_dati()
+
+	def _scrivi_testi(self, nome, testi):
+		#matrice di caratteri con una riga per testo, completata con spazi
+		larghezza = max(len(t) for t in testi) if testi else 0
+		righe = [t.ljust(larghezza) for t in testi]
+		#i caratteri sono memorizzati per colonne come la matrice numerica
+		caratteri = array('H', [ord(righe[r][c]) for c in range(larghezza) for r in range(len(righe))])
+		if sys.byteorder != 'little':
+			caratteri.byteswap()
+		contenuto = _intestazione_matrice(mxCHAR_CLASS, nome, len(righe), larghezza)
+		contenuto += _elemento(miUINT16, caratteri.tobytes())
+		self.file.write(_elemento(miMATRIX, contenuto))
+
+	def _scrivi_intestazione_dati(self):
+		byte_dati = self.campioni * len(self.colonne) * 8
+		contenuto = _intestazione_matrice(mxDOUBLE_CLASS, self.nome_variabile, len(self.colonne), self.campioni)
+		#intestazione della parte reale (i dati seguono subito dopo)
+		contenuto += struct.pack('<II', miDOUBLE, byte_dati)
+		self.file.seek(self.posizione_matrice)
+		self.file.write(struct.pack('<II', miMATRIX, len(contenuto) + byte_dati) + contenuto)
+
+	def scrivi(self, righe):
+		for riga in righe:
+			self.buffer.extend(valore_numerico(valore) for valore in riga)
+		if len(self.buffer) >= self.righe_per_blocco * len(self.colonne):
+			self.svuota()
+
+	def scrivi_blocco(self, dati):
+		#accoda direttamente un array numpy (N, colonne) di campioni
+		self.svuota()
+		dati = dati.astype('<f8', order='C', copy=False)
+		if dati.shape[1:] != (len(self.colonne),):
+			raise ValueError("Attese {} colonne, ricevute {}".format(len(self.colonne), dati.shape[1:]))
+		self._accoda(dati.tobytes(), len(dati))
+
+	def svuota(self):
+		if not self.buffer:
+			return
+		if sys.byteorder != 'little':
+			self.buffer.byteswap()
+		self._accoda(self.buffer.tobytes(), len(self.buffer) // len(self.colonne))
+		self.buffer = array('d')
+
+	def _accoda(self, dati, campioni):
+		try:
+			if self.file is None:
+				self._apri()
+			self.file.seek(0, 2)
+			self.file.write(dati)
+			self.campioni += campioni
+			self._scrivi_intestazione_dati()
+			self.file.flush()
+		except IOError:
+			print ("Errore di I/O sul file.")
+
+	def chiudi(self):
+		self.svuota()
+		if self.file is None:
+			return
+		self.file.close()
+		self.file = None
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""Espansione dei pacchetti del sensor fusion compact in quaternioni completi e angoli di Eulero"""
+import math
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+#costante per la conversione da radianti a gradi
+RAD_GRADI = 180 / math.pi
+#ogni pacchetto contiene tre quaternioni di cui sono trasmesse solo le parti vettoriali
+QUATERNIONI_PER_PACCHETTO = 3
+#fattore di scala delle parti vettoriali secondo il file "Getting started with the BlueST protocol and SDK.pdf"
+SCALA_QUATERNIONE = 10000
+#il timestamp del SensorTile è un intero senza segno a 16 bit che riparte da 0
+MODULO_TIMESTAMP = 1 << 16
+
+def _richiedi_numpy():
+	if np is None:
+		raise ImportError("Per l'elaborazione vettoriale è necessario il pacchetto numpy")
+
+def srotola_timestamp(timestamp, precedente):
+	#restituisce il timestamp del dispositivo reso monotono rispetto a quello precedente già srotolato
+	if precedente is None:
+		return timestamp
+	delta = (timestamp - precedente) % MODULO_TIMESTAMP
+	return precedente + delta
+
+def srotola_timestamp_array(timestamp, precedente=None):
+	#versione vettoriale di srotola_timestamp per un intero registrato
+	_richiedi_numpy()
+	timestamp = np.asarray(timestamp, dtype=np.int64)
+	delta = np.empty_like(timestamp)
+	delta[1:] = np.diff(timestamp) % MODULO_TIMESTAMP
+	delta[0] = timestamp[0] if precedente is None else (timestamp[0] - precedente) % MODULO_TIMESTAMP + precedente
+	return np.cumsum(delta)
+
+def parte_scalare(qi, qj, qk):
+	#il quaternione trasmesso è unitario, la parte scalare (presa positiva) si ricava dalla normalizzazione
+	return math.sqrt(max(0.0, 1.0 - qi * qi - qj * qj - qk * qk))
+
+def eulero(qs, qi, qj, qk):
+	#conversione da quaternione a angoli di roll, pitch e yaw in gradi
+	roll = math.atan2(2 * (qs * qi + qj * qk), 1 - 2 * (qi * qi + qj * qj))
+	seno_pitch = max(-1.0, min(1.0, 2 * (qs * qj - qk * qi)))
+	pitch = math.asin(seno_pitch)
+	yaw = math.atan2(2 * (qs * qk + qi * qj), 1 - 2 * (qj * qj + qk * qk))
+	return roll * RAD_GRADI, pitch * RAD_GRADI, yaw * RAD_GRADI
+
+def eulero_array(q):
+	#versione vettoriale di eulero, q ha forma (N, 4) con ordine (qs, qi, qj, qk)
+	_richiedi_numpy()
+	qs, qi, qj, qk = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+	roll = np.arctan2(2 * (qs * qi + qj * qk), 1 - 2 * (qi * qi + qj * qj))
+	pitch = np.arcsin(np.clip(2 * (qs * qj - qk * qi), -1.0, 1.0))
+	yaw = np.arctan2(2 * (qs * qk + qi * qj), 1 - 2 * (qj * qj + qk * qk))
+	return np.stack((roll, pitch, yaw), axis=1) * RAD_GRADI
+
+class EspansioneSensorFusion:
+	#espande ogni pacchetto del sensor fusion compact in tre quaternioni completi con il relativo tempo
+	#del dispositivo; i tre quaternioni sono distribuiti uniformemente tra il pacchetto precedente e
+	#quello corrente. intervallo_iniziale (in tick del timestamp) è usato per il primo pacchetto
+	def __init__(self, con_eulero=True, intervallo_iniziale=QUATERNIONI_PER_PACCHETTO):
+		self.con_eulero = con_eulero
+		self.intervallo_iniziale = intervallo_iniziale
+		self.reset()
+
+	def reset(self):
+		self.timestamp = None
+
+	def _inizio(self, timestamp):
+		if self.timestamp is None:
+			return timestamp - self.intervallo_iniziale
+		return self.timestamp
+
+	def aggiorna(self, timestamp, valori, grezzi=False):
+		#elaborazione incrementale di un pacchetto: valori contiene (qi1, qj1, qk1, ..., qk3),
+		#già divisi per 10000 oppure interi come spacchettati se grezzi è True
+		#restituisce tre tuple (tempo, qs, qi, qj, qk[, roll, pitch, yaw])
+		timestamp = srotola_timestamp(timestamp, self.timestamp)
+		inizio = self._inizio(timestamp)
+		passo = (timestamp - inizio) / QUATERNIONI_PER_PACCHETTO
+		campioni = []
+		for n in range(QUATERNIONI_PER_PACCHETTO):
+			qi, qj, qk = valori[3 * n:3 * n + 3]
+			if grezzi:
+				qi, qj, qk = qi / SCALA_QUATERNIONE, qj / SCALA_QUATERNIONE, qk / SCALA_QUATERNIONE
+			qs = parte_scalare(qi, qj, qk)
+			campione = (inizio + passo * (n + 1), qs, qi, qj, qk)
+			if self.con_eulero:
+				campione += eulero(qs, qi, qj, qk)
+			campioni.append(campione)
+		self.timestamp = timestamp
+		return campioni
+
+	def elabora(self, timestamp, valori, grezzi=False):
+		#elaborazione vettoriale di un intero registrato: timestamp ha forma (N,), valori (N, 9)
+		#restituisce i tempi (3N,), i quaternioni (3N, 4) e, se richiesti, gli angoli di Eulero (3N, 3)
+		_richiedi_numpy()
+		valori = np.asarray(valori, dtype=float)
+		if grezzi:
+			valori = valori / SCALA_QUATERNIONE
+		if len(valori) == 0:
+			vuoto = np.empty((0, 4))
+			return (np.empty(0), vuoto, np.empty((0, 3))) if self.con_eulero else (np.empty(0), vuoto)
+		timestamp = srotola_timestamp_array(timestamp, self.timestamp)
+		inizi = np.empty(len(timestamp))
+		inizi[1:] = timestamp[:-1]
+		inizi[0] = self._inizio(int(timestamp[0]))
+		frazioni = np.arange(1, QUATERNIONI_PER_PACCHETTO + 1) / QUATERNIONI_PER_PACCHETTO
+		tempi = (inizi[:, None] + (timestamp - inizi)[:, None] * frazioni).ravel()
+		vettori = valori.reshape(-1, 3)
+		q = np.empty((len(vettori), 4))
+		q[:, 1:] = vettori
+		q[:, 0] = np.sqrt(np.maximum(0.0, 1.0 - np.einsum('ij,ij->i', vettori, vettori)))
+		self.timestamp = int(timestamp[-1])
+		if self.con_eulero:
+			return tempi, q, eulero_array(q)
+		return tempi, q
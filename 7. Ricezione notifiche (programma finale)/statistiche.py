@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""Statistiche di ricezione per handle (conteggi, byte, frequenza, istogramma degli intervalli, pacchetti persi
+secondo il timestamp del dispositivo) e tempi degli stadi"""
+import time
+
+from sensor_fusion import srotola_timestamp
+
+#l'istogramma degli intervalli tra gli arrivi ha classi in scala logaritmica (base 2) di microsecondi:
+#la classe i contiene gli intervalli in [2^(i-1), 2^i) us, l'ultima anche quelli più lunghi (da 2^26 us = 67 s).
+#Le notifiche lette con lo stesso risveglio (un lotto) hanno lo stesso istante di arrivo, quindi l'istogramma
+#contiene solo gli intervalli tra un lotto e il successivo e la dimensione dei lotti è contata a parte
+CLASSI_ISTOGRAMMA = 28
+#durata della finestra su cui è calcolata la frequenza corrente (s)
+FINESTRA_FREQUENZA = 1.0
+#un salto del timestamp del dispositivo è un buco (pacchetti persi via radio) se supera di questo fattore il passo
+#tra due pacchetti consecutivi
+SOGLIA_BUCO = 1.5
+
+def limiti_istogramma():
+	#limite superiore (in s) di ciascuna classe dell'istogramma
+	return [(1 << i) / 1e6 for i in range(CLASSI_ISTOGRAMMA - 1)] + [float("inf")]
+
+class StatisticheHandle:
+	#aggiornata ad ogni notifica con poche operazioni intere, così può restare sempre attiva
+	def __init__(self):
+		self.conteggio = 0
+		self.byte = 0
+		self.lotti = 0
+		self.massimo_lotto = 0
+		self.ultima = None
+		self.istogramma = [0] * CLASSI_ISTOGRAMMA
+		self.inizio_finestra = None
+		self.conteggio_finestra = 0
+		self.frequenza = 0.0
+		self.picco = 0.0
+
+	def aggiorna(self, n_byte, ora, notifiche=1):
+		#notifiche arrivate insieme all'istante ora, con n_byte in totale
+		self.conteggio += notifiche
+		self.byte += n_byte
+		self.lotti += 1
+		if notifiche > self.massimo_lotto:
+			self.massimo_lotto = notifiche
+		if self.ultima is not None:
+			#bit_length() di un intero è il logaritmo in base 2 arrotondato per eccesso
+			classe = int((ora - self.ultima) * 1e6).bit_length()
+			self.istogramma[classe if classe < CLASSI_ISTOGRAMMA else CLASSI_ISTOGRAMMA - 1] += 1
+		else:
+			self.inizio_finestra = ora
+		self.ultima = ora
+		self.conteggio_finestra += notifiche
+		trascorso = ora - self.inizio_finestra
+		if trascorso >= FINESTRA_FREQUENZA:
+			self.frequenza = self.conteggio_finestra / trascorso
+			if self.frequenza > self.picco:
+				self.picco = self.frequenza
+			self.inizio_finestra = ora
+			self.conteggio_finestra = 0
+
+	def riepilogo(self, ora):
+		#la frequenza corrente è quella dell'ultima finestra completa, azzerata se le notifiche si sono fermate
+		frequenza = self.frequenza
+		if self.ultima is None or ora - self.ultima >= 2 * FINESTRA_FREQUENZA:
+			frequenza = 0.0
+		return {"conteggio": self.conteggio, "byte": self.byte, "frequenza": frequenza, "picco": self.picco,
+			"istogramma_intervalli": list(self.istogramma), "lotti": self.lotti, "massimo_lotto": self.massimo_lotto}
+
+class SequenzaTimestamp:
+	#pacchetti persi di un handle stimati dai salti del timestamp del dispositivo (16 bit, srotolato): il passo
+	#tra due pacchetti consecutivi è il più piccolo salto positivo osservato, un salto più lungo di SOGLIA_BUCO
+	#passi conta come round(salto / passo) - 1 pacchetti persi
+	def __init__(self):
+		self.precedente = None
+		self.passo = None
+		self.buchi = 0
+		self.persi = 0
+
+	def aggiorna(self, timestamp):
+		tempo = srotola_timestamp(timestamp, self.precedente)
+		if self.precedente is not None:
+			salto = tempo - self.precedente
+			if salto > 0:
+				if self.passo is None or salto < self.passo:
+					self.passo = salto
+				elif salto > SOGLIA_BUCO * self.passo:
+					self.buchi += 1
+					self.persi += int(round(salto / float(self.passo))) - 1
+		self.precedente = tempo
+
+	def riepilogo(self):
+		return {"buchi": self.buchi, "persi": self.persi}
+
+class StatisticheStadio:
+	def __init__(self):
+		self.conteggio = 0
+		self.totale = 0.0
+		self.massimo = 0.0
+
+	def aggiorna(self, durata):
+		self.conteggio += 1
+		self.totale += durata
+		if durata > self.massimo:
+			self.massimo = durata
+
+	def riepilogo(self):
+		return {"conteggio": self.conteggio, "totale": self.totale, "massimo": self.massimo,
+			"medio": self.totale / self.conteggio if self.conteggio else 0.0}
+
+class Statistiche:
+	#notifica() e timestamp() sono chiamate dal thread di ricezione, stadio() anche dai thread della pipeline:
+	#ogni chiave è aggiornata da un solo thread e il riepilogo legge una copia delle voci, quindi non servono lock
+	def __init__(self):
+		self.inizio = time.time()
+		self.handle = {}
+		self.sequenze = {}
+		self.stadi = {}
+
+	def notifica(self, handle, n_byte, ora=None, notifiche=1):
+		#con notifiche > 1 le notifiche dell'handle di un lotto, con n_byte in totale
+		if ora is None:
+			ora = time.perf_counter()
+		statistiche = self.handle.get(handle)
+		if statistiche is None:
+			statistiche = self.handle[handle] = StatisticheHandle()
+		statistiche.aggiorna(n_byte, ora, notifiche)
+
+	def timestamp(self, handle, timestamp):
+		#timestamp del dispositivo di un pacchetto ricevuto, per contare i pacchetti persi via radio: va registrato
+		#prima delle code della pipeline, altrimenti le notifiche scartate per sovraccarico sembrano perse via radio
+		sequenza = self.sequenze.get(handle)
+		if sequenza is None:
+			sequenza = self.sequenze[handle] = SequenzaTimestamp()
+		sequenza.aggiorna(timestamp)
+
+	def stadio(self, nome, durata):
+		#nome: "parse" (lettura delle righe del bluepy-helper), "decodifica" o "sink"; durata in secondi
+		statistiche = self.stadi.get(nome)
+		if statistiche is None:
+			statistiche = self.stadi[nome] = StatisticheStadio()
+		statistiche.aggiorna(durata)
+
+	def riepilogo(self):
+		ora = time.perf_counter()
+		sequenze = dict(self.sequenze)
+		return {"durata": time.time() - self.inizio,
+			"handle": {h: dict(s.riepilogo(ora), **(sequenze[h].riepilogo() if h in sequenze else {"buchi": 0, "persi": 0}))
+				for h, s in list(self.handle.items())},
+			"stadi": {n: s.riepilogo() for n, s in list(self.stadi.items())}}
@@ -0,0 +1,5 @@
+#i moduli del programma sono nella cartella superiore e si importano come quando si esegue Ricezione_notifiche.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
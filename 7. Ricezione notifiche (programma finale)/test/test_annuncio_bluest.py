@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+import Ricezione_notifiche as rn
+import helper_simulato
+
+INDIRIZZO = "c0:86:1d:31:45:48"
+#temperatura, pressione, umidità, batteria e accelerometro/giroscopio/magnetometro, senza sensor fusion
+MASCHERA = 0x00e00000 | 0x00040000 | 0x00100000 | 0x00080000 | 0x00020000
+
+def test_blocco_del_costruttore():
+	annuncio = rn.BlueSTAdvertisement.parse(bytes([0x01, 0x80]) + MASCHERA.to_bytes(4, "big"))
+	assert annuncio == (0x01, 0x80, MASCHERA, None)
+	assert annuncio.hasFeatures(0x00e00000) and not annuncio.hasFeatures(0x00000100)
+	con_mac = rn.BlueSTAdvertisement.parse(bytes([0x01, 0x80]) + MASCHERA.to_bytes(4, "big") + bytes.fromhex("c0861d314548"))
+	assert con_mac.mac == INDIRIZZO
+
+@pytest.mark.parametrize("data", [None, b"", b"\x01\x80\x00\xe0", b"\x02\x80\x00\xe0\x00\x00", b"\x01" * 8])
+def test_blocchi_non_bluest(data):
+	#lunghezza diversa da 6 o 12 byte o versione del protocollo non supportata
+	assert rn.BlueSTAdvertisement.parse(data) is None
+
+def test_annuncio_dalla_scansione():
+	blocco = bytes([0x01, 0x80]) + MASCHERA.to_bytes(4, "big")
+	nome = b"STLB100"
+	#strutture AD dell'advertising: lunghezza, tipo, dati
+	grezzi = bytes([2, rn.ScanEntry.FLAGS, 0x06, len(nome) + 1, rn.ScanEntry.COMPLETE_LOCAL_NAME]) + nome + \
+		bytes([len(blocco) + 1, rn.ScanEntry.MANUFACTURER]) + blocco
+	voce = rn.ScanEntry(INDIRIZZO, 0)
+	voce._update({"type": [2], "rssi": [60], "flag": [0], "d": [grezzi]})
+	assert voce.getBlueST().featureMask == MASCHERA
+	senza_blocco = rn.ScanEntry(INDIRIZZO, 0)
+	senza_blocco._update({"type": [2], "rssi": [60], "flag": [0], "d": [grezzi[:3]]})
+	assert senza_blocco.getBlueST() is None
+
+@pytest.fixture
+def periferica(tmp_path, monkeypatch):
+	monkeypatch.setattr(rn, "helperExe", os.path.abspath(helper_simulato.__file__))
+	monkeypatch.setenv("BLUETOOTH_DEBUGFS", str(tmp_path))
+	monkeypatch.setattr(rn, "caratteristiche_handle", {})
+	conn = rn.Peripheral(INDIRIZZO, rn.ADDR_TYPE_RANDOM)
+	yield conn
+	conn.disconnect()
+
+def test_solo_le_caratteristiche_annunciate(periferica, monkeypatch):
+	#sensor fusion scelto ma non annunciato: non viene cercato; le caratteristiche non scelte non sono disabilitate
+	comandi = []
+	scrivi = periferica._writeCmd
+	def registra(cmd):
+		comandi.append(cmd)
+		scrivi(cmd)
+	monkeypatch.setattr(periferica, "_writeCmd", registra)
+	annuncio = rn.BlueSTAdvertisement(1, 0x80, MASCHERA, None)
+	scelte = {"temperatura_pressione": "n", "acc_giro_magn": "s", "sensor_fusion_compact": "s", "pitch_roll": "n",
+		"batteria": "s"}
+	assert rn.abilita_notifiche(periferica, scelte, annuncio=annuncio)
+	assert rn.handle_acc_gyr_magn == helper_simulato.HANDLE_AGM
+	assert rn.handle_sensor_fusion_compact is None and rn.handle_pitch_roll is None
+	assert [c.nome for c in rn.caratteristiche_handle.values()] == ["batteria"]
+	#per ogni caratteristica una ricerca per uuid e la lettura del CCCD subito dopo il valore; solo temperatura e
+	#pressione, che viene comunque letta, è disabilitata
+	assert comandi == ["char 1 FFFF 00140000-0001-11e1-ac36-0002a5d5c51b\n", "desc F F\n",
+		"char 1 FFFF 00e00000-0001-11e1-ac36-0002a5d5c51b\n", "desc 12 12\n",
+		"char 1 FFFF 00020000-0001-11e1-ac36-0002a5d5c51b\n", "desc 1B 1B\n",
+		"wr F 0000\n", "wr 12 0100\nwr 1B 0100\n", "rd E\n"]
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+
+from archivio_memoria import ArchivioFlusso, crea_archivio
+from caratteristiche_bluest import campi_flusso
+
+def test_fette_tra_blocchi_scaricati_e_in_memoria(tmp_path):
+	#blocchi da 4 righe e uno solo pieno in memoria: le prime righe finiscono su disco, con il timestamp
+	#del dispositivo che riparte da 0 a metà
+	archivio = ArchivioFlusso("accelerometro", campi_flusso("accelerometro"), righe_per_blocco=4, blocchi_in_memoria=1,
+		cartella=str(tmp_path))
+	righe = [[(65520 + 5 * i) % 65536, "120000.000000", i / 1000.0, float("nan") if i % 7 == 0 else -i / 1000.0, 1.0]
+		for i in range(30)]
+	for riga in righe:
+		archivio.scrivi([riga])
+	assert len(archivio) == 30
+	assert archivio.primo_in_memoria == 6
+	assert len(os.listdir(str(tmp_path))) == 6
+	assert isinstance(archivio.blocchi[0], np.memmap)
+	tempi, valori = archivio.seleziona()
+	assert tempi.tolist() == [65520 + 5 * i for i in range(30)]
+	#intervallo che inizia in un blocco su disco e finisce nel blocco in scrittura
+	fette = archivio.fette(65520 + 5 * 3, 65520 + 5 * 27)
+	assert [len(record) for _, record in fette] == [1, 4, 4, 4, 4, 4, 3]
+	tempi, valori = archivio.seleziona(65520 + 5 * 3, 65520 + 5 * 27)
+	assert tempi.tolist() == [65520 + 5 * i for i in range(3, 27)]
+	assert valori[:, 0].tolist() == [i / 1000.0 for i in range(3, 27)]
+	assert [np.isnan(v) for v in valori[:, 1].tolist()] == [i % 7 == 0 for i in range(3, 27)]
+	assert archivio.seleziona(70000, 80000)[0].tolist() == [65520 + 5 * i for i in range(30) if 70000 <= 65520 + 5 * i < 80000]
+
+def test_tempi_frazionari_con_scarico(tmp_path):
+	archivio = crea_archivio("quaternioni", righe_per_blocco=5, blocchi_in_memoria=1, cartella=str(tmp_path))
+	dati = np.array([[100 + k / 3.0, 0] + [k, -k, 0.5, 0.25, 1.0, 2.0, 3.0] for k in range(20)])
+	archivio.scrivi_blocco(dati[:11])
+	archivio.scrivi_blocco(dati[11:])
+	assert archivio.primo_in_memoria == 2
+	tempi, valori = archivio.seleziona(101, 104)
+	assert np.allclose(tempi, [100 + k / 3.0 for k in range(3, 12)])
+	assert valori[:, 0].tolist() == list(range(3, 12))
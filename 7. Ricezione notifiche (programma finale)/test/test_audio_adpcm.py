@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+
+from audio_adpcm import decodifica_adpcm, codifica_adpcm, PASSI, VARIAZIONI_INDICE, BYTE_PER_PACCHETTO
+
+def _decodifica_scalare(dati, indice=0, predetto=0):
+	#decodificatore IMA ADPCM di riferimento, un codice alla volta (prima il nibble basso)
+	campioni = []
+	for byte in dati:
+		for codice in (byte & 0x0F, byte >> 4):
+			passo = PASSI[indice]
+			differenza = passo >> 3
+			if codice & 4:
+				differenza += passo
+			if codice & 2:
+				differenza += passo >> 1
+			if codice & 1:
+				differenza += passo >> 2
+			predetto += -differenza if codice & 8 else differenza
+			predetto = max(-32768, min(32767, predetto))
+			indice = max(0, min(len(PASSI) - 1, indice + VARIAZIONI_INDICE[codice]))
+			campioni.append(predetto)
+	return campioni, indice, predetto
+
+def test_decodifica_come_il_riferimento():
+	#codici casuali (che portano spesso il campione fuori dai 16 bit) decodificati a blocchi di pacchetti
+	generatore = random.Random(44)
+	dati = bytes(generatore.randrange(256) for _ in range(BYTE_PER_PACCHETTO * 200))
+	atteso, indice_atteso, predetto_atteso = _decodifica_scalare(dati)
+	campioni, indice, predetto = [], 0, 0
+	for inizio in range(0, len(dati), BYTE_PER_PACCHETTO * 50):
+		blocco, indice, predetto = decodifica_adpcm(dati[inizio:inizio + BYTE_PER_PACCHETTO * 50], indice, predetto)
+		assert blocco.dtype == np.int16
+		campioni.extend(blocco.tolist())
+	assert campioni == atteso
+	assert (indice, predetto) == (indice_atteso, predetto_atteso)
+	assert min(atteso) == -32768 and max(atteso) == 32767
+
+def test_codifica_e_decodifica():
+	#un tono codificato e decodificato segue il segnale originale
+	segnale = [int(8000 * np.sin(2 * np.pi * 440 * n / 8000.0)) for n in range(800)]
+	dati, indice, predetto = codifica_adpcm(segnale)
+	campioni, indice_decodifica, predetto_decodifica = decodifica_adpcm(dati)
+	assert (indice_decodifica, predetto_decodifica) == (indice, predetto)
+	assert campioni.tolist() == _decodifica_scalare(dati)[0]
+	assert np.abs(campioni[100:].astype(int) - segnale[100:]).max() < 1000
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from buffer_condiviso import BufferCircolareScrittura, BufferCircolareLettura, BachecaScrittura, leggi_bacheca, percorso_buffer
+
+NOME = "prova_test_buffer"
+COLONNE = ["timestamp", "time", "x"]
+
+def _righe(n, inizio=0):
+	return [[inizio + i, 0, 2 * (inizio + i)] for i in range(n)]
+
+def test_chiusura_rimuove_il_buffer():
+	scrittore = BufferCircolareScrittura(NOME, COLONNE, 16)
+	scrittore.scrivi(_righe(5))
+	lettore = BufferCircolareLettura(NOME)
+	scrittore.chiudi()
+	assert not os.path.exists(percorso_buffer(NOME))
+	#il lettore che lo ha mappato legge gli ultimi record
+	assert lettore.sostituito()
+	sequenza, dati, persi = lettore.copia(0)
+	assert sequenza == 5 and persi == 0 and dati[:, 0].tolist() == [0, 1, 2, 3, 4]
+	lettore.chiudi()
+
+def test_generazione_diversa_rifiutata():
+	vecchio = BufferCircolareScrittura(NOME, COLONNE, 16, generazione=1)
+	vecchio.scrivi(_righe(3))
+	with pytest.raises(ValueError):
+		BufferCircolareLettura(NOME, generazione=2)
+	nuovo = BufferCircolareScrittura(NOME, COLONNE, 16, generazione=2)
+	#il vecchio scrittore non rimuove il buffer che lo ha sostituito
+	vecchio.chiudi()
+	lettore = BufferCircolareLettura(NOME, generazione=2)
+	assert not lettore.sostituito()
+	assert lettore.copia(0)[0] == 0
+	nuovo.chiudi()
+	lettore.chiudi()
+
+def test_bacheca():
+	bacheca = BachecaScrittura(NOME + "_bacheca", generazione=3)
+	assert leggi_bacheca(NOME + "_bacheca", 3) is None
+	bacheca.pubblica({"riconnessioni": 1})
+	bacheca.pubblica({"riconnessioni": 2, "nomi_handle": {"17": "AGM"}})
+	assert leggi_bacheca(NOME + "_bacheca", 3) == {"riconnessioni": 2, "nomi_handle": {"17": "AGM"}}
+	#la bacheca di un'altra esecuzione viene ignorata
+	assert leggi_bacheca(NOME + "_bacheca", 4) is None
+	bacheca.chiudi()
+	assert leggi_bacheca(NOME + "_bacheca", 3) is None
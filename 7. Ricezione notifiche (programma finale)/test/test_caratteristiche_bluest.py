@@ -0,0 +1,60 @@
+import math
+import struct
+
+import numpy as np
+import pytest
+
+from caratteristiche_bluest import (TABELLA, PER_NOME, AGGIUNTIVE, DECODIFICA_DEDICATA, FORMATO_TIMESTAMP, annunciate,
+	per_uuid, scale_flusso, applica_scala, valore_mancante)
+
+def _pacchetto(caratteristica, timestamp=1234):
+	#pacchetto completo con valori diversi per ogni campo, entro i limiti del formato
+	valori = [timestamp]
+	for i, (_, formato, _, _) in enumerate(caratteristica.campi):
+		valori.append(1.5 + i if formato in "fd" else (i + 1) * (-7 if formato.islower() else 11))
+	return struct.pack(FORMATO_TIMESTAMP + "".join(c[1] for c in caratteristica.campi), *valori), valori
+
+@pytest.mark.parametrize("caratteristica", [c for c in TABELLA if c.decodificabile], ids=lambda c: c.nome)
+def test_decodifica_coerente_con_le_scale(caratteristica):
+	#la decodifica della singola notifica e la conversione vettoriale dei valori interi con le scale della tabella
+	#devono dare gli stessi valori per ogni voce
+	data, valori = _pacchetto(caratteristica)
+	grezza = caratteristica.decodifica_grezza(data)
+	assert list(grezza) == valori
+	riga = caratteristica.decodifica(data)
+	assert len(riga) == 1 + len(caratteristica.campi) and riga[0] == 1234
+	scale = [(colonna, 1.0 / divisore, 0.0, unita) for colonna, _, divisore, unita in caratteristica.campi]
+	convertita = applica_scala([(grezza[0], 0.0) + tuple(grezza[1:])], scale)[0]
+	np.testing.assert_allclose(riga[1:], convertita[2:])
+	if caratteristica.nome not in DECODIFICA_DEDICATA:
+		assert scale_flusso(caratteristica.nome) == scale
+	assert caratteristica.formatta(riga).count("\n") == len(caratteristica.campi) + 1
+
+def test_lunghezze_non_previste_e_feature_senza_formato():
+	batteria = PER_NOME["batteria"]
+	data, _ = _pacchetto(batteria)
+	assert batteria.decodifica(data[:-1]) is None and batteria.decodifica(data + b"\x00") is None
+	assert PER_NOME["audio_adpcm"].decodifica(b"\x00" * 20) is None
+	assert all(c.decodificabile for c in AGGIUNTIVE)
+
+def test_campi_facoltativi_mancanti():
+	#evento dell'accelerometro senza numero di passi, un solo microfono, quaternione senza parte scalare
+	evento = PER_NOME["evento_accelerometro"].decodifica(struct.pack("<HB", 5, 3))
+	assert evento[:2] == (5, 3) and math.isnan(evento[2])
+	microfoni = PER_NOME["livello_microfoni"].decodifica_grezza(struct.pack("<HB", 5, 60))
+	assert microfoni[:2] == (5, 60) and all(math.isnan(v) for v in microfoni[2:])
+	assert len(PER_NOME["sensor_fusion_float"].varianti) == 2
+
+def test_annuncio_e_uuid():
+	#caratteristica composta: servono i bit di tutte le feature; pitch e roll non dipende dalla maschera
+	agm = PER_NOME["acc_giro_magn"]
+	assert agm.annunciata(0x00e00000) and not agm.annunciata(0x00600000)
+	assert PER_NOME["pitch_roll"].annunciata(0)
+	nomi = [c.nome for c in annunciate(0x00140000)]
+	assert nomi == ["temperatura", "pressione", "temperatura_pressione"]
+	assert per_uuid("00E00000-0001-11E1-AC36-0002A5D5C51B") is agm
+	assert per_uuid("00002a19-0000-1000-8000-00805f9b34fb") is None
+
+def test_valore_mancante():
+	assert valore_mancante("h") == -32768 and valore_mancante("H") == 65535 and valore_mancante("B") == 255
+	assert math.isnan(valore_mancante("f"))
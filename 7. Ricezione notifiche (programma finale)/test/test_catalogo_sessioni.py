@@ -0,0 +1,30 @@
+import time
+import datetime
+
+from catalogo_sessioni import Catalogo
+
+INDIRIZZO = "c0:86:1d:31:45:48"
+
+def _istante(*data):
+	return time.mktime(datetime.datetime(*data).timetuple())
+
+def test_lettura_a_cavallo_della_mezzanotte(tmp_path):
+	catalogo = Catalogo(str(tmp_path / "catalogo.sqlite"))
+	nome_file = str(tmp_path / "accelerometro.tsv")
+	ore = ["235958.500000", "235959.500000", "000000.500000", "000001.500000", "000002.500000"]
+	righe = ["{}\t{}\t0.0\t0.0\t1.0".format(i, ora) for i, ora in enumerate(ore)]
+	with open(nome_file, "w") as fp:
+		fp.write("timestamp\ttime\tX\tY\tZ\n")
+		posizione = fp.tell()
+		fp.write("\n".join(righe) + "\n")
+	sessione = catalogo.apri_sessione(INDIRIZZO, inizio=_istante(2026, 1, 15, 23, 59, 50))
+	indice = sessione.flusso("accelerometro", nome_file)
+	#punto di controllo registrato poco prima della mezzanotte
+	indice.prima_di_scrivere(posizione, _istante(2026, 1, 15, 23, 59, 58, 400000))
+	indice.dopo_aver_scritto(len(righe), posizione + len("\n".join(righe)) + 1)
+	sessione.chiudi(fine=_istante(2026, 1, 16, 0, 0, 3))
+	assert catalogo.leggi(INDIRIZZO, "accelerometro", _istante(2026, 1, 15, 23, 59, 59), _istante(2026, 1, 16, 0, 0, 2)) == righe[1:4]
+	assert catalogo.leggi(INDIRIZZO, "accelerometro", _istante(2026, 1, 16, 0, 0, 0), _istante(2026, 1, 16, 0, 0, 3)) == righe[2:]
+	#le stesse ore del giorno precedente non sono nell'intervallo
+	assert catalogo.leggi(INDIRIZZO, "accelerometro", _istante(2026, 1, 15, 0, 0, 0), _istante(2026, 1, 15, 0, 0, 3)) == []
+	catalogo.chiudi()
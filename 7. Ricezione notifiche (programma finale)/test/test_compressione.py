@@ -0,0 +1,44 @@
+import math
+
+import numpy as np
+
+from compressione import CodificaDelta
+from caratteristiche_bluest import campi_flusso
+from archivio_memoria import SUDDIVISIONI_TEMPO
+
+def _uguali(a, b):
+	return (math.isnan(a) and math.isnan(b)) or a == b
+
+def test_valori_mancanti_e_mezzanotte():
+	#righe a cavallo della mezzanotte con un asse mancante: il nan torna nan e l'ora riparte da 0
+	righe = [[65534, "235959.800000", 0.001, -0.002, 1.0],
+		[65535, "235959.900000", float("nan"), 0.5, -1.0],
+		[0, "000000.000000", 0.003, float("nan"), 0.25],
+		[1, "000000.125000", -32.767, 32.767, 0.0]]
+	for compressore in (None, "zlib"):
+		codifica = CodificaDelta(campi_flusso("accelerometro"), compressore)
+		blocco = codifica.codifica(righe)
+		assert codifica.righe(blocco) == len(righe)
+		valori = codifica.valori(blocco)
+		for riga, decodificata in zip(righe, valori.tolist()):
+			assert decodificata[0] == riga[0]
+			assert _uguali(decodificata[2], riga[2]) and _uguali(decodificata[3], riga[3]) and _uguali(decodificata[4], riga[4])
+		assert valori[:, 1].tolist() == [86399.8, 86399.9, 0.0, 0.125]
+		testo = codifica.righe_testo(blocco)
+		assert [r.split("\t")[1] for r in testo] == [r[1] for r in righe]
+		assert testo[1].split("\t")[2] == "nan" and testo[2].split("\t")[3] == "nan"
+
+def test_tempi_frazionari_dei_quaternioni():
+	#tre quaternioni per pacchetto distribuiti a terzi del tick, con valori float a 32 bit
+	suddivisioni = SUDDIVISIONI_TEMPO["quaternioni"]
+	righe = [[100 + k / 3.0, "101010.{:06d}".format(k), 0.5, -0.5, 0.25, float("nan"), 1.5, -2.5, 180.0] for k in range(9)]
+	for compressore in (None, "zlib"):
+		codifica = CodificaDelta(campi_flusso("quaternioni"), compressore, suddivisioni)
+		blocco = codifica.codifica(righe)
+		timestamp, _, _, valori_float = codifica.decodifica(blocco)
+		assert timestamp.tolist() == list(range(300, 309))
+		valori = codifica.valori(blocco)
+		assert np.allclose(valori[:, 0], [riga[0] for riga in righe])
+		assert np.isnan(valori[:, 5]).all()
+		assert valori[:, 2:].tolist()[0][:3] == [0.5, -0.5, 0.25]
+		assert [float(r.split("\t")[0]) for r in codifica.righe_testo(blocco)] == [300 / 3.0 + k / 3.0 for k in range(9)]
@@ -0,0 +1,69 @@
+import os
+import datetime
+
+from contenitore import Contenitore, LettoreContenitore, FORMATO_RECORD, RIGHE
+from caratteristiche_bluest import campi_flusso
+
+INDIRIZZO = "c0:86:1d:31:45:48"
+COLONNE = ["timestamp", "time", "x", "y", "z"]
+
+def _righe(n, inizio=0):
+	return [[inizio + i, "120000.{:06d}".format(i), i / 1000.0, -i / 1000.0, 0.5] for i in range(n)]
+
+def _scrivi(cartella, righe, compressione=None):
+	contenitore = Contenitore(str(cartella), INDIRIZZO, compressione=compressione)
+	numero = contenitore.segmento({"prova": True})
+	sink = contenitore.flusso("accelerometro", COLONNE, campi_flusso("accelerometro"))
+	sink.scrivi(righe)
+	contenitore.chiudi()
+	return numero, contenitore.percorso
+
+def test_riapertura_conserva_le_righe(tmp_path):
+	for compressione in (None, "delta"):
+		cartella = tmp_path / str(compressione)
+		cartella.mkdir()
+		_, percorso = _scrivi(cartella, _righe(3000))
+		dimensione = os.path.getsize(percorso)
+		#nuova esecuzione nello stesso giorno
+		numero, _ = _scrivi(cartella, _righe(10, 3000))
+		assert numero == 2
+		assert os.path.getsize(percorso) > dimensione
+		lettore = LettoreContenitore(percorso)
+		assert len(lettore.righe("accelerometro", segmento=1)) == 3000
+		assert len(lettore.righe("accelerometro")) == 3010
+		assert [m["segmento"] for _, m in lettore.segmenti()] == [1, 2]
+
+def test_coda_incompleta_rimossa(tmp_path):
+	_, percorso = _scrivi(tmp_path, _righe(500))
+	integro = os.path.getsize(percorso)
+	#record di righe interrotto a metà della scrittura
+	with open(percorso, "ab") as fp:
+		fp.write(FORMATO_RECORD.pack(RIGHE, 1000) + b"\x0daccelerometro1\t2")
+	assert LettoreContenitore(percorso).fine_valida() == integro
+	contenitore = Contenitore(str(tmp_path), INDIRIZZO)
+	contenitore.segmento()
+	contenitore.chiudi()
+	lettore = LettoreContenitore(percorso)
+	assert len(lettore.righe("accelerometro")) == 500
+	assert lettore.fine_valida() == os.path.getsize(percorso)
+	assert [m["segmento"] for _, m in lettore.segmenti()] == [1, 2]
+
+def test_numerazione_dei_segmenti_tra_file(tmp_path):
+	#con file piccoli ogni record passa a un nuovo file: i marcatori "continua" ripetono il numero del segmento
+	contenitore = Contenitore(str(tmp_path), INDIRIZZO, dimensione_massima=4096)
+	for segmento in range(2):
+		contenitore.segmento()
+		sink = contenitore.flusso("accelerometro", COLONNE)
+		for i in range(10):
+			sink.scrivi(_righe(100, 100 * i))
+			sink.svuota()
+	contenitore.chiudi()
+	assert len(os.listdir(str(tmp_path))) > 2
+	#nuova esecuzione: riprende dall'ultimo file del giorno, che contiene solo un marcatore "continua" del segmento 2
+	contenitore = Contenitore(str(tmp_path), INDIRIZZO, dimensione_massima=4096)
+	assert contenitore.segmento() == 3
+	contenitore.chiudi()
+	giorno = datetime.date.today().isoformat()
+	segmenti = [m["segmento"] for nome in os.listdir(str(tmp_path)) if giorno in nome
+		for _, m in LettoreContenitore(os.path.join(str(tmp_path), nome)).segmenti() if not m.get("continua")]
+	assert sorted(segmenti) == [1, 2, 3]
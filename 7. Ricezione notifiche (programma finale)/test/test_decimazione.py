@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+import pytest
+
+from decimazione import DecimatoreOgniN, DecimatoreBlocchi, DecimatoreAntiAliasing, crea_decimatore
+
+def _righe(valori):
+	return [(k, "120000.{:06d}".format(k), v) for k, v in enumerate(valori)]
+
+def _decima(decimatore, righe):
+	return [uscita for riga in righe for uscita in decimatore.aggiungi(riga)] + decimatore.svuota()
+
+def test_ogni_n():
+	uscite = _decima(DecimatoreOgniN(3), _righe(range(10)))
+	assert [r[0] for r in uscite] == [0, 3, 6, 9]
+
+def test_blocchi_con_blocco_incompleto():
+	righe = _righe([1, 2, 3, 4, 5, 6, 7])
+	assert _decima(DecimatoreBlocchi(3), righe) == [(2, "120000.000002", 2.0), (5, "120000.000005", 5.0), (6, "120000.000006", 7.0)]
+	assert [r[2] for r in _decima(DecimatoreBlocchi(3, "minimo"), righe)] == [1, 4, 7]
+	assert [r[2] for r in _decima(DecimatoreBlocchi(3, "massimo"), righe)] == [3, 6, 7]
+	with pytest.raises(ValueError):
+		DecimatoreBlocchi(3, "mediana")
+
+def test_anti_aliasing_come_la_convoluzione():
+	n = 4
+	segnale = np.random.RandomState(1).normal(size=200)
+	decimatore = DecimatoreAntiAliasing(n)
+	coefficienti = np.array(decimatore.coefficienti)
+	uscite = _decima(decimatore, _righe(segnale))
+	#un'uscita ogni n ingressi, con i tempi del campione centrale della finestra
+	attesi = np.convolve(segnale, coefficienti, mode="valid")[::n]
+	np.testing.assert_allclose([r[2] for r in uscite], attesi, atol=1e-12)
+	assert [r[0] for r in uscite] == list(range(len(coefficienti) // 2, 200 - len(coefficienti) // 2, n))
+
+def test_anti_aliasing_attenua_sopra_la_nuova_nyquist():
+	n = 5
+	decimatore = DecimatoreAntiAliasing(n)
+	assert abs(math.fsum(decimatore.coefficienti) - 1) < 1e-12
+	#tono a 0.4 cicli/campione, oltre la frequenza di Nyquist dopo la decimazione (0.1)
+	tono = np.sin(2 * math.pi * 0.4 * np.arange(400))
+	uscite = [r[2] for r in _decima(decimatore, _righe(tono))]
+	assert max(abs(v) for v in uscite) < 0.01
+	#un segnale costante passa invariato
+	assert all(abs(r[2] - 2.0) < 1e-12 for r in _decima(DecimatoreAntiAliasing(n), _righe([2.0] * 100)))
+
+def test_crea_decimatore():
+	assert crea_decimatore("media", 1) is None and crea_decimatore(None, 5) is None
+	assert isinstance(crea_decimatore("ogni_n", 2), DecimatoreOgniN)
+	assert isinstance(crea_decimatore("anti_aliasing", 2), DecimatoreAntiAliasing)
+	assert isinstance(crea_decimatore("massimo", 2), DecimatoreBlocchi)
+	with pytest.raises(ValueError):
+		DecimatoreOgniN(0)
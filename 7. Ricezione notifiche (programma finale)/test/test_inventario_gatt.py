@@ -0,0 +1,68 @@
+import os
+import json
+
+import pytest
+
+import Ricezione_notifiche as rn
+import helper_simulato
+from inventario_gatt import inventario, carica_inventario, VERSIONE, UUID_CCCD
+
+INDIRIZZO = "c0:86:1d:31:45:48"
+
+@pytest.fixture
+def periferica(tmp_path, monkeypatch):
+	monkeypatch.setattr(rn, "helperExe", os.path.abspath(helper_simulato.__file__))
+	monkeypatch.setenv("BLUETOOTH_DEBUGFS", str(tmp_path))
+	monkeypatch.setattr(rn, "caratteristiche_handle", {})
+	conn = rn.Peripheral(INDIRIZZO, rn.ADDR_TYPE_RANDOM)
+	yield conn
+	conn.disconnect()
+
+def _registra_comandi(conn, monkeypatch):
+	comandi = []
+	scrivi = conn._writeCmd
+	def registra(cmd):
+		comandi.append(cmd.split()[0])
+		scrivi(cmd)
+	monkeypatch.setattr(conn, "_writeCmd", registra)
+	return comandi
+
+def test_inventario_della_tabella_degli_attributi(periferica, monkeypatch):
+	comandi = _registra_comandi(periferica, monkeypatch)
+	dati = inventario(periferica)
+	#tre sole richieste al bluepy-helper
+	assert comandi == ["svcs", "char", "desc"]
+	assert [(s["uuid"], s["inizio"], s["fine"]) for s in dati["servizi"]] == \
+		sorted(((u, i, f) for u, (i, f) in helper_simulato.SERVIZI.items()), key=lambda s: s[1])
+	(feature,) = [s for s in dati["servizi"] if s["nome"] == "Base feature"]
+	#ogni caratteristica ha la dichiarazione, il valore e il CCCD della tabella degli attributi e nessun altro descrittore
+	assert {c["uuid"]: (c["handle"], c["handle_valore"]) for c in feature["caratteristiche"]} == helper_simulato.CARATTERISTICHE
+	for c in feature["caratteristiche"]:
+		assert c["cccd"] == c["handle_valore"] + 1
+		assert c["descrittori"] == [{"uuid": UUID_CCCD, "nome": "Client Characteristic Configuration", "handle": c["cccd"]}]
+		assert c["proprieta"] == ["READ", "NOTIFY"]
+	agm = dati["handle"]["acc_giro_magn"]
+	assert (agm["handle_valore"], agm["cccd"], agm["proprieta"]) == (helper_simulato.HANDLE_AGM, helper_simulato.HANDLE_AGM + 1,
+		helper_simulato.PROPRIETA)
+	assert set(dati["handle"]) == {"temperatura_pressione", "acc_giro_magn", "sensor_fusion_compact", "pitch_roll", "batteria",
+		"umidita", "audio_adpcm", "sincronizzazione_adpcm"}
+
+def test_notifiche_abilitate_dall_inventario(periferica, monkeypatch, tmp_path):
+	#con l'inventario salvato le caratteristiche non sono cercate sulla connessione
+	percorso = tmp_path / "inventario.json"
+	percorso.write_text(json.dumps(dict(inventario(periferica), versione=VERSIONE, indirizzo=INDIRIZZO.upper())))
+	assert carica_inventario(str(percorso), "c0:86:1d:31:45:49") is None
+	dati = carica_inventario(str(percorso), INDIRIZZO)
+	comandi = _registra_comandi(periferica, monkeypatch)
+	scelte = {"temperatura_pressione": "s", "acc_giro_magn": "s", "sensor_fusion_compact": "n", "pitch_roll": "n",
+		"batteria": "s"}
+	assert rn.abilita_notifiche(periferica, scelte, inventario=dati)
+	assert comandi == ["wr", "wr"]
+	assert rn.handle_acc_gyr_magn == helper_simulato.HANDLE_AGM
+	assert [c.nome for c in rn.caratteristiche_handle.values()] == ["batteria"]
+
+def test_versione_non_supportata(tmp_path):
+	percorso = tmp_path / "inventario.json"
+	percorso.write_text(json.dumps({"versione": VERSIONE + 1, "servizi": [], "handle": {}}))
+	with pytest.raises(ValueError):
+		carica_inventario(str(percorso))
@@ -0,0 +1,29 @@
+import os
+
+import Ricezione_notifiche as rn
+
+class _Uscita:
+	def __init__(self, fd):
+		self.fd = fd
+
+	def fileno(self):
+		return self.fd
+
+class _Helper:
+	def __init__(self, fd):
+		self.stdout = _Uscita(fd)
+
+def test_carattere_diviso_tra_due_letture():
+	lettura, scrittura = os.pipe()
+	helper = rn.BluepyHelper()
+	helper._helper = _Helper(lettura)
+	riga = "rsp=$ntfy name=$Città\n".encode("utf-8")
+	divisione = riga.index("à".encode("utf-8")) + 1
+	try:
+		for pezzo in (riga[:divisione], riga[divisione:]):
+			os.write(scrittura, pezzo)
+			helper._readAvailable()
+	finally:
+		os.close(lettura)
+		os.close(scrittura)
+	assert list(helper._lines) == ["rsp=$ntfy name=$Città\n"]
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+import negoziazione
+import helper_simulato
+import Ricezione_notifiche as rn
+
+@pytest.fixture
+def debugfs(tmp_path, monkeypatch):
+	#cartella debugfs con i valori predefiniti di BlueZ (30-50 ms)
+	os.makedirs(str(tmp_path / "hci0"))
+	for nome, valore in (("conn_min_interval", 24), ("conn_max_interval", 40)):
+		(tmp_path / "hci0" / nome).write_text(str(valore))
+	monkeypatch.setattr(negoziazione, "CARTELLA_DEBUGFS", str(tmp_path))
+	return tmp_path / "hci0"
+
+def _unita(debugfs):
+	return [int((debugfs / nome).read_text()) for nome in ("conn_min_interval", "conn_max_interval")]
+
+def test_intervallo_impostato_e_ripristinato(debugfs):
+	precedente = negoziazione.imposta_intervallo_connessione(7.5, 15.0)
+	assert precedente == (30.0, 50.0)
+	assert _unita(debugfs) == [6, 12]
+	#verso intervalli più lunghi si scrive prima il massimo
+	assert negoziazione.imposta_intervallo_connessione(*precedente) == (7.5, 15.0)
+	assert _unita(debugfs) == [24, 40]
+
+def test_scrittura_non_riuscita_ripristina_il_primo_valore(debugfs, monkeypatch):
+	def apri(percorso, modo="r"):
+		if "w" in modo and percorso.endswith("conn_max_interval"):
+			raise PermissionError(percorso)
+		return open(percorso, modo)
+	monkeypatch.setattr(negoziazione, "open", apri, raising=False)
+	assert negoziazione.imposta_intervallo_connessione(7.5, 15.0) is None
+	assert _unita(debugfs) == [24, 40]
+
+def test_senza_debugfs(tmp_path, monkeypatch):
+	monkeypatch.setattr(negoziazione, "CARTELLA_DEBUGFS", str(tmp_path))
+	assert negoziazione.imposta_intervallo_connessione(7.5, 15.0) is None
+	metadati = negoziazione.negozia_connessione(None)
+	assert metadati["intervallo_proposto"] is None and metadati["mtu"] == negoziazione.MTU_PREDEFINITO
+
+class ConnessioneFinta:
+	def __init__(self, risposta):
+		self.risposta = risposta
+		self.richiesti = []
+
+	def setMTU(self, mtu):
+		self.richiesti.append(mtu)
+		return self.risposta
+
+def test_mtu_non_concesso(debugfs):
+	conn = ConnessioneFinta(None)
+	metadati = negoziazione.negozia_connessione(conn, 247, (7.5, 15.0))
+	assert conn.richiesti == [247]
+	assert metadati["mtu"] == negoziazione.MTU_PREDEFINITO and metadati["payload_notifica"] == 20
+	assert metadati["intervallo_richiesto"] == [7.5, 15.0] and metadati["intervallo_proposto"] == [30.0, 50.0]
+	#con l'MTU predefinito non si negozia
+	negoziazione.negozia_connessione(conn, negoziazione.MTU_PREDEFINITO)
+	assert conn.richiesti == [247]
+
+def test_negoziazione_con_helper_simulato(debugfs, monkeypatch):
+	monkeypatch.setattr(rn, "helperExe", os.path.abspath(helper_simulato.__file__))
+	monkeypatch.setenv("BLUETOOTH_DEBUGFS", str(debugfs.parent))
+	negoziazione.imposta_intervallo_connessione(7.5, 15.0)
+	conn = rn.Peripheral("c0:86:1d:31:45:48", rn.ADDR_TYPE_RANDOM)
+	try:
+		metadati = negoziazione.negozia_connessione(conn, 247, (7.5, 15.0))
+	finally:
+		conn.disconnect()
+	assert metadati["mtu"] == helper_simulato.MTU_PERIFERICA
+	assert metadati["payload_notifica"] == helper_simulato.MTU_PERIFERICA - 3
+	assert metadati["intervallo_proposto"] == [7.5, 15.0]
+	assert helper_simulato.notifiche_al_secondo(15.0) == helper_simulato.FREQUENZA_AGM
+	assert helper_simulato.notifiche_al_secondo(50.0) == 80.0
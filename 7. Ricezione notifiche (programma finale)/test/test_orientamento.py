@@ -0,0 +1,37 @@
+import math
+
+import numpy as np
+import pytest
+
+from orientamento import FiltroComplementare, FiltroKalman, angoli_accelerometro, angoli_accelerometro_array
+
+def _registrazione(n=300):
+	#rotazione lenta attorno agli assi x e y con rumore, campioni a 50 Hz con qualche intervallo irregolare
+	generatore = np.random.RandomState(3)
+	t = np.cumsum(np.where(np.arange(n) % 37 == 0, 0.04, 0.02))
+	pitch = 0.5 * np.sin(t)
+	roll = 0.3 * np.cos(0.7 * t)
+	acc = np.stack((-np.sin(pitch), np.cos(pitch) * np.sin(roll), np.cos(pitch) * np.cos(roll)), axis=1)
+	acc += generatore.normal(0, 0.01, acc.shape)
+	gyr = np.zeros((n, 3))
+	gyr[1:, 0] = np.diff(roll) / np.diff(t) * 180 / math.pi
+	gyr[1:, 1] = np.diff(pitch) / np.diff(t) * 180 / math.pi
+	gyr += 0.2
+	return acc, gyr, t
+
+def test_angoli_accelerometro_vettoriali():
+	acc, _, _ = _registrazione(20)
+	np.testing.assert_allclose(angoli_accelerometro_array(acc), [angoli_accelerometro(*a) for a in acc])
+
+@pytest.mark.parametrize("classe", [FiltroComplementare, FiltroKalman])
+def test_elabora_come_aggiorna(classe):
+	acc, gyr, t = _registrazione()
+	incrementale = classe()
+	attesi = np.array([incrementale.aggiorna(acc[k], gyr[k], t[k]) for k in range(len(t))])
+	np.testing.assert_allclose(classe().elabora(acc, gyr, t), attesi, atol=1e-9)
+	#elaborazione in due parti, poi si prosegue pacchetto per pacchetto dallo stato lasciato da elabora
+	filtro = classe()
+	parti = [filtro.elabora(acc[:100], gyr[:100], t[:100]), filtro.elabora(acc[100:200], gyr[100:200], t[100:200])]
+	parti.append(np.array([filtro.aggiorna(acc[k], gyr[k], t[k]) for k in range(200, len(t))]))
+	np.testing.assert_allclose(np.concatenate(parti), attesi, atol=1e-9)
+	assert (filtro.pitch, filtro.roll) == pytest.approx((incrementale.pitch, incrementale.roll), abs=1e-9)
@@ -0,0 +1,37 @@
+import struct
+
+from pipeline import PipelineNotifiche, REGISTRO_GREZZO
+from statistiche import Statistiche
+
+def _pipeline(scrivi_grezzo):
+	#senza avvia() i thread non consumano le code, che si riempiono subito
+	pipeline = PipelineNotifiche(None, lambda nome_flusso, righe: None, scrivi_grezzo, capacita=2, politica="solo_grezzo")
+	pipeline.handleNotifications([(0x11, b"\x00" * 20)] * 5)
+	return pipeline.contatori()
+
+def test_solo_grezzo_con_registro():
+	contatori = _pipeline(lambda cHandle, data, ora: None)
+	assert contatori["ricezione"][0x11]["degradati"] == 3
+	assert contatori["ricezione"][0x11]["scartati"] == 0
+	assert contatori["salvataggio"][REGISTRO_GREZZO]["profondita"] == 2
+
+def test_solo_grezzo_senza_registro_conta_gli_scartati():
+	contatori = _pipeline(None)
+	assert contatori["ricezione"][0x11]["degradati"] == 0
+	assert contatori["ricezione"][0x11]["scartati"] == 3
+	assert REGISTRO_GREZZO not in contatori["salvataggio"]
+
+def test_notifiche_scartate_non_sono_perse_via_radio():
+	#coda piena con scarta_nuovi: i timestamp sono registrati prima della coda, quindi i salti dei pacchetti
+	#scartati non sono contati tra i persi via radio
+	statistiche = Statistiche()
+	pipeline = PipelineNotifiche(None, lambda nome_flusso, righe: None, capacita=2, politica="scarta_nuovi", statistiche=statistiche)
+	pipeline.imposta_nomi_handle({0x11: "acc_giro_magn", 0x20: "audio_adpcm"}, [0x11])
+	lotto = [(0x11, struct.pack("<H", 100 + 10 * i) + b"\x00" * 18) for i in range(8)]
+	pipeline.handleNotifications(lotto + [(0x20, b"\xff" * 20)])
+	statistiche.notifica(0x11, 20 * len(lotto), 0.0, len(lotto))
+	assert pipeline.contatori()["ricezione"]["acc_giro_magn"]["scartati"] == 6
+	voce = statistiche.riepilogo()["handle"][0x11]
+	assert voce["persi"] == 0 and voce["buchi"] == 0
+	#l'audio non ha timestamp
+	assert 0x20 not in statistiche.sequenze
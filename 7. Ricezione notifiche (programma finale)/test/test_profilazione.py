@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+import profilazione
+import Ricezione_notifiche as rn
+from profilazione import Traccia
+from test_uscita_helper import _helper
+
+def test_campionamento_per_thread():
+	traccia = Traccia(periodo=4)
+	def radici():
+		for _ in range(1000):
+			inizio = traccia.inizio(radice=True)
+			if inizio is not None:
+				traccia.fine("radice", inizio, radice=True)
+	thread = [threading.Thread(target=radici) for _ in range(3)]
+	for t in thread:
+		t.start()
+	for t in thread:
+		t.join()
+	#ogni thread registra esattamente una radice ogni 4
+	assert len(traccia.eventi) == 3 * 250
+
+def test_radice_chiusa_se_il_helper_termina(tmp_path, monkeypatch):
+	#l'EOF del helper solleva l'eccezione durante la lettura: l'intervallo radice deve essere chiuso comunque,
+	#altrimenti gli intervalli annidati successivi dello stesso thread sarebbero registrati senza radice
+	traccia = profilazione.attiva()
+	try:
+		conn = _helper(tmp_path, monkeypatch, False)
+		with pytest.raises(rn.BTLEInternalError):
+			for _ in range(50):
+				conn.drainNotifications(0.1)
+		conn.disconnect()
+		assert profilazione.inizio() is None
+		assert [e[0] for e in traccia.eventi if e[0] == "ricezione"] == ["ricezione"]
+	finally:
+		profilazione.disattiva()
@@ -0,0 +1,56 @@
+import json
+
+import pytest
+
+from profili import (ProfiloSottoscrizione, carica_profilo, percorso_predefinito, SINK_PREDEFINITI, CODE_PREDEFINITE,
+	CONNESSIONE_PREDEFINITA, CARATTERISTICHE, CARATTERISTICHE_AGGIUNTIVE, CARATTERISTICHE_AUDIO)
+
+def _scrivi(tmp_path, profili):
+	percorso = tmp_path / "profili.json"
+	percorso.write_text(json.dumps({"profili": profili}))
+	return str(percorso)
+
+def test_profili_di_esempio():
+	with open(percorso_predefinito()) as fp:
+		nomi = json.load(fp)["profili"]
+	for nome in nomi:
+		profilo = carica_profilo(percorso_predefinito(), nome)
+		assert set(profilo.scelte()) == set(CARATTERISTICHE + CARATTERISTICHE_AGGIUNTIVE + CARATTERISTICHE_AUDIO)
+	#10 Hz a partire da 50 Hz: fattore 5
+	assert carica_profilo(percorso_predefinito(), "imu_10hz").decimazione["accelerometro"] == ("anti_aliasing", 5)
+
+def test_valori_predefiniti(tmp_path):
+	profilo = carica_profilo(_scrivi(tmp_path, {"minimo": {"caratteristiche": ["acc_giro_magn"]}}), "minimo")
+	assert profilo.indirizzo is None and profilo.tipo_indirizzo == "random"
+	assert profilo.sink == SINK_PREDEFINITI and profilo.code == CODE_PREDEFINITE and profilo.connessione == CONNESSIONE_PREDEFINITA
+	#la ricezione non interattiva non salva i file .mat e non stima pitch e roll sull'host se non richiesto
+	assert not profilo.sink["mat"] and not profilo.sink["pitch_roll_host"]
+	scelte = profilo.scelte()
+	assert scelte["acc_giro_magn"] == "s" and scelte["pitch_roll"] == "n" and scelte["audio_adpcm"] == "n"
+
+def test_decimazione(tmp_path):
+	profilo = ProfiloSottoscrizione("prova", ["acc_giro_magn"], decimazione={
+		"accelerometro": ["media", 4],
+		"giroscopio": {"frequenza_ingresso": 50, "frequenza": 20},
+		"magnetometro": {"modo": "ogni_n", "fattore": 3},
+	})
+	assert profilo.decimazione == {"accelerometro": ("media", 4), "giroscopio": ("anti_aliasing", 2),
+		"magnetometro": ("ogni_n", 3)}
+
+@pytest.mark.parametrize("voce", [
+	{"caratteristiche": ["giroscopio"]},
+	{"caratteristiche": ["acc_giro_magn"], "decimazione": {"accelerometro": ["mediana", 4]}},
+	{"caratteristiche": ["acc_giro_magn"], "code": {"politica": "scarta_tutto"}},
+	{"caratteristiche": ["acc_giro_magn"], "code": {"politiche": {"acc_giro_magn": "solo_grezzo"}}},
+	{"caratteristiche": ["acc_giro_magn"], "sink": {"audio": "mp3"}},
+	{"caratteristiche": ["acc_giro_magn"], "sink": {"contenitore": True, "compressione_contenitore": "lz4"}},
+	{"decimazione": {}},
+])
+def test_profili_non_validi(tmp_path, voce):
+	with pytest.raises(ValueError):
+		carica_profilo(_scrivi(tmp_path, {"prova": voce}), "prova")
+
+def test_profilo_assente(tmp_path):
+	with pytest.raises(ValueError) as errore:
+		carica_profilo(_scrivi(tmp_path, {"a": {"caratteristiche": []}}), "b")
+	assert "disponibili: a" in str(errore.value)
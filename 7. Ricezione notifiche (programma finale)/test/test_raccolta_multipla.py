@@ -0,0 +1,84 @@
+import time
+import datetime
+
+import numpy as np
+from scipy.io import loadmat
+
+import Ricezione_notifiche as rn
+from raccolta_multipla import Aggregatore, nome_buffer, nome_bacheca
+from buffer_condiviso import BufferCircolareScrittura, BachecaScrittura
+from catalogo_sessioni import Catalogo, NOME_CATALOGO
+from contenitore import LettoreContenitore
+from salvataggio import leggi_testo
+from metriche import RegistroMetriche, StatoDispositivo
+from statistiche import Statistiche
+
+INDIRIZZO = "c0:86:1d:31:45:48"
+GENERAZIONE = 7
+
+def _ora():
+	return float(datetime.datetime.now().strftime("%H%M%S.%f"))
+
+def _pubblica_accelerometro(n):
+	#righe in unità fisiche come quelle pubblicate da un processo di raccolta
+	righe = [[10 * i, _ora(), i / 1000.0, -i / 1000.0, 1.0] for i in range(n)]
+	scrittore = BufferCircolareScrittura(nome_buffer(INDIRIZZO, "accelerometro"), rn.colonne_flussi["accelerometro"], 64,
+		generazione=GENERAZIONE)
+	scrittore.scrivi(righe)
+	return scrittore, righe
+
+def test_aggregatore_con_catalogo_e_valori_grezzi(tmp_path):
+	scrittore, righe = _pubblica_accelerometro(20)
+	inizio = time.time()
+	aggregatore = Aggregatore([INDIRIZZO], {"cartella": str(tmp_path), "mat": True, "catalogo": True, "valori_grezzi": True},
+		generazione=GENERAZIONE)
+	assert aggregatore.raccogli() == 20
+	aggregatore.chiudi()
+	scrittore.chiudi()
+	catalogo = Catalogo(str(tmp_path / NOME_CATALOGO))
+	(sessione,) = catalogo.sessioni(INDIRIZZO)
+	flussi = {f[1]: f for f in catalogo.flussi(sessione[0])}
+	assert flussi["accelerometro"][3] == 20 and sessione[3] is not None
+	#nel file ci sono i valori interi ricevuti (mg) e l'intestazione con le scale
+	nome_file = flussi["accelerometro"][2]
+	with open(nome_file, encoding="utf-8") as fp:
+		assert fp.read().splitlines()[-1].split("\t")[2:] == ["19", "-19", "1000"]
+	np.testing.assert_allclose(leggi_testo(nome_file)[:, 2:], np.array(righe)[:, 2:])
+	assert len(catalogo.leggi(INDIRIZZO, "accelerometro", inizio - 60, time.time() + 60)) == 20
+	mat = loadmat(nome_file[:-len(".txt")] + ".mat")
+	#una colonna per campione
+	assert mat["accelerometro"][2:, -1].tolist() == [19, -19, 1000]
+	catalogo.chiudi()
+
+def test_aggregatore_con_contenitore(tmp_path):
+	scrittore, righe = _pubblica_accelerometro(20)
+	aggregatore = Aggregatore([INDIRIZZO], {"cartella": str(tmp_path), "catalogo": True, "contenitore": True,
+		"compressione_contenitore": "delta"}, generazione=GENERAZIONE)
+	aggregatore.raccogli()
+	aggregatore.chiudi()
+	scrittore.chiudi()
+	(percorso,) = [str(p) for p in tmp_path.glob("*.stc")]
+	lettore = LettoreContenitore(percorso)
+	#un solo segmento per dispositivo, con i metadati della raccolta
+	(segmento,) = [m for _, m in lettore.segmenti()]
+	assert segmento["metadati"]["raccolta_multipla"] and segmento["metadati"]["generazione"] == GENERAZIONE
+	np.testing.assert_allclose(np.array(lettore.valori("accelerometro"), dtype=float)[:, 2:], np.array(righe)[:, 2:])
+
+def test_metriche_dei_processi_di_raccolta(tmp_path):
+	#il processo di raccolta pubblica i suoi contatori nella bacheca, l'aggregatore li serve dal suo registro
+	statistiche = Statistiche()
+	for i in range(5):
+		statistiche.notifica(0x11, 20)
+		statistiche.timestamp(0x11, 10 * i if i < 3 else 10 * i + 20)
+	stato = StatoDispositivo(INDIRIZZO)
+	stato.connessione(statistiche, nomi_handle={0x11: "AGM"})
+	bacheca = BachecaScrittura(nome_bacheca(INDIRIZZO), generazione=GENERAZIONE)
+	bacheca.pubblica(stato.istantanea())
+	registro = RegistroMetriche()
+	aggregatore = Aggregatore([INDIRIZZO], {"cartella": str(tmp_path), "catalogo": False}, registro, GENERAZIONE)
+	testo = registro.testo()
+	assert 'sensortile_connected{device="%s"} 1.0' % INDIRIZZO in testo
+	assert 'sensortile_notifications_total{device="%s",handle="0x0011",characteristic="AGM"} 5.0' % INDIRIZZO in testo
+	assert 'sensortile_notifications_lost_total{device="%s",handle="0x0011",characteristic="AGM"} 2.0' % INDIRIZZO in testo
+	aggregatore.chiudi()
+	bacheca.chiudi()
@@ -0,0 +1,51 @@
+import numpy as np
+from scipy.io import loadmat
+
+from salvataggio_mat import SinkMat
+from caratteristiche_bluest import scale_flusso
+
+COLONNE = ["timestamp", "time", "x", "y"]
+
+def _righe(n, inizio=0):
+	return [[i, "120000.{:06d}".format(i), i / 4.0, -i / 4.0] for i in range(inizio, inizio + n)]
+
+def test_blocchi_leggibili_con_loadmat(tmp_path):
+	nome_file = str(tmp_path / "prova.mat")
+	sink = SinkMat(nome_file, COLONNE, "accelerometro", righe_per_blocco=4)
+	sink.scrivi(_righe(3))
+	assert not (tmp_path / "prova.mat").exists()
+	sink.scrivi(_righe(7, 3))
+	#il file è leggibile anche prima della chiusura, con i campioni dei blocchi già scritti
+	assert loadmat(nome_file)["accelerometro"].shape == (4, 10)
+	sink.scrivi_blocco(np.array([[10, 120000.5, 2.5, -2.5]]))
+	sink.chiudi()
+	mat = loadmat(nome_file)
+	#una riga per colonna del file di testo e una colonna per campione
+	dati = mat["accelerometro"].T
+	assert dati.shape == (11, 4)
+	assert dati[:, 0].tolist() == list(range(11))
+	assert dati[3, 1] == 120000.000003 and dati[10, 3] == -2.5
+	assert [c.strip() for c in mat["accelerometro_colonne"]] == COLONNE
+	assert "accelerometro_scala" not in mat
+
+def test_nessun_file_senza_campioni(tmp_path):
+	sink = SinkMat(str(tmp_path / "vuoto.mat"), COLONNE)
+	sink.chiudi()
+	assert not (tmp_path / "vuoto.mat").exists()
+
+def test_scale_dei_valori_grezzi(tmp_path):
+	#con le scale il file contiene i valori interi e le variabili per convertirli in MATLAB
+	nome_file = str(tmp_path / "grezzi.mat")
+	scale = scale_flusso("accelerometro")
+	sink = SinkMat(nome_file, ["timestamp", "time", "x", "y", "z"], "accelerometro", scale=scale)
+	sink.scrivi([[i, "120000.{:06d}".format(i), 12 * i, -34, 1000] for i in range(5)])
+	sink.chiudi()
+	mat = loadmat(nome_file)
+	assert mat["accelerometro"][2:, -1].tolist() == [48, -34, 1000]
+	#una colonna per colonna dei dati, con timestamp e time non convertiti
+	scala = mat["accelerometro_scala"]
+	np.testing.assert_allclose(scala, [[1.0, 1.0, 0.001, 0.001, 0.001], [0.0] * 5])
+	assert [u.strip() for u in mat["accelerometro_unita"]][2:] == ["g"] * 3
+	#la conversione indicata per MATLAB: dati .* scala(1, :).' + scala(2, :).'
+	convertiti = mat["accelerometro"] * scala[0][:, None] + scala[1][:, None]
+	np.testing.assert_allclose(convertiti[:, -1], [4, 120000.000004, 0.048, -0.034, 1.0])
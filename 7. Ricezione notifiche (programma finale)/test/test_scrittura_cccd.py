@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+import Ricezione_notifiche as rn
+import helper_simulato
+
+INDIRIZZO = "c0:86:1d:31:45:48"
+UUID_AGM = "00e00000-0001-11e1-ac36-0002a5d5c51b"
+HANDLE_BATTERIA = 0x1a
+
+class Raccolta(rn.DefaultDelegate):
+	def __init__(self):
+		rn.DefaultDelegate.__init__(self)
+		self.handle = []
+
+	def handleNotification(self, cHandle, data):
+		self.handle.append(cHandle)
+
+@pytest.fixture
+def periferica(tmp_path, monkeypatch):
+	#helper simulato con l'intervallo di connessione predefinito (cartella debugfs vuota)
+	monkeypatch.setattr(rn, "helperExe", os.path.abspath(helper_simulato.__file__))
+	monkeypatch.setenv("BLUETOOTH_DEBUGFS", str(tmp_path))
+	conn = rn.Peripheral(INDIRIZZO, rn.ADDR_TYPE_RANDOM)
+	yield conn
+	conn.disconnect()
+
+def _ricevi(conn, durata):
+	raccolta = Raccolta()
+	conn.withDelegate(raccolta)
+	fine = time.time() + durata
+	while time.time() < fine:
+		conn.waitForNotifications(0.05)
+	return raccolta.handle
+
+def test_scritture_in_un_solo_comando(periferica):
+	comandi = []
+	scrivi = periferica._writeCmd
+	def registra(cmd):
+		comandi.append(cmd)
+		scrivi(cmd)
+	periferica._writeCmd = registra
+	agm = periferica.getCharacteristics(uuid=UUID_AGM)[0]
+	comandi.clear()
+	#una caratteristica (CCCD cercato tra i descrittori) e un handle di CCCD
+	risposte = periferica.enableNotifications([agm, HANDLE_BATTERIA + 1])
+	assert len(risposte) == 2 and all(r["rsp"] == ["wr"] for r in risposte)
+	#dopo la ricerca del CCCD della caratteristica, i comandi delle due scritture sono inviati insieme
+	#prima di attendere le risposte
+	assert comandi == ["desc 12 FFFF\n", "wr 12 0100\nwr 1B 0100\n"]
+	assert set(_ricevi(periferica, 0.3)) == {helper_simulato.HANDLE_AGM, HANDLE_BATTERIA}
+	periferica.enableNotifications([agm, HANDLE_BATTERIA + 1], enable=False)
+	_ricevi(periferica, 0.2)
+	assert _ricevi(periferica, 0.2) == []
+
+class PerifericaFinta(rn.Peripheral):
+	#risposte preparate per ogni scrittura, senza bluepy-helper
+	def __init__(self, risposte):
+		rn.Peripheral.__init__(self)
+		self.risposte = list(risposte)
+		self.comandi = []
+
+	def _writeCmd(self, cmd):
+		self.comandi.append(cmd)
+
+	def _getResp(self, wantType, timeout=None):
+		risposta = self.risposte.pop(0)
+		if isinstance(risposta, Exception):
+			raise risposta
+		return risposta
+
+def test_errore_dopo_tutte_le_risposte():
+	errore = rn.BTLEGattError("Bluetooth command failed", {"rsp": ["err"], "code": ["atterr"]})
+	conn = PerifericaFinta([{"rsp": ["wr"]}, errore, rn.BTLEGattError("secondo errore", {}), {"rsp": ["wr"]}])
+	with pytest.raises(rn.BTLEGattError) as sollevato:
+		conn.writeCharacteristics([(0x12, b"\x01\x00"), (0x15, b"\x01\x00"), (0x18, b"\x01\x00"), (0x1b, b"\x01\x00")],
+			withResponse=True)
+	#le risposte di tutte le scritture sono consumate e viene sollevato il primo errore
+	assert sollevato.value is errore and conn.risposte == []
+	assert conn.comandi == ["wrr 12 0100\nwrr 15 0100\nwrr 18 0100\nwrr 1B 0100\n"]
+
+def test_valore_del_cccd():
+	conn = PerifericaFinta([{"rsp": ["wr"]}] * 3)
+	conn.enableNotifications([0x12], enable=False)
+	conn.enableNotifications([0x12], enable=b"\x02\x00")
+	conn.enableNotifications([rn.Descriptor(conn, rn.UUID(0x2902), 0x15)])
+	assert conn.comandi == ["wr 12 0000\n", "wr 12 0200\n", "wr 15 0100\n"]
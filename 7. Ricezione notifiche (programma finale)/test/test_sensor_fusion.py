@@ -0,0 +1,54 @@
+import math
+
+import numpy as np
+
+from sensor_fusion import (EspansioneSensorFusion, srotola_timestamp, srotola_timestamp_array, parte_scalare, eulero,
+	eulero_array, RAD_GRADI)
+
+def _pacchetti(n):
+	#parti vettoriali intere di quaternioni unitari che ruotano lentamente, con il timestamp che riparte da 0
+	generatore = np.random.RandomState(5)
+	vettori = generatore.uniform(-0.5, 0.5, (n, 9))
+	timestamp = (65500 + 3 * np.arange(n) + np.arange(n) // 10) % 65536
+	return timestamp, np.round(vettori * 10000).astype(int)
+
+def test_srotolamento_del_timestamp():
+	assert srotola_timestamp(2, 65534) == 65538
+	assert srotola_timestamp(10, None) == 10
+	assert srotola_timestamp_array([65534, 65535, 1, 3], 65530).tolist() == [65534, 65535, 65537, 65539]
+
+def test_eulero_di_una_rotazione_nota():
+	#rotazione di 30° attorno all'asse y
+	meta = math.radians(30) / 2
+	qs, qj = math.cos(meta), math.sin(meta)
+	assert parte_scalare(0.0, qj, 0.0) == qs
+	roll, pitch, yaw = eulero(qs, 0.0, qj, 0.0)
+	assert abs(roll) < 1e-9 and abs(pitch - 30) < 1e-9 and abs(yaw) < 1e-9
+	q = np.array([[qs, 0.0, qj, 0.0], [1.0, 0.0, 0.0, 0.0]])
+	np.testing.assert_allclose(eulero_array(q), [[0.0, 30.0, 0.0], [0.0, 0.0, 0.0]], atol=1e-9)
+	assert RAD_GRADI == 180 / math.pi
+
+def test_elabora_come_aggiorna():
+	timestamp, grezzi = _pacchetti(40)
+	incrementale = EspansioneSensorFusion()
+	attesi = [c for t, v in zip(timestamp, grezzi) for c in incrementale.aggiorna(int(t), v.tolist(), grezzi=True)]
+	attesi = np.array(attesi)
+	#i tempi sono srotolati e distribuiti uniformemente tra un pacchetto e il precedente
+	assert np.all(np.diff(attesi[:, 0]) > 0)
+	assert attesi[2, 0] == 65500 and attesi[5, 0] == 65503
+	#elaborazione vettoriale in due parti con lo stato lasciato dalla prima
+	vettoriale = EspansioneSensorFusion()
+	parti = [vettoriale.elabora(timestamp[:15], grezzi[:15], grezzi=True), vettoriale.elabora(timestamp[15:], grezzi[15:], grezzi=True)]
+	tempi = np.concatenate([p[0] for p in parti])
+	q = np.concatenate([p[1] for p in parti])
+	angoli = np.concatenate([p[2] for p in parti])
+	np.testing.assert_allclose(tempi, attesi[:, 0])
+	np.testing.assert_allclose(q, attesi[:, 1:5], atol=1e-12)
+	np.testing.assert_allclose(angoli, attesi[:, 5:8], atol=1e-9)
+	assert vettoriale.timestamp == incrementale.timestamp
+
+def test_senza_eulero():
+	timestamp, grezzi = _pacchetti(2)
+	espansione = EspansioneSensorFusion(con_eulero=False)
+	assert len(espansione.aggiorna(int(timestamp[0]), (grezzi[0] / 10000.0).tolist())[0]) == 5
+	assert len(EspansioneSensorFusion(con_eulero=False).elabora(timestamp, grezzi, grezzi=True)) == 2
@@ -0,0 +1,23 @@
+from statistiche import Statistiche
+
+def test_lotto_conta_un_solo_intervallo():
+	statistiche = Statistiche()
+	#tre lotti a 10 ms di distanza, con 5 notifiche ciascuno
+	for i in range(3):
+		statistiche.notifica(0x12, 100, 0.01 * i, 5)
+	voce = statistiche.riepilogo()["handle"][0x12]
+	assert voce["conteggio"] == 15 and voce["byte"] == 300
+	assert voce["lotti"] == 3 and voce["massimo_lotto"] == 5
+	#solo i due intervalli tra i lotti, nella classe di 10 ms ([8192, 16384) us)
+	assert sum(voce["istogramma_intervalli"]) == 2
+	assert voce["istogramma_intervalli"][0] == 0
+	assert voce["istogramma_intervalli"][(10000).bit_length()] == 2
+
+def test_pacchetti_persi_dai_salti_del_timestamp():
+	statistiche = Statistiche()
+	#passo di 2 tick, con il timestamp a 16 bit che riparte da 0; mancano 3 pacchetti dopo 65534 e 1 dopo 20
+	for t in [65530, 65532, 65534, 6, 8, 10, 12, 14, 16, 18, 20, 24]:
+		statistiche.notifica(0x11, 20)
+		statistiche.timestamp(0x11, t)
+	voce = statistiche.riepilogo()["handle"][0x11]
+	assert voce["buchi"] == 2 and voce["persi"] == 4
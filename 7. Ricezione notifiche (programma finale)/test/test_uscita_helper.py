@@ -0,0 +1,46 @@
+import os
+import sys
+import stat
+import time
+
+import pytest
+
+import Ricezione_notifiche as rn
+
+#helper che risponde alla connessione e poi termina; con un processo figlio che eredita lo stdout, la fine del
+#helper non chiude la pipe e può essere rilevata solo dal SIGCHLD
+HELPER = """#!{python}
+import sys, subprocess
+sys.stdin.readline()
+sys.stdout.write("rsp=$stat\\x1estate=$conn\\x1emtu=h17\\n")
+sys.stdout.flush()
+if {figlio}:
+	subprocess.Popen(["sleep", "3"])
+"""
+
+def _helper(tmp_path, monkeypatch, figlio):
+	percorso = tmp_path / "helper.py"
+	percorso.write_text(HELPER.format(python=sys.executable, figlio=figlio))
+	percorso.chmod(percorso.stat().st_mode | stat.S_IXUSR)
+	monkeypatch.setattr(rn, "helperExe", str(percorso))
+	return rn.Peripheral("c0:86:1d:31:45:48", rn.ADDR_TYPE_RANDOM)
+
+@pytest.mark.parametrize("attesa", ["waitForNotifications", "drainNotifications"])
+def test_fine_del_helper_con_eof(tmp_path, monkeypatch, attesa):
+	conn = _helper(tmp_path, monkeypatch, False)
+	with pytest.raises(rn.BTLEInternalError):
+		for _ in range(50):
+			getattr(conn, attesa)(0.1)
+	#il helper è stato rilasciato: la disconnessione non scrive su una pipe chiusa
+	assert conn._helper is None
+	conn.disconnect()
+
+def test_fine_del_helper_con_sigchld(tmp_path, monkeypatch):
+	conn = _helper(tmp_path, monkeypatch, True)
+	inizio = time.time()
+	with pytest.raises(rn.BTLEInternalError):
+		while time.time() - inizio < 5:
+			conn.waitForNotifications(0.1)
+	#rilevata dal SIGCHLD entro qualche attesa, non dall'EOF quando termina anche il processo figlio
+	assert time.time() - inizio < 2
+	assert conn._helper is None
@@ -0,0 +1,80 @@
+import struct
+import datetime
+
+import numpy as np
+import pytest
+
+import Ricezione_notifiche as rn
+import caratteristiche_bluest
+from salvataggio import SinkTesto, leggi_testo
+from sensor_fusion import EspansioneSensorFusion
+
+AGM, SENSOR_FUSION, PITCH_ROLL, BATTERIA = 0x11, 0x14, 0x17, 0x1a
+PACCHETTI = [
+	(AGM, struct.pack("<Hhhhhhhhhh", 100, 12, -34, 1000, 55, -66, 7, 430, -120, 15)),
+	(SENSOR_FUSION, struct.pack("<Hhhhhhhhhh", 101, 1000, -2000, 3000, 1100, -2100, 3100, 1200, -2200, 3200)),
+	(PITCH_ROLL, struct.pack("<Hhh", 102, 4096, -2048)),
+	(BATTERIA, struct.pack("<HHhhB", 103, 875, 3900, -120, 1)),
+]
+
+def _elabora(monkeypatch, stampa_notifiche, valori_grezzi=True):
+	#righe salvate da elabora_notifica per i pacchetti di prova
+	righe = {}
+	monkeypatch.setattr(rn, "salva_righe", lambda nome_flusso, r: righe.setdefault(nome_flusso, []).extend(r))
+	monkeypatch.setattr(rn, "handle_temp_press", None)
+	monkeypatch.setattr(rn, "handle_acc_gyr_magn", AGM)
+	monkeypatch.setattr(rn, "handle_sensor_fusion_compact", SENSOR_FUSION)
+	monkeypatch.setattr(rn, "handle_pitch_roll", PITCH_ROLL)
+	monkeypatch.setattr(rn, "caratteristiche_handle", {BATTERIA: caratteristiche_bluest.PER_NOME["batteria"]})
+	monkeypatch.setattr(rn, "espansione_sensor_fusion", EspansioneSensorFusion(), raising=False)
+	monkeypatch.setattr(rn, "valori_grezzi", valori_grezzi)
+	monkeypatch.setattr(rn, "stampa_notifiche", stampa_notifiche)
+	monkeypatch.setattr(rn, "stima_host", False)
+	delegato = rn.DefaultDelegate()
+	ora = datetime.datetime(2026, 1, 1, 12, 0, 0)
+	for cHandle, data in PACCHETTI:
+		delegato.elabora_notifica(cHandle, data, ora)
+	return righe
+
+def test_valori_grezzi_senza_stampa(monkeypatch, capsys):
+	silenziose = _elabora(monkeypatch, False)
+	assert capsys.readouterr().out == ""
+	stampate = _elabora(monkeypatch, True)
+	assert "Accx: 0.012 g" in capsys.readouterr().out
+	#senza stampa i pacchetti non sono convertiti, ma i flussi salvati sono gli stessi
+	assert silenziose.keys() == stampate.keys()
+	for nome_flusso in silenziose:
+		np.testing.assert_allclose(np.array(silenziose[nome_flusso], dtype=float), np.array(stampate[nome_flusso], dtype=float))
+	assert silenziose["accelerometro"][0][2:] == (12, -34, 1000)
+	assert silenziose["pitch_roll"][0][2:] == (4096, -2048)
+	assert silenziose["batteria"][0][2:] == (875, 3900, -120, 1)
+	#i quaternioni completi sono calcolati sull'host e restano in unità fisiche
+	assert silenziose["quaternioni"][0][3] == pytest.approx(0.1)
+
+def test_valori_convertiti(monkeypatch):
+	righe = _elabora(monkeypatch, False, valori_grezzi=False)
+	assert righe["accelerometro"][0][2:] == (0.012, -0.034, 1.0)
+	assert righe["batteria"][0][2:] == (87.5, 3.9, -120, 1)
+	grezze = _elabora(monkeypatch, False)
+	for nome_flusso in ("accelerometro", "giroscopio", "magnetometro", "sensor_fusion", "pitch_roll", "batteria"):
+		scale = caratteristiche_bluest.scale_flusso(nome_flusso)
+		convertite = caratteristiche_bluest.applica_scala([(r[0], 0.0) + r[2:] for r in grezze[nome_flusso]], scale)
+		np.testing.assert_allclose(convertite[:, 2:], np.array([r[2:] for r in righe[nome_flusso]]))
+
+def test_file_di_testo_con_scale(tmp_path):
+	#i valori interi con l'intestazione delle scale tornano in unità fisiche con leggi_testo
+	nome_file = str(tmp_path / "Accelerometro.txt")
+	sink = SinkTesto(nome_file, scale=caratteristiche_bluest.scale_flusso("accelerometro"))
+	sink.scrivi([(10, "120000.000001", 12, -34, 1000)])
+	sink.scrivi([(20, "120000.100001", -1, 0, 999)])
+	with open(nome_file, encoding="utf-8") as fp:
+		testo = fp.read()
+	#una sola intestazione, all'inizio del file
+	assert testo.count("% scala") == 3 and testo.startswith("%")
+	dati = leggi_testo(nome_file)
+	np.testing.assert_allclose(dati, [[10, 120000.000001, 0.012, -0.034, 1.0], [20, 120000.100001, -0.001, 0.0, 0.999]])
+
+def test_file_di_testo_senza_scale(tmp_path):
+	nome_file = str(tmp_path / "Accelerometro.txt")
+	SinkTesto(nome_file).scrivi([(10, "120000.000001", 0.012, -0.034, 1.0)])
+	np.testing.assert_allclose(leggi_testo(nome_file), [[10, 120000.000001, 0.012, -0.034, 1.0]])